@@ -4,27 +4,44 @@ gevent.monkey.patch_all()
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, render_template, request, redirect, url_for
-from flask_socketio import SocketIO, emit, join_room
+from flask import Flask, render_template, request, redirect, url_for, Response
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
 import random
+import hashlib
+import functools
 import string
-from database import init_db, save_game, load_game, delete_old_games
-import requests
+from database import init_db, load_leaderboard, load_player_stats, load_card_stats, load_pack_stats, LEADERBOARD_ORDER, CARD_ORDER
+from persistence import WriteBehindStore
+from sessions import SessionRegistry
+from rooms import create_room_store
+from maintenance import RoomReaper
+from timers import TimerWheel
+from cards import get_catalog
+from game import new_game, apply_event, start_error, submission_error, judge_error, HAND_SIZE, MIN_HAND_SIZE, MAX_HAND_SIZE
+from sync import build_delta, full_state, time_left
+from serialization import create_packet_class, PayloadCache, SERIALIZER
+from lobby import LobbyIndex, LOBBY_EVENTS, LOBBY_PAGE_SIZE
+from cloudflare import load_cloudflare_ips, refresh_cloudflare_ips, is_cloudflare
+from ratelimit import RateLimiter, OutboundLimiter
+from chat import ChatBatcher
+from assets import AssetPipeline, EncodedBody, PageShell
+from stats import StatsRecorder, ResultCache
+from czar import CzarService, create_provider
+from search import get_card_search, search_metrics, SEARCH_PAGE_SIZE
+from spectators import SpectatorFanout, spectator_room, SPECTATOR_CHAT, SPECTATOR_TICK, SPECTATOR_POLL_INTERVAL
+from metrics import registry, instrumented, profiler, PROFILER_ENABLED
+from logs import setup_logging, SOCKETIO_LOG
+import logging
 from werkzeug.middleware.proxy_fix import ProxyFix
 import os
+import time
+import atexit
 from dotenv import load_dotenv
 from datetime import datetime
 
-# Get Cloudflare IP ranges
-def get_cloudflare_ips():
-    try:
-        response = requests.get('https://api.cloudflare.com/client/v4/ips')
-        if response.status_code == 200:
-            return response.json()['result']['ipv4_cidrs'] + response.json()['result']['ipv6_cidrs']
-        return []
-    except:
-        return []
+setup_logging()
+log = logging.getLogger("app")
 
 # Load environment variables only in development
 if os.getenv('FLASK_ENV') != 'production':
@@ -38,8 +55,8 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['PROPAGATE_EXCEPTIONS'] = True
 app.config['JSON_SORT_KEYS'] = False
-# Add Cloudflare configuration
-app.config['CLOUDFLARE_IPS'] = get_cloudflare_ips()
+# Add Cloudflare configuration; cached ranges now, refreshed in the background
+app.config['CLOUDFLARE_IPS'] = load_cloudflare_ips()
 app.wsgi_app = ProxyFix(
     app.wsgi_app,
     x_for=1,      # X-Forwarded-For
@@ -55,320 +72,673 @@ socketio = SocketIO(
     ping_interval=25000,
     async_mode='eventlet',
     manage_session=False,
-    logger=True,
-    engineio_logger=True,
+    logger=SOCKETIO_LOG,
+    engineio_logger=SOCKETIO_LOG,
     message_queue=os.getenv('REDIS_URL', None),
     max_http_buffer_size=1000000,
     transports=['websocket'],
     websocket_ping_interval=25,
     websocket_ping_timeout=60,
-    always_connect=True
+    always_connect=True,
+    # JSON or msgpack packets that reuse payloads encoded once per room version
+    serializer=create_packet_class()
 )
+refresh_cloudflare_ips(app, socketio)
 
-# Initialize database and clean old games at startup
-with app.app_context():
-    init_db()
-    delete_old_games()
-
-# Load cards from JSON file
-def get_cards():
-    try:
-        with open("cah-all-full.json", "r", encoding="utf-8") as file:
-            data = json.load(file)
-        if not isinstance(data, list):
-            return {"error": "Invalid JSON format"}
-        return data
-    except FileNotFoundError:
-        return {"error": "cah-all-full.json file not found"}
-    except json.JSONDecodeError:
-        return {"error": "Failed to parse JSON data"}
-
-packs = get_cards()
+# Static files are fingerprinted, precompressed and served from memory;
+# templates link them through asset_url()
+assets = AssetPipeline().build()
+app.jinja_env.globals["asset_url"] = assets.url
 
-# Extract white and black cards
-def get_all_white_cards():
-    return [card["text"] for pack in packs if "white" in pack for card in pack["white"] if "text" in card]
+# Per-socket and per-address token buckets for incoming events, and a cap
+# on what a slow client can have queued before chat to it is dropped
+limiter = RateLimiter()
+outbound = OutboundLimiter(serializer=SERIALIZER)
+outbound.install(socketio.server.eio)
 
-def get_all_black_cards():
-    return [card["text"] for pack in packs if "black" in pack for card in pack["black"] if "text" in card]
+# Initialize database at startup; old games are purged by the room reaper
+with app.app_context():
+    init_db()
 
-# Store game rooms
-game_rooms = {}  # Format: {"ABC123": {"players": {}, "black_card": None, "submissions": {}, "card_czar": None, "round": 1, "state": "waiting", "disconnected_players": {}, "min_players": 3, "round_timer": None, "ready_players": set(), "player_hands": {}}}
+# Rooms are saved in batches by a background task instead of on every event
+persistence = WriteBehindStore()
+persistence.start(socketio)
+atexit.register(persistence.stop)
+
+# Load the card catalog once; game state only stores card IDs
+catalog = get_catalog()
+
+# Socket SID <-> (game_id, player) index
+sessions = SessionRegistry()
+
+# Round deadlines and reconnect grace windows for every room
+timers = TimerWheel()
+timers.start(socketio)
+
+# Seconds the card czar gets to pick a winner once all cards are in
+JUDGE_TIME_LIMIT = int(os.getenv('CAH_JUDGE_TIME_LIMIT', '60'))
+
+# Store game rooms, in this process or shared through Redis (CAH_ROOM_STORE).
+# Rooms that are not resident are loaded from the database on first use.
+# Format: {"ABC123": {"players": {}, "black_card": None, "submissions": {}, "card_czar": None, "round": 1, "state": "waiting", "disconnected_players": {}, "min_players": 3, "round_timer": None, "ready_players": [], "player_hands": {}}}
+game_rooms = create_room_store(loader=persistence.load_game)
+
+# Hibernates idle rooms and purges expired games in the background; the
+# first pass waits so it does not compete with startup
+reaper = RoomReaper(game_rooms, sessions, persistence)
+reaper.start(socketio)
+
+# Chat goes out to each room in batches and is saved in batches; recent
+# messages are replayed to players as they join
+chat = ChatBatcher()
+chat.start(socketio)
+atexit.register(chat.stop)
+
+# Cross-game player and card stats, added up as rounds and games end and
+# written in batches; the read endpoints share cached results
+stats = StatsRecorder(pack_of=lambda card_id: catalog.white_pack[card_id])
+stats.start(socketio)
+atexit.register(stats.stop)
+stats_cache = ResultCache()
+
+# Winners for rooms judged by the AI czar, picked off the request path
+czar = CzarService(create_provider(), catalog)
+czar.start(socketio)
+
+# Open rooms for the public lobby; changes go out to subscribers in batches
+lobby = LobbyIndex()
+lobby.start(socketio)
+
+# Gauges read when /metrics is scraped
+registry.gauge("cah_rooms_resident", "Rooms held in this worker's memory", lambda: sum(1 for _ in game_rooms.resident_ids()))
+registry.gauge("cah_sockets_connected", "Sockets bound to a game", lambda: len(sessions.by_sid))
+registry.gauge("cah_timers_pending", "Round and grace timers scheduled", lambda: len(timers))
+registry.gauge("cah_rooms_dirty", "Rooms waiting for a write-behind flush", lambda: len(persistence.dirty))
+registry.gauge("cah_lobby_rooms", "Rooms listed in the lobby", lambda: len(lobby.rooms))
+
+# Encoded full room state, shared by joins and resyncs at the same version
+payload_cache = PayloadCache()
+
+# What spectators are sent instead of deltas and chat batches: the cached
+# full state, the round clock, the audience size and the latest chat
+def spectator_digest(game_id):
+    room = game_rooms.get(game_id)
+    if room is None:
+        return None
+    state = payload_cache.get(game_id, room.event_seq, lambda: full_state(room))
+    return (state, time_left(room), {
+        "spectators": spectators.count(game_id),
+        "chat": chat.history(game_id).items()[-SPECTATOR_CHAT:],
+    })
+
+# Spectators watch from their own Socket.IO room and get one digest per
+# tick, so the cost of an event to the players does not grow with the audience
+spectators = SpectatorFanout(spectator_digest)
+spectators.start(socketio)
+atexit.register(spectators.stop)
+
+# Apply a game event to a room, queue it for persistence and send its
+# delta to everyone in the room. The room's event_seq is its version.
+def record_event(game_id, room, event_type, **payload):
+    playing = room.game_winner is None
+    if event_type == "round_judged":
+        # Needs the submissions, which the event clears
+        stats.round_judged(room, payload["winner"])
+    apply_event(room, event_type, payload)
+    if playing and room.game_winner is not None:
+        stats.game_over(room)
+    persistence.record(game_id, room, event_type, payload)
+    socketio.emit("room_delta", build_delta(room, event_type, payload), room=game_id)
+    spectators.touch(game_id)
+    if event_type in LOBBY_EVENTS:
+        lobby.update(game_id, room)
+    return payload
 
 # Generate a unique game ID
 def generate_game_id():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+# Pages only change with the templates, so each is rendered once. The game
+# page is cached with a slot for the game ID, the one per-request part.
+@functools.lru_cache(maxsize=1)
+def home_page():
+    return EncodedBody(render_template("home.html", msgpack=SERIALIZER == "msgpack").encode(), 'text/html; charset=utf-8')
+
+@functools.lru_cache(maxsize=1)
+def game_shell():
+    return PageShell(render_template("game.html", game_id=PageShell.SLOT, msgpack=SERIALIZER == "msgpack"))
+
 @app.route("/")
 def home():
-    return render_template("home.html")
+    return home_page().response(request)
+
+@app.route("/assets/<path:name>")
+def asset(name):
+    response = assets.response(name, request)
+    if response is None:
+        return "Not found", 404
+    return response
+
+# A pack selection must hold a black card and enough white cards for a
+# full hand for ten players
+MIN_WHITE_CARDS = HAND_SIZE * 10
+
+# Pack indexes picked on the home page; no selection plays with every pack
+def selected_packs(form):
+    if form.get("pack_preset") == "official":
+        return catalog.official_packs()
+    packs = form.getlist("packs")
+    if not packs:
+        return None
+    packs = {int(pack) for pack in packs}
+    if not all(0 <= pack < len(catalog.pack_names) for pack in packs):
+        raise ValueError("Unknown pack")
+    if not len(catalog.black_source(packs)) or len(catalog.white_source(packs)) < MIN_WHITE_CARDS:
+        raise ValueError(f"Selected packs need at least one black card and {MIN_WHITE_CARDS} white cards")
+    return packs
 
 @app.route("/create_game", methods=["POST"])
 def create_game():
+    try:
+        packs = selected_packs(request.form)
+    except ValueError as e:
+        return str(e), 400
+    try:
+        hand_size = min(MAX_HAND_SIZE, max(MIN_HAND_SIZE, int(request.form.get("hand_size", HAND_SIZE))))
+    except ValueError:
+        hand_size = HAND_SIZE
     game_id = generate_game_id()
-    game_data = {
-        "round": 1,
-        "black_card": None,
-        "players": {},
-        "submissions": {},
-        "card_czar": None,
-        "state": "waiting",
-        "disconnected_players": {},
-        "min_players": 3,
-        "round_timer": None,
-        "ready_players": [],  # Changed from set() to []
-        "player_hands": {},
-        "score_limit": 8,
-        "round_time_limit": 120,
-        "spectators": [],  # Changed from set() to []
-        "used_cards": [],  # Changed from set() to []
-        "game_winner": None,
-        "max_rounds": 10,  # Add max rounds limit
-    }
+    game_data = new_game(packs, hand_size, ai_czar=request.form.get("ai_czar") == "on")
     
-    game_rooms[game_id] = game_data
-    save_game(game_id, game_data)
+    game_rooms.put(game_id, game_data)
+    persistence.created(game_id, game_data)
     return redirect(url_for("game_room", game_id=game_id))
 
+# The catalog never changes while the process runs, so the listing is
+# built once and served with an ETag
+@functools.lru_cache(maxsize=1)
+def pack_listing():
+    white_ranges = catalog.white_ranges
+    black_ranges = catalog.black_ranges
+    packs = [
+        {
+            "id": pack,
+            "name": name,
+            "official": bool(catalog.pack_official[pack]),
+            "white": white_ranges[pack][1] - white_ranges[pack][0],
+            "black": black_ranges[pack][1] - black_ranges[pack][0],
+        }
+        for pack, name in enumerate(catalog.pack_names)
+    ]
+    body = json.dumps({"packs": packs}, separators=(",", ":"))
+    return body, hashlib.sha1(body.encode()).hexdigest()[:16]
+
+@app.route("/api/packs")
+def list_packs():
+    body, etag = pack_listing()
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
+
+def int_arg(name, default=None):
+    try:
+        return int(request.args[name])
+    except (KeyError, ValueError):
+        return default
+
+# Open games, oldest first. Filters: state, packs (all, official or custom),
+# min_players and max_players; offset and limit page through the results.
+@app.route("/api/lobby")
+def list_lobby():
+    return lobby.query(
+        state=request.args.get("state"),
+        packs=request.args.get("packs"),
+        min_players=int_arg("min_players"),
+        max_players=int_arg("max_players"),
+        offset=int_arg("offset", 0),
+        limit=int_arg("limit", LOBBY_PAGE_SIZE),
+    )
+
+# Stats results are shared through stats_cache and may be cached by
+# clients for as long
+def stats_response(key, build):
+    return cacheable(stats_cache.get(key, build))
+
+def cacheable(data):
+    response = app.json.response(data)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(stats_cache.ttl)
+    return response
+
+@app.route("/api/leaderboard")
+def leaderboard():
+    order = request.args.get("by", "wins")
+    if order not in LEADERBOARD_ORDER:
+        return {"error": f"by must be one of {', '.join(LEADERBOARD_ORDER)}"}, 400
+    limit = max(1, min(int_arg("limit", 20), 100))
+    offset = max(0, int_arg("offset", 0))
+    return stats_response(("leaderboard", order, limit, offset), lambda: {
+        "by": order,
+        "players": load_leaderboard(order, limit, offset),
+    })
+
+@app.route("/api/players/<name>/stats")
+def player_stats(name):
+    result = stats_cache.get(("player", name), lambda: load_player_stats(name))
+    if result is None:
+        return {"error": "No stats for this player"}, 404
+    return cacheable(result)
+
+# Most played, most winning or best win rate white cards, optionally in one pack
+@app.route("/api/stats/cards")
+def card_stats():
+    order = request.args.get("by", "played")
+    if order not in CARD_ORDER:
+        return {"error": f"by must be one of {', '.join(CARD_ORDER)}"}, 400
+    pack = int_arg("pack")
+    limit = max(1, min(int_arg("limit", 20), 100))
+    # Win rates over a handful of plays are noise
+    min_played = max(1, int_arg("min_played", 5 if order == "win_rate" else 1))
+
+    def build():
+        cards = load_card_stats(order, limit, pack, min_played)
+        for card in cards:
+            card["text"] = catalog.white(card["card_id"])
+        return {"by": order, "pack": pack, "cards": cards}
+    return stats_response(("cards", order, pack, limit, min_played), build)
+
+@app.route("/api/stats/packs")
+def pack_stats():
+    def build():
+        packs = load_pack_stats()
+        for pack in packs:
+            pack["name"] = catalog.pack_names[pack["pack"]]
+        return {"packs": packs}
+    return stats_response(("packs",), build)
+
+# Cards by words in their text; the last word also matches as a prefix.
+# Filters: color (white or black), pack (repeatable) and pick (black cards).
+# The index is built by the first search, not at startup, where its CPU-bound
+# build would hold up health checks and sockets.
+@app.route("/api/cards/search")
+def search_cards():
+    query = request.args.get("q", "")
+    color = request.args.get("color")
+    if color not in (None, "white", "black"):
+        return {"error": "color must be white or black"}, 400
+    try:
+        packs = [int(pack) for pack in request.args.getlist("pack")] or None
+    except ValueError:
+        return {"error": "pack must be a pack number"}, 400
+    if packs is not None and not all(0 <= pack < len(catalog.pack_names) for pack in packs):
+        return {"error": "Unknown pack"}, 400
+    result = get_card_search().search(query, color, packs, int_arg("pick"),
+                                      offset=int_arg("offset", 0), limit=int_arg("limit", SEARCH_PAGE_SIZE))
+    result["query"] = query
+    # The catalog never changes while the process runs
+    response = app.json.response(result)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response
+
 @app.route("/game/<game_id>")
 def game_room(game_id):
-    # Try to load game from database if not in memory
+    # Loads the game from the database if it is not in memory
     if game_id not in game_rooms:
-        game_data = load_game(game_id)
-        if game_data:
-            game_rooms[game_id] = game_data
-        else:
-            return "Game not found", 404
-    return render_template("game.html", game_id=game_id)
+        return "Game not found", 404
+    return game_shell().response(request, game_id)
+
+# Read-only room view for spectators turned away by the spectator limit.
+# Public and briefly cacheable, so a CDN can absorb the polling.
+@app.route("/api/games/<game_id>/spectate")
+def spectate(game_id):
+    room = game_rooms.get(game_id)
+    if room is None:
+        return {"error": "Game not found"}, 404
+    history = chat.history(game_id)
+    response = app.json.response({
+        "room": payload_cache.get(game_id, room.event_seq, lambda: full_state(room)).data,
+        "time_left": time_left(room),
+        "spectators": spectators.count(game_id),
+        "chat": history.items()[-SPECTATOR_CHAT:],
+    })
+    response.set_etag(f"{room.event_seq}-{history.next}")
+    response.cache_control.public = True
+    response.cache_control.max_age = max(1, int(SPECTATOR_TICK))
+    return response.make_conditional(request)
 
 @app.route("/health")
 def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}, 200
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "persistence": persistence.metrics(),
+        "sessions": sessions.metrics(),
+        "rooms": reaper.metrics(),
+        "timers": timers.metrics(),
+        "payload_cache": payload_cache.metrics(),
+        "lobby": lobby.metrics(),
+        "rate_limits": limiter.metrics(),
+        "outbound": outbound.metrics(),
+        "chat": chat.metrics(),
+        "stats": stats.metrics(),
+        "stats_cache": stats_cache.metrics(),
+        "assets": assets.metrics(),
+        "czar": czar.metrics(),
+        "search": search_metrics(),
+        "spectators": spectators.metrics()
+    }, 200
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+# Opt-in (CAH_PROFILER=1): POST ?action=start or ?action=stop, GET for the
+# folded stacks collected so far
+@app.route("/metrics/profile", methods=["GET", "POST"])
+def profile_endpoint():
+    if not PROFILER_ENABLED:
+        return "Not found", 404
+    if request.method == "POST":
+        action = request.args.get("action")
+        if action == "start":
+            profiler.start()
+        elif action == "stop":
+            profiler.stop()
+        else:
+            return "action must be start or stop", 400
+    return Response(profiler.report(), mimetype="text/plain")
 
 @socketio.on_error()
 def error_handler(e):
-    print('An error has occurred:', e)
+    log.error('An error has occurred: %s', e)
     emit('error', {'message': 'An error occurred'})
 
 @socketio.on_error_default
 def default_error_handler(e):
-    print('An error has occurred:', e)
+    log.error('An error has occurred: %s', e)
     emit('error', {'message': 'An error occurred'})
 
+# Client address for rate limiting. CF-Connecting-IP is only believed when
+# the request really came through Cloudflare, otherwise anyone could set it.
+def get_real_ip():
+    address = request.remote_addr
+    forwarded = request.headers.get('CF-Connecting-IP')
+    if forwarded and is_cloudflare(address, app.config['CLOUDFLARE_IPS']):
+        return forwarded
+    return address
+
+# Move a player out of the game once their reconnect grace window has passed
+def remove_player(game_id, player_name):
+    with game_rooms.transaction(game_id) as room:
+        if room is not None and player_name in room.players:
+            # Store player's score before removing
+            record_event(game_id, room, "player_left", player=player_name)
+            log.info('Player left after disconnecting', extra={"fields": {"game_id": game_id, "player": player_name}})
+
+# Send the full room state to the current socket
+def emit_room_state(game_id, room):
+    state = payload_cache.get(game_id, room.event_seq, lambda: full_state(room))
+    emit("room_state", (state, time_left(room)))
+
+def end_grace(game_id, player_name):
+    if sessions.end_grace(game_id, player_name):
+        remove_player(game_id, player_name)
+
+# Start a round: new black card, next czar and a submission deadline
+def begin_round(game_id, room):
+    available_players = list(room.players.keys())
+    if room.card_czar in available_players:
+        available_players.remove(room.card_czar)
+    card_czar = random.choice(available_players) if available_players and not room.ai_czar else None
+
+    time_limit = room.round_time_limit
+    record_event(game_id, room, "round_started", card_czar=card_czar, deadline=time.time() + time_limit)
+    timers.schedule(("round", game_id), time_limit, on_round_deadline, game_id, room.round, "submitting")
+
+def begin_judging(game_id, room):
+    record_event(game_id, room, "judging_started", deadline=time.time() + JUDGE_TIME_LIMIT, time_limit=JUDGE_TIME_LIMIT)
+    timers.schedule(("round", game_id), JUDGE_TIME_LIMIT, on_round_deadline, game_id, room.round, "judging")
+    if room.ai_czar:
+        request_judgement(game_id, room)
+
+# Ask the AI czar for a winner. The room is not held while it thinks; the
+# answer is applied if the round is still being judged, and the judge timer
+# still ends the round if no answer comes.
+def request_judgement(game_id, room):
+    players = {
+        tuple(cards): player for player, cards in room.submissions.items()
+        if player in room.players and not isinstance(cards, str)
+    }
+    if not players:
+        return
+    round_number = room.round
+
+    def judged(cards, source):
+        with game_rooms.transaction(game_id) as room:
+            if room is None or room.phase != "judging" or room.round != round_number:
+                return
+            winner = players[cards]
+            if winner in room.players and winner in room.submissions:
+                log.debug("AI czar picked %s in %s (%s)", winner, game_id, source)
+                finish_round(game_id, room, winner)
+    czar.judge(room.black_card_id, list(players), judged)
+
+def skip_round(game_id, room, reason):
+    waiting = len(room.players) < room.min_players
+    record_event(game_id, room, "round_skipped", reason=reason, waiting=waiting)
+    if not waiting:
+        begin_round(game_id, room)
+
+def finish_round(game_id, room, winner):
+    timers.cancel(("round", game_id))
+
+    # Update scores and round number; sets game_winner after the last round.
+    # Clients get the winner, winning cards, new score and round in the delta.
+    winning_cards = room.submissions[winner]
+    if not isinstance(winning_cards, str):
+        winning_cards = winning_cards.tolist()  # card IDs go into the event log as a JSON list
+    record_event(game_id, room, "round_judged", winner=winner, winning_cards=winning_cards)
+
+# Runs from the timer wheel when the current phase of a round runs out:
+# submissions move on to judging (or the round is skipped if nobody played),
+# and an undecided czar gets a random winner picked for them.
+# Timers are per worker, so one may outlive the phase it was set for when
+# another worker moved the room on; it only acts on the same round and
+# phase, once the room's own deadline has passed.
+def on_round_deadline(game_id, round_number, phase):
+    with game_rooms.transaction(game_id) as room:
+        if room is None or room.state != "in_progress":
+            return
+        if room.round != round_number or room.phase != phase or room.round_timer is None:
+            return
+        remaining = room.round_timer - time.time()
+        if remaining > 0:
+            # The phase was restarted with a later deadline
+            timers.schedule(("round", game_id), remaining, on_round_deadline, game_id, round_number, phase)
+            return
+
+        submissions = [player for player in room.submissions if player in room.players]
+        if room.phase == "submitting":
+            if submissions:
+                begin_judging(game_id, room)
+            else:
+                skip_round(game_id, room, "No cards were submitted in time")
+        elif room.phase == "judging":
+            if submissions:
+                finish_round(game_id, room, random.choice(submissions))
+            else:
+                skip_round(game_id, room, "The card czar left")
+
+# The client's address is looked up once; rate limits use it per event
+@socketio.on('connect')
+def handle_connect(auth=None):
+    limiter.bind(request.sid, get_real_ip())
+
 @socketio.on('disconnect')
+@instrumented("disconnect")
 def handle_disconnect(*args):
     sid = request.sid
-    print('Client disconnected:', sid)
+    log.debug('Client disconnected: %s', sid)
+    limiter.forget(sid)
+    spectators.leave(sid)
     
-    # Find and remove disconnected player
-    for game_id in game_rooms:
-        for player_name in list(game_rooms[game_id]["players"].keys()):
-            if getattr(request, 'sid_' + player_name, None) == sid:
-                # Store player's score before removing
-                game_rooms[game_id]["disconnected_players"][player_name] = game_rooms[game_id]["players"][player_name]
-                del game_rooms[game_id]["players"][player_name]
-                print(f'Player {player_name} disconnected from game {game_id}')
-                
-                # Notify other players
-                emit("update_players", {
-                    "players": game_rooms[game_id]["players"],
-                    "min_players": game_rooms[game_id]["min_players"],
-                    "state": game_rooms[game_id]["state"],
-                    "disconnected": list(game_rooms[game_id]["disconnected_players"].keys())
-                }, room=game_id)
-                return
+    entry = sessions.unbind(sid)
+    if entry is not None and not entry[2]:
+        if sessions.grace > 0:
+            timers.schedule(("grace", entry[0], entry[1]), sessions.grace, end_grace, entry[0], entry[1])
+        else:
+            remove_player(entry[0], entry[1])
 
 # Update existing socket handlers with error handling
 @socketio.on("join_game")
+@instrumented("join_game")
+@limiter.limit("join_game")
 def handle_join_game(data):
     try:
         game_id = data["game_id"]
         player_name = data["player_name"]
         
-        if game_id in game_rooms:
-            # Store socket ID for this player
-            setattr(request, 'sid_' + player_name, request.sid)
+        with game_rooms.transaction(game_id) as room:
+            if room is None:
+                emit("error", {"message": "Game not found"})
+                return
+
+            # A spectator taking a seat stops getting the digests
+            watched = spectators.leave(request.sid)
+            if watched is not None:
+                leave_room(spectator_room(watched))
+
+            # Store socket ID for this player; a reconnect keeps their seat
+            if sessions.bind(request.sid, game_id, player_name):
+                timers.cancel(("grace", game_id, player_name))
             
-            # Check if player was previously disconnected
-            if player_name in game_rooms[game_id]["disconnected_players"]:
-                game_rooms[game_id]["players"][player_name] = game_rooms[game_id]["disconnected_players"][player_name]
-                del game_rooms[game_id]["disconnected_players"][player_name]
-            elif player_name not in game_rooms[game_id]["players"]:
-                game_rooms[game_id]["players"][player_name] = 0
+            # Restores the score of a previously disconnected player
+            record_event(game_id, room, "player_joined", player=player_name)
             
             join_room(game_id)
-            emit("update_players", {
-                "players": game_rooms[game_id]["players"],
-                "min_players": game_rooms[game_id]["min_players"],
-                "state": game_rooms[game_id]["state"]
-            }, room=game_id)
-            
-            # Send current game state if game is in progress
-            if game_rooms[game_id]["state"] != "waiting":
-                emit("game_state", {
-                    "black_card": game_rooms[game_id]["black_card"],
-                    "card_czar": game_rooms[game_id]["card_czar"],
-                    "round": game_rooms[game_id]["round"],
-                    "submitted_players": list(game_rooms[game_id]["submissions"].keys())
-                })
-            
-            # Save game state after player joins
-            save_game(game_id, game_rooms[game_id])
-            
-        else:
-            emit("error", {"message": "Game not found"})
+            # Everyone else got the player_joined delta; the new player
+            # starts from the full state and the recent chat
+            emit_room_state(game_id, room)
+            emit("chat_history", chat.history(game_id).items())
     except Exception as e:
-        print('Error in join_game:', e)
+        log.error('Error in join_game: %s', e)
         emit("error", {"message": "Failed to join game"})
 
 @socketio.on("start_round")
+@instrumented("start_round")
+@limiter.limit("start_round")
 def handle_start_round(data):
     game_id = data["game_id"]
-    if game_id in game_rooms:
-        if len(game_rooms[game_id]["players"]) < game_rooms[game_id]["min_players"]:
-            emit("error", {
-                "message": f"Need at least {game_rooms[game_id]['min_players']} players to start"
-            }, room=game_id)
-            return
-            
-        # Check if all players are ready
-        all_ready = len(game_rooms[game_id]["ready_players"]) == len(game_rooms[game_id]["players"])
-        if not all_ready:
-            emit("error", {
-                "message": "All players must be ready to start"
-            }, room=game_id)
+    with game_rooms.transaction(game_id) as room:
+        if room is None:
             return
 
-        game_rooms[game_id]["state"] = "in_progress"
-        game_rooms[game_id]["black_card"] = random.choice(get_all_black_cards())
-        game_rooms[game_id]["submissions"] = {}
+        error = start_error(room)
+        if error:
+            emit("error", {"message": error}, room=game_id)
+            return
 
-        available_players = list(game_rooms[game_id]["players"].keys())
-        if game_rooms[game_id]["card_czar"] in available_players:
-            available_players.remove(game_rooms[game_id]["card_czar"])
-        if available_players:
-            game_rooms[game_id]["card_czar"] = random.choice(available_players)
+        begin_round(game_id, room)
 
-        emit("new_round", {
-            "black_card": game_rooms[game_id]["black_card"],
-            "card_czar": game_rooms[game_id]["card_czar"],
-            "game_started": True
-        }, room=game_id)
+# Send white cards to the current socket only: the whole hand (replace) or
+# just the cards drawn to refill it
+def emit_cards(card_ids, replace):
+    emit("white_card_choices", {
+        "white_cards": [{"id": card_id, "text": catalog.white(card_id)} for card_id in card_ids],
+        "replace": replace
+    }, room=request.sid)
 
+# Fill up the player's hand if needed and send all of it (on join and reconnect)
 @socketio.on("draw_white_cards")
+@instrumented("draw_white_cards")
+@limiter.limit("draw_white_cards")
 def handle_draw_white_cards(data):
     game_id = data["game_id"]
     player_name = data.get("player_name")
-    card_czar = data.get("card_czar")
-
-    if player_name == card_czar:
-        return
     
-    if game_id in game_rooms:
-        # Initialize player_hands if not exists
-        if "player_hands" not in game_rooms[game_id]:
-            game_rooms[game_id]["player_hands"] = {}
-        
-        # Initialize used_cards if not exists
-        if "used_cards" not in game_rooms[game_id]:
-            game_rooms[game_id]["used_cards"] = []
-            
-        all_white_cards = get_all_white_cards()
-        available_cards = [card for card in all_white_cards if card not in game_rooms[game_id]["used_cards"]]
-        
-        # If we're running low on cards, reset the used cards
-        if len(available_cards) < 5:
-            game_rooms[game_id]["used_cards"].clear()
-            available_cards = all_white_cards
-            
-        # Draw 5 unique cards for the player
-        if player_name != card_czar:
-            new_cards = random.sample(available_cards, 5)
-            game_rooms[game_id]["player_hands"][player_name] = new_cards
-            game_rooms[game_id]["used_cards"].extend([card for card in new_cards 
-                                                    if card not in game_rooms[game_id]["used_cards"]])
-        
-        # Only send cards to the requesting player
-        emit("white_card_choices", {
-            "white_cards": new_cards
-        }, room=request.sid)
+    with game_rooms.transaction(game_id) as room:
+        if room is None or player_name not in room.players:
+            return
+
+        hand = room.player_hands.get(player_name, ())
+        if len(hand) < room.hand_size:
+            record_event(game_id, room, "cards_drawn", player=player_name, refill=True)
+        emit_cards(room.player_hands[player_name], True)
 
 @socketio.on("submit_card")
+@instrumented("submit_card")
+@limiter.limit("submit_card")
 def handle_submit_card(data):
     try:
         game_id = data["game_id"]
         player_name = data["player_name"]
-        selected_card = data["white_card"]
+        selected_cards = data["white_cards"]
 
-        if game_id in game_rooms and player_name in game_rooms[game_id]["players"]:
-            # Store the submission
-            game_rooms[game_id]["submissions"][player_name] = selected_card
-            
-            # Broadcast submissions to all players (card czar will filter on client side)
-            emit("update_submissions", {
-                "submissions": game_rooms[game_id]["submissions"],
-                "card_czar": game_rooms[game_id]["card_czar"]
-            }, room=game_id)
+        with game_rooms.transaction(game_id) as room:
+            if room is None:
+                return
+
+            error = submission_error(room, player_name, selected_cards)
+            if error:
+                emit("error", {"message": error})
+                if player_name in room.player_hands:
+                    emit_cards(room.player_hands[player_name], True)
+                return
+
+            # Store the submission; only the new cards are broadcast
+            # (card czar will filter on client side)
+            record_event(game_id, room, "card_submitted", player=player_name, cards=selected_cards)
+            # Replace just the cards that were played
+            new_cards = record_event(game_id, room, "cards_drawn", player=player_name, refill=True)["cards"]
+            emit_cards(new_cards, False)
             
-            print(f"Submission received from {player_name}: {selected_card}")
-            print(f"Current submissions: {game_rooms[game_id]['submissions']}")
+            log.debug("Submission received from %s in %s", player_name, game_id)
+
+            # Everyone except the czar has played; the czar's clock starts now
+            if room.phase == "submitting" and all(
+                player in room.submissions for player in room.players if player != room.card_czar
+            ):
+                begin_judging(game_id, room)
     except Exception as e:
-        print(f"Error in submit_card: {str(e)}")
+        log.error("Error in submit_card: %s", e)
         emit("error", {"message": "Failed to submit card"})
 
 @socketio.on("judge_round")
+@instrumented("judge_round")
+@limiter.limit("judge_round")
 def handle_judge_round(data):
     try:
         game_id = data.get("game_id")
         winner = data.get("winner")
-        winning_card = data.get("winning_card")
 
-        if not all([game_id, winner, winning_card]):
+        if not all([game_id, winner]):
             raise ValueError("Missing required data for judging round")
 
-        if game_id not in game_rooms:
-            raise ValueError("Game not found")
-
-        # Update game state
-        game_rooms[game_id]["players"][winner] += 1
-        game_rooms[game_id]["round"] += 1  # Increment round number
-        game_rooms[game_id]["submissions"] = {}
-
-        # Check if we've reached max rounds
-        if game_rooms[game_id]["round"] > game_rooms[game_id]["max_rounds"]:
-            # Find the winner
-            winner = max(game_rooms[game_id]["players"].items(), key=lambda x: x[1])[0]
-            game_rooms[game_id]["game_winner"] = winner
-            emit("game_over", {
-                "winner": winner,
-                "final_scores": game_rooms[game_id]["players"],
-                "reason": "Maximum rounds reached"
-            }, room=game_id)
-            return
+        with game_rooms.transaction(game_id) as room:
+            if room is None:
+                raise ValueError("Game not found")
+
+            # The judge is whoever is bound to this socket, not a name the
+            # client sends
+            entry = sessions.lookup(request.sid)
+            judge = entry[1] if entry is not None and entry[0] == game_id and not entry[2] else None
+            error = judge_error(room, judge, winner)
+            if error:
+                emit("error", {"message": error})
+                return
 
-        # Emit round winner with updated round number
-        emit("round_winner", {
-            "winner": winner,
-            "winning_card": winning_card,
-            "score": game_rooms[game_id]["players"][winner],
-            "round": game_rooms[game_id]["round"]  # Include round number
-        }, room=game_id)
-
-        # Update all players with new game state
-        emit("update_game_state", {
-            "players": game_rooms[game_id]["players"],
-            "round": game_rooms[game_id]["round"],
-            "state": game_rooms[game_id]["state"]
-        }, room=game_id)
-        
-        # Save game state after round ends
-        save_game(game_id, game_rooms[game_id])
+            finish_round(game_id, room, winner)
 
     except Exception as e:
-        print(f"Error in judge_round: {str(e)}")
+        log.error("Error in judge_round: %s", e)
         emit("error", {"message": f"Failed to judge round: {str(e)}"}, room=game_id)
 
 @socketio.on("chat_message")
+@instrumented("chat_message")
+@limiter.limit("chat_message")
 def handle_chat_message(data):
     try:
         game_id = data.get("game_id")
@@ -379,74 +749,105 @@ def handle_chat_message(data):
             raise ValueError("Missing required chat data")
 
         if game_id in game_rooms:
-            emit("chat_message", {
-                "player": player,
-                "message": message
-            }, room=game_id)
+            chat.add(game_id, player, message)
+            spectators.touch(game_id)
     except Exception as e:
-        print(f"Error in chat_message: {str(e)}")
+        log.error("Error in chat_message: %s", e)
         emit("error", {"message": "Failed to send chat message"})
 
 @socketio.on("player_ready")
+@instrumented("player_ready")
+@limiter.limit("player_ready")
 def handle_player_ready(data):
     try:
         game_id = data["game_id"]
         player_name = data["player_name"]
         is_ready = data.get("is_ready", True)
         
-        if game_id in game_rooms:
-            ready_players = game_rooms[game_id]["ready_players"]
-            if isinstance(ready_players, set):
-                ready_players = list(ready_players)
-                
-            if is_ready and player_name not in ready_players:
-                ready_players.append(player_name)
-            elif not is_ready and player_name in ready_players:
-                ready_players.remove(player_name)
-                
-            game_rooms[game_id]["ready_players"] = ready_players
-            
-            all_ready = len(ready_players) == len(game_rooms[game_id]["players"])
+        with game_rooms.transaction(game_id) as room:
+            if room is None:
+                return
             
-            emit("update_ready_players", {
-                "ready_players": ready_players,
-                "all_ready": all_ready
-            }, room=game_id)
+            record_event(game_id, room, "player_ready", player=player_name, is_ready=is_ready)
 
     except Exception as e:
-        print(f"Error in player_ready: {str(e)}")
+        log.error("Error in player_ready: %s", e)
         emit("error", {"message": "Failed to set player ready status"})
 
 @socketio.on("status_message")
+@instrumented("status_message")
+@limiter.limit("status_message")
 def handle_status_message(data):
     try:
         game_id = data["game_id"]
         message = data["message"]
         emit("status_message", {"message": message}, room=game_id)
     except Exception as e:
-        print(f"Error in status_message: {str(e)}")
+        log.error("Error in status_message: %s", e)
 
 @socketio.on("check_game_end")
+@instrumented("check_game_end")
 def check_game_end(game_id):
-    if game_id in game_rooms:
-        for player, score in game_rooms[game_id]["players"].items():
-            if score >= game_rooms[game_id]["score_limit"]:
-                game_rooms[game_id]["game_winner"] = player
-                emit("game_over", {
-                    "winner": player,
-                    "final_scores": game_rooms[game_id]["players"]
-                }, room=game_id)
+    with game_rooms.transaction(game_id) as room:
+        if room is None:
+            return False
+
+        if room.game_winner is not None:
+            return True
+        for player, score in room.players.items():
+            if score >= room.score_limit:
+                record_event(game_id, room, "game_over", winner=player)
                 return True
     return False
 
 @socketio.on("join_as_spectator")
+@instrumented("join_as_spectator")
+@limiter.limit("join_as_spectator")
 def handle_spectator(data):
     game_id = data["game_id"]
     spectator_name = data["spectator_name"]
-    if game_id in game_rooms:
-        game_rooms[game_id]["spectators"].add(spectator_name)
-        join_room(game_id)
-        emit("spectator_joined", {"name": spectator_name}, room=game_id)
+    room = game_rooms.get(game_id)
+    if room is None:
+        emit("error", {"message": "Game not found"})
+        return
+
+    if not spectators.join(game_id, request.sid):
+        # Room is full; watch through the polling endpoint instead
+        emit("spectator_overflow", {
+            "poll": url_for("spectate", game_id=game_id),
+            "interval": SPECTATOR_POLL_INTERVAL,
+        })
+        return
+    # Spectators are not recorded as room events: with a large audience the
+    # joins alone would keep the players busy
+    sessions.bind(request.sid, game_id, spectator_name, spectator=True)
+    join_room(spectator_room(game_id))
+    emit("spectator_state", spectator_digest(game_id))
+
+# Clients that see a gap in room_delta versions ask for the full state again
+@socketio.on("request_resync")
+@instrumented("request_resync")
+@limiter.limit("request_resync")
+def handle_request_resync(data):
+    game_id = data.get("game_id")
+    room = game_rooms.get(game_id)
+    if room is not None:
+        emit_room_state(game_id, room)
+
+# Lobby viewers get one page of open games and then the lobby_delta
+# batches; a viewer that misses a version asks for a new page
+@socketio.on("subscribe_lobby")
+@instrumented("subscribe_lobby")
+@limiter.limit("subscribe_lobby")
+def handle_subscribe_lobby(data=None):
+    data = data or {}
+    join_room("lobby")
+    emit("lobby_state", lobby.query(state=data.get("state"), packs=data.get("packs"), limit=int(data.get("limit", LOBBY_PAGE_SIZE))))
+
+@socketio.on("unsubscribe_lobby")
+@instrumented("unsubscribe_lobby")
+def handle_unsubscribe_lobby(data=None):
+    leave_room("lobby")
 
 # Add security headers middleware
 @app.after_request
@@ -457,12 +858,6 @@ def add_security_headers(response):
     response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
     return response
 
-# Rate limiting for specific endpoints
-def get_real_ip():
-    if request.headers.get('CF-Connecting-IP'):
-        return request.headers.get('CF-Connecting-IP')
-    return request.remote_addr
-
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 5000))
     socketio.run(app, 
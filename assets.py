@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+
+from flask import Response
+from markupsafe import escape
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# URL prefix of fingerprinted assets
+ASSET_PREFIX = '/assets/'
+# Fingerprinted names change with the content, so browsers keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Preferred first; identity is always available
+ENCODINGS = ('br', 'gzip')
+
+
+# Compressed copies of body, leaving out any that would not be smaller.
+# Brotli is used when the brotli package is installed.
+def encode_variants(body):
+    variants = {'identity': body}
+    compressed = {'gzip': gzip.compress(body, 9, mtime=0)}
+    try:
+        import brotli
+        compressed['br'] = brotli.compress(body, quality=11)
+    except ImportError:
+        pass
+    for encoding, data in compressed.items():
+        if len(data) < len(body):
+            variants[encoding] = data
+    return variants
+
+
+class EncodedBody:
+    # A response body that never changes while the process runs, kept in
+    # every encoding the client may ask for
+
+    __slots__ = ("content_type", "digest", "variants")
+
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = encode_variants(body)
+
+    def encoding_for(self, request):
+        for encoding in ENCODINGS:
+            if encoding in self.variants and request.accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+    # max_age=None: clients must revalidate, which the ETag makes a 304
+    def response(self, request, max_age=None):
+        encoding = self.encoding_for(request)
+        response = Response(self.variants[encoding], content_type=self.content_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(f"{self.digest}-{encoding}")
+        if max_age is None:
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+
+class AssetPipeline:
+    # Everything under static/ read once at startup, named after a hash of
+    # its content (styles.css -> styles.1a2b3c4d5e6f.css) and served from
+    # memory. Templates link assets through url(), so a changed file gets a
+    # new URL and nothing stale is ever served from a browser cache.
+
+    def __init__(self, directory=STATIC_DIR, prefix=ASSET_PREFIX):
+        self.directory = directory
+        self.prefix = prefix
+        self.urls = {}    # static path -> fingerprinted path
+        self.assets = {}  # fingerprinted path -> EncodedBody
+        self.served = 0
+        self.not_modified = 0
+
+    def build(self):
+        urls = {}
+        assets = {}
+        for root, dirs, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, '/')
+                with open(os.path.join(root, filename), 'rb') as f:
+                    body = f.read()
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                asset = EncodedBody(body, content_type)
+                stem, ext = os.path.splitext(path)
+                fingerprinted = f"{stem}.{asset.digest}{ext}"
+                urls[path] = fingerprinted
+                assets[fingerprinted] = asset
+        self.urls = urls
+        self.assets = assets
+        return self
+
+    # For templates: {{ asset_url('styles.css') }}
+    def url(self, path):
+        fingerprinted = self.urls.get(path)
+        if fingerprinted is None:
+            return f"/static/{path}"
+        return self.prefix + fingerprinted
+
+    def response(self, path, request):
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+        response = asset.response(request, ASSET_MAX_AGE)
+        self.served += 1
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    # Fingerprinted and precompressed copies for a CDN or nginx to serve
+    # (gzip_static / brotli_static) instead of the app
+    def write(self, out_dir):
+        for fingerprinted, asset in self.assets.items():
+            target = os.path.join(out_dir, fingerprinted)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for encoding, data in asset.variants.items():
+                suffix = {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+                with open(target + suffix, 'wb') as f:
+                    f.write(data)
+        return len(self.assets)
+
+    def metrics(self):
+        return {
+            "assets": len(self.assets),
+            "bytes": sum(len(asset.variants['identity']) for asset in self.assets.values()),
+            "served": self.served,
+            "not_modified": self.not_modified,
+        }
+
+
+class PageShell:
+    # A page rendered once with a placeholder where the per-request value
+    # goes; each request only escapes that value and joins the cached bytes
+
+    SLOT = "__CAH_SLOT__"
+
+    __slots__ = ("parts", "digest")
+
+    def __init__(self, html):
+        self.parts = [part.encode() for part in html.split(self.SLOT)]
+        self.digest = hashlib.sha256(html.encode()).hexdigest()[:12]
+
+    def render(self, value):
+        return str(escape(value)).encode().join(self.parts)
+
+    def response(self, request, value):
+        response = Response(self.render(value), content_type='text/html; charset=utf-8')
+        response.set_etag(f"{self.digest}-{value}")
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+if __name__ == "__main__":
+    # python assets.py build <out_dir>
+    if len(sys.argv) != 3 or sys.argv[1] != "build":
+        sys.exit("usage: python assets.py build <out_dir>")
+    count = AssetPipeline().build().write(sys.argv[2])
+    print(f"{count} assets written to {sys.argv[2]}")
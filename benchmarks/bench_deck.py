@@ -0,0 +1,77 @@
+# Micro-benchmark: white card draw latency per round.
+#
+# Compares the old approach (filter the full card list against a growing
+# used_cards list on every draw) with the Deck engine, for a room of 8
+# players drawing a 5-card hand every round.
+#
+#   python benchmarks/bench_deck.py [rounds]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cards import get_catalog
+from deck import Deck
+
+PLAYERS = 8
+HAND_SIZE = 5
+LEGACY_ROUNDS = 5
+
+
+def bench_legacy(all_cards, rounds):
+    used_cards = []
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(PLAYERS):
+            available_cards = [card for card in all_cards if card not in used_cards]
+            if len(available_cards) < HAND_SIZE:
+                used_cards.clear()
+                available_cards = all_cards
+            new_cards = random.sample(available_cards, HAND_SIZE)
+            used_cards.extend(new_cards)
+        timings.append((time.perf_counter() - start) / PLAYERS)
+    return timings
+
+
+def bench_deck(card_count, rounds):
+    deck = Deck(range(card_count))
+    hands = [[] for _ in range(PLAYERS)]
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for player in range(PLAYERS):
+            deck.discard_cards(hands[player])
+            hands[player] = deck.draw(HAND_SIZE)
+        timings.append((time.perf_counter() - start) / PLAYERS)
+    return timings
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    catalog = get_catalog()
+
+    legacy = bench_legacy(catalog.white_text, LEGACY_ROUNDS)
+    # Include the one-off shuffle in round 1, as a fresh game would
+    deck = bench_deck(catalog.white_count, rounds)
+
+    print(f"{catalog.white_count} white cards, {PLAYERS} players, {HAND_SIZE} cards per draw")
+    print(f"{'round':>6} {'legacy us/draw':>16} {'deck us/draw':>14}")
+    checkpoints = sorted({1, 2, LEGACY_ROUNDS, 10, 25, 50, 100, rounds // 2, rounds})
+    for round_number in checkpoints:
+        if round_number > rounds:
+            continue
+        legacy_us = f"{legacy[round_number - 1] * 1e6:.1f}" if round_number <= LEGACY_ROUNDS else "-"
+        print(f"{round_number:>6} {legacy_us:>16} {deck[round_number - 1] * 1e6:>14.2f}")
+
+    steady = sorted(deck[1:])
+    print(f"deck steady state: median {steady[len(steady) // 2] * 1e6:.2f} us, "
+          f"p99 {steady[int(len(steady) * 0.99)] * 1e6:.2f} us per draw over {rounds} rounds")
+    print(f"serialized deck size: {len(str(Deck(range(catalog.white_count)).to_dict()))} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Resident room memory: the old free-form dict layout against GameRoom.
+#
+# Plays rooms up to the judging phase of their first round (hands dealt,
+# everyone but the czar has played), then copies the same state into both
+# layouts and measures each copy with tracemalloc. The dict layout is the one
+# new_game built before GameRoom: card IDs as lists of ints and the black
+# card text kept in the room. Both layouts hold the same Deck objects and
+# player name strings, so those are left out of the layout figures and the
+# deck arrays are added to both totals.
+#
+#   python benchmarks/bench_room_memory.py [rooms] [players_per_room]
+
+import gc
+import os
+import sys
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cards import get_catalog
+from game import new_game, apply_event
+from model import GameRoom
+
+
+def play_first_round(players):
+    room = new_game()
+    names = [f"player{i}" for i in range(players)]
+    for name in names:
+        apply_event(room, "player_joined", {"player": name})
+        apply_event(room, "cards_drawn", {"player": name, "refill": True})
+        apply_event(room, "player_ready", {"player": name, "is_ready": True})
+    apply_event(room, "round_started", {"card_czar": names[0], "deadline": 0.0})
+    pick = get_catalog().pick(room.black_card_id)
+    for name in names[1:]:
+        apply_event(room, "card_submitted", {"player": name, "cards": room.player_hands[name][:pick].tolist()})
+        apply_event(room, "cards_drawn", {"player": name, "refill": True})
+    apply_event(room, "judging_started", {"deadline": 0.0})
+    return room
+
+
+# The same state as the dict new_game returned before GameRoom
+def dict_layout(room):
+    return {
+        "round": room.round,
+        "black_card": room.black_card,
+        "black_card_id": room.black_card_id,
+        "players": dict(room.players),
+        "submissions": {name: cards.tolist() for name, cards in room.submissions.items()},
+        "card_czar": room.card_czar,
+        "state": room.state,
+        "disconnected_players": dict(room.disconnected_players),
+        "min_players": room.min_players,
+        "round_timer": room.round_timer,
+        "phase": room.phase,
+        "ready_players": list(room.ready_players),
+        "player_hands": {name: hand.tolist() for name, hand in room.player_hands.items()},
+        "hand_size": room.hand_size,
+        "score_limit": room.score_limit,
+        "round_time_limit": room.round_time_limit,
+        "spectators": list(room.spectators),
+        "packs": room.packs,
+        "white_deck": room.white_deck,
+        "black_deck": room.black_deck,
+        "game_winner": room.game_winner,
+        "max_rounds": room.max_rounds,
+        "event_seq": room.event_seq,
+    }
+
+
+def model_layout(room):
+    copy = GameRoom(room.white_deck, room.black_deck, room.packs, room.hand_size)
+    for field in GameRoom.__slots__:
+        value = getattr(room, field)
+        if isinstance(value, dict):
+            value = {name: array('I', cards) if isinstance(cards, array) else cards for name, cards in value.items()}
+        elif isinstance(value, list) and field != "packs":
+            value = list(value)
+        setattr(copy, field, value)
+    return copy
+
+
+def measure(layout, rooms):
+    tracemalloc.start()
+    before = traced()
+    copies = [layout(room) for room in rooms]
+    used = traced() - before
+    tracemalloc.stop()
+    del copies
+    return used / len(rooms)
+
+
+def deck_bytes(room):
+    return sum(
+        sys.getsizeof(deck) + sys.getsizeof(deck.discard) + (sys.getsizeof(deck.order) if deck.order is not None else 0)
+        for deck in (room.white_deck, room.black_deck)
+    )
+
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    rooms = [play_first_round(players) for _ in range(count)]
+    decks = sum(deck_bytes(room) for room in rooms) / count
+
+    dict_bytes = measure(dict_layout, rooms)
+    model_bytes = measure(model_layout, rooms)
+
+    print(f"{count} rooms, {players} players each, judging the first round")
+    print(f"  dict layout: {dict_bytes:8,.0f} bytes per room, {dict_bytes + decks:9,.0f} with decks")
+    print(f"     GameRoom: {model_bytes:8,.0f} bytes per room, {model_bytes + decks:9,.0f} with decks "
+          f"({1 - model_bytes / dict_bytes:.0%} less without decks)")
+
+
+if __name__ == "__main__":
+    main()
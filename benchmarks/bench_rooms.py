@@ -0,0 +1,68 @@
+# Room store benchmark: transactions per second on the local store, and on
+# two RedisRoomStore instances sharing one Redis (an in-process fakeredis
+# server by default, or REDIS_URL) as two nodes serving the same room from
+# separate threads. Consistency is covered by tests/test_rooms.py.
+#
+#   pip install -r requirements-dev.txt
+#   python benchmarks/bench_rooms.py [joins_per_worker]
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from game import new_game, apply_event
+from rooms import LocalRoomStore, RedisRoomStore
+
+
+def make_client():
+    if os.getenv('REDIS_URL'):
+        import redis
+        return lambda: redis.Redis.from_url(os.environ['REDIS_URL'])
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeRedis(server=server)
+
+
+def join_players(store, game_id, worker, count):
+    for i in range(count):
+        with store.transaction(game_id) as room:
+            apply_event(room, "player_joined", {"player": f"w{worker}-p{i}"})
+            apply_event(room, "player_ready", {"player": f"w{worker}-p{i}", "is_ready": True})
+
+
+def bench_store(name, stores, game_id, count):
+    threads = [
+        threading.Thread(target=join_players, args=(store, game_id, worker, count))
+        for worker, store in enumerate(stores)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    transactions = count * len(stores)
+    print(f"{name:>12}: {transactions} transactions in {elapsed:.3f}s "
+          f"({transactions / elapsed:,.0f}/s, {elapsed / transactions * 1e6:.0f} us each)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    game_id = "BENCH1"
+
+    local = LocalRoomStore()
+    local.put(game_id, new_game())
+    bench_store("local", [local], game_id, count * 2)
+
+    client = make_client()
+    worker_a = RedisRoomStore(client())
+    worker_b = RedisRoomStore(client())
+    worker_a.put(game_id, new_game())
+    bench_store("redis x2", [worker_a, worker_b], game_id, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Card search benchmark: index build time and memory, and query latency of
+# the inverted index (a raw search, and a 20-card page through the result
+# cache) against a linear scan of every card text.
+#
+#   python benchmarks/bench_search.py [queries_per_case]
+
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cards import get_catalog
+from search import CardIndex, CardSearch, tokenize
+
+QUERIES = [
+    ("word", "bacon", {}),
+    ("two words", "dead parents", {}),
+    ("prefix", "pen", {}),
+    ("common word", "the", {}),
+    ("filtered", "the", {"color": "black", "pick": 2}),
+    ("no match", "zzzzqx", {}),
+]
+
+
+# What a search costs without an index: check every card text
+def linear_scan(catalog, query):
+    words = tokenize(query)
+    matches = []
+    for texts in (catalog.white_text, catalog.black_text):
+        for card_id, text in enumerate(texts):
+            card_words = tokenize(text)
+            if all(word in card_words for word in words[:-1]) and any(word.startswith(words[-1]) for word in card_words):
+                matches.append(card_id)
+    return matches
+
+
+def timed(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e6
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    catalog = get_catalog()
+    list(catalog.white_text)  # decode the texts once so the build is not timed on cold pages
+
+    start = time.perf_counter()
+    CardIndex(catalog)
+    build_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    index = CardIndex(catalog)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{catalog.white_count + catalog.black_count} cards, {len(index.terms)} terms, {len(index.postings)} postings")
+    print(f"build: {build_time * 1e3:.0f} ms, {retained / 1e6:.1f} MB retained ({peak / 1e6:.1f} MB peak)")
+    print(f"{'query':>12} {'matches':>8} {'index us':>9} {'page us':>10} {'scan us':>9}")
+
+    for name, query, filters in QUERIES:
+        search = CardSearch(index)
+        matches = len(index.search(query, **filters))
+        uncached = timed(lambda: index.search(query, **filters), runs)
+        search.search(query, **filters)
+        cached = timed(lambda: search.search(query, **filters), runs)
+        scan = timed(lambda: linear_scan(catalog, query), max(1, runs // 10))
+        print(f"{name:>12} {matches:8} {uncached:9.0f} {cached:10.0f} {scan:9.0f}")
+
+
+if __name__ == "__main__":
+    main()
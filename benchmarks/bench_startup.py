@@ -0,0 +1,65 @@
+# Startup benchmark: time from launching a fresh interpreter to the first
+# healthy /health response, with the compiled card catalog and with the
+# JSON fallback. Each run imports app in a new process (through the test
+# client, so no port is needed) with an empty temporary data directory.
+#
+#   python cards.py build            # compile the catalog first
+#   python benchmarks/bench_startup.py [runs]
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/health')
+assert response.status_code == 200, response.status_code
+print('STARTUP', imported - start, time.perf_counter() - start, flush=True)
+"""
+
+
+def run_once(extra_env):
+    env = dict(os.environ, CAH_DATA_DIR=tempfile.mkdtemp(prefix='cah-startup-'), **extra_env)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in process.stdout:
+        if line.startswith('STARTUP'):
+            healthy = time.perf_counter() - start
+            _, import_time, in_process = line.split()
+            process.kill()
+            process.wait()
+            return healthy, float(import_time), float(in_process)
+    process.wait()
+    raise RuntimeError(f"app did not start (exit code {process.returncode})")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sys.path.insert(0, ROOT)
+    from cards import CATALOG_PATH
+    modes = [("json catalog", {"CAH_CATALOG_PATH": os.path.join(tempfile.gettempdir(), 'no-such-catalog.bin')})]
+    if os.path.exists(CATALOG_PATH):
+        modes.insert(0, ("compiled catalog", {}))
+    else:
+        print(f"{CATALOG_PATH} not found; run `python cards.py build` to compare")
+
+    for name, extra_env in modes:
+        results = [run_once(extra_env) for _ in range(runs)]
+        healthy = [r[0] for r in results]
+        imports = [r[1] for r in results]
+        print(f"{name:>17}: first healthy /health after {statistics.median(healthy) * 1e3:.0f} ms median "
+              f"(min {min(healthy) * 1e3:.0f}, max {max(healthy) * 1e3:.0f}), "
+              f"import app {statistics.median(imports) * 1e3:.0f} ms, {runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Storage backend benchmark: one batched save of many games, then loading
+# them back one by one. SQLite runs in a temporary directory; PostgreSQL runs
+# too when CAH_TEST_DATABASE_URL points at a throwaway database (its tables
+# are dropped first). Correctness is covered by tests/test_storage.py.
+#
+#   CAH_TEST_DATABASE_URL=postgresql://localhost/cah_test python benchmarks/bench_storage.py [games]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import SQLiteStorage
+from game import new_game, apply_event
+
+TABLES = ('games', 'players', 'game_events', 'game_snapshots', 'chat_messages', 'player_stats', 'card_stats')
+
+
+def make_game(i):
+    game_data = new_game()
+    for player in ("ann", "bob", "cat"):
+        apply_event(game_data, "player_joined", {"player": player})
+        apply_event(game_data, "player_ready", {"player": player, "is_ready": True})
+    return f"G{i:05d}", game_data
+
+
+def bench(storage, count):
+    storage.init_db()
+    games = [make_game(i) for i in range(count)]
+
+    start = time.perf_counter()
+    storage.save_games(games)
+    saved = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for game_id, game_data in games:
+        storage.load_game(game_id)
+    loaded = time.perf_counter() - start
+
+    storage.delete_old_games(days=-1)
+    return saved, loaded
+
+
+def postgres_storage(url):
+    from postgres_storage import PostgresStorage
+    storage = PostgresStorage(url)
+    with storage.cursor() as c:
+        c.execute(f"DROP TABLE IF EXISTS {', '.join(TABLES)}")
+    return storage
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    backends = [("sqlite", lambda: SQLiteStorage(os.path.join(tempfile.mkdtemp(prefix='cah-storage-'), 'games.db')))]
+    if os.getenv('CAH_TEST_DATABASE_URL'):
+        backends.append(("postgres", lambda: postgres_storage(os.environ['CAH_TEST_DATABASE_URL'])))
+    else:
+        print("postgres: skipped (set CAH_TEST_DATABASE_URL to a throwaway database)")
+
+    for name, factory in backends:
+        storage = factory()
+        try:
+            saved, loaded = bench(storage, count)
+        finally:
+            storage.close()
+        print(f"{name:>8}: {count} games saved in one batch in {saved * 1e3:.1f} ms, "
+              f"loaded one by one in {loaded * 1e3:.1f} ms ({loaded / count * 1e6:.0f} us each)")
@@ -0,0 +1,82 @@
+# Timer wheel benchmark with 10k concurrent rooms.
+#
+# Every room holds a phase deadline (submission or judging) that is
+# rescheduled as the room moves through rounds, and some rooms also hold
+# reconnect grace timers. The wheel is driven tick by tick on a simulated
+# clock, so the run covers 30 minutes of game time in a few seconds.
+#
+#   python benchmarks/bench_timers.py [rooms]
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from timers import TimerWheel
+
+TICK = 0.5
+SIMULATED_SECONDS = 30 * 60
+
+
+def main():
+    rooms = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(1)
+    wheel = TimerWheel(tick=TICK)
+    fired = {"phase": 0, "grace": 0}
+
+    def on_phase(game_id):
+        fired["phase"] += 1
+        # Next phase of the round: judging (60s) or a new round (120s)
+        wheel.schedule(("round", game_id), rng.choice((60, 120)), on_phase, game_id)
+
+    def on_grace(game_id, player):
+        fired["grace"] += 1
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for game_id in range(rooms):
+        wheel.schedule(("round", game_id), rng.uniform(1, 120), on_phase, game_id)
+    schedule_time = time.perf_counter() - start
+    wheel_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    ticks = int(SIMULATED_SECONDS / TICK)
+    tick_times = []
+    churn = 0
+    churn_time = 0.0
+    for tick in range(ticks):
+        # Players submitting early, disconnecting and reconnecting
+        churn_start = time.perf_counter()
+        for _ in range(rooms // 200):
+            game_id = rng.randrange(rooms)
+            wheel.schedule(("round", game_id), rng.uniform(5, 120), on_phase, game_id)
+            key = ("grace", game_id, "p")
+            if key in wheel:
+                wheel.cancel(key)
+            else:
+                wheel.schedule(key, 30, on_grace, game_id, "p")
+            churn += 2
+        churn_time += time.perf_counter() - churn_start
+
+        tick_start = time.perf_counter()
+        wheel._advance_one()
+        tick_times.append(time.perf_counter() - tick_start)
+
+    tick_times.sort()
+    total = sum(tick_times)
+    print(f"{rooms} rooms, {ticks} ticks of {TICK}s ({SIMULATED_SECONDS // 60} simulated minutes)")
+    print(f"initial schedule: {schedule_time / rooms * 1e6:.2f} us per timer, "
+          f"~{wheel_bytes / rooms:.0f} bytes per room timer")
+    print(f"schedule/cancel churn: {churn} ops, {churn_time / churn * 1e6:.2f} us per op")
+    print(f"tick cost: median {tick_times[len(tick_times) // 2] * 1e6:.1f} us, "
+          f"p99 {tick_times[int(len(tick_times) * 0.99)] * 1e6:.1f} us, "
+          f"max {tick_times[-1] * 1e3:.2f} ms, busy {total / SIMULATED_SECONDS * 100:.3f}% of wall time")
+    print(f"fired: {fired['phase']} phase deadlines, {fired['grace']} grace expiries, "
+          f"{len(wheel)} timers pending")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# Load test: N rooms with M bots each, played through the same socket
+# events as templates/game.html (join_game, player_ready, start_round,
+# draw_white_cards, submit_card, judge_round, chat_message). Chat batches
+# go out with the write-behind flushes. Each room can also have an audience
+# of spectator sockets, whose digests go out with the flushes too; player
+# latencies should not change with the audience size.
+#
+# The app runs in-process and every bot is a Flask-SocketIO test client, so
+# each emit runs its handler to completion and the time it takes is the
+# server-side latency of that event. The database goes to a temporary
+# directory unless CAH_DATA_DIR is set. Write-behind flushes are run from the
+# loop every CAH_FLUSH_INTERVAL seconds, as the background task would.
+#
+#   python benchmarks/load_test.py [rooms] [bots_per_room] [rounds] [spectators_per_room]
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('CAH_DATA_DIR', tempfile.mkdtemp(prefix='cah-load-'))
+
+import app as cah
+
+# Socket.IO debug logging would dominate the measurements
+logging.disable(logging.CRITICAL)
+# Bots play far faster than people and share one address; measure the
+# handlers, not the rate limiter
+cah.limiter.limits.clear()
+
+EVENTS = ("join_game", "player_ready", "start_round", "draw_white_cards",
+          "submit_card", "judge_round", "chat_message")
+
+
+class Bot:
+    def __init__(self, game_id, name):
+        self.game_id = game_id
+        self.name = name
+        self.client = cah.socketio.test_client(cah.app)
+        self.hand = []
+
+    def received(self):
+        messages = self.client.get_received()
+        for message in messages:
+            if message["name"] == "white_card_choices":
+                cards = message["args"][0]["white_cards"]
+                self.hand = cards if message["args"][0]["replace"] else self.hand + cards
+        return messages
+
+
+class LoadTest:
+    def __init__(self, rooms, bots, rounds, spectators=0):
+        self.rooms = rooms
+        self.bots = bots
+        self.rounds = rounds
+        self.spectators = spectators
+        self.latencies = {event: [] for event in EVENTS}
+        self.recording = True
+        self.received_messages = 0
+        self.received_bytes = 0
+        self.spectator_messages = 0
+        self.spectator_bytes = 0
+        self.flush_time = 0.0
+        self.last_flush = time.perf_counter()
+
+    def emit(self, bot, event, data):
+        start = time.perf_counter()
+        bot.client.emit(event, data)
+        if self.recording:
+            self.latencies[event].append(time.perf_counter() - start)
+
+    def drain(self, bots):
+        for bot in bots:
+            for message in bot.received():
+                if not self.recording:
+                    continue
+                self.received_messages += 1
+                self.received_bytes += len(json.dumps(message["args"], separators=(",", ":")))
+
+    def drain_spectators(self, audience):
+        for client in audience:
+            for message in client.get_received():
+                if not self.recording:
+                    continue
+                self.spectator_messages += 1
+                self.spectator_bytes += len(json.dumps(message["args"], separators=(",", ":")))
+
+    def maybe_flush(self):
+        if time.perf_counter() - self.last_flush >= cah.persistence.interval:
+            start = time.perf_counter()
+            cah.persistence.flush()
+            cah.chat.flush(cah.socketio)
+            cah.spectators.flush(cah.socketio)
+            self.flush_time += time.perf_counter() - start
+            self.last_flush = time.perf_counter()
+
+    def create_room(self):
+        response = cah.app.test_client().post("/create_game")
+        game_id = response.headers["Location"].rsplit("/", 1)[1]
+        bots = [Bot(game_id, f"bot{i}") for i in range(self.bots)]
+        for bot in bots:
+            self.emit(bot, "join_game", {"game_id": game_id, "player_name": bot.name})
+            self.emit(bot, "draw_white_cards", {"game_id": game_id, "player_name": bot.name})
+        for bot in bots:
+            self.emit(bot, "player_ready", {"game_id": game_id, "player_name": bot.name, "is_ready": True})
+        self.drain(bots)
+        audience = [cah.socketio.test_client(cah.app) for _ in range(self.spectators)]
+        for i, client in enumerate(audience):
+            client.emit("join_as_spectator", {"game_id": game_id, "spectator_name": f"watcher{i}"})
+        self.drain_spectators(audience)
+        return game_id, bots, audience
+
+    def play_round(self, game_id, bots, audience):
+        self.emit(bots[0], "start_round", {"game_id": game_id})
+        room = cah.game_rooms.get(game_id)
+        czar = room.card_czar
+        pick = cah.catalog.pick(room.black_card_id)
+        self.drain(bots)
+
+        # Hands are kept between rounds; submitting refills the played cards
+        players = [bot for bot in bots if bot.name != czar]
+        for bot in players:
+            played = [card["id"] for card in bot.hand[:pick]]
+            bot.hand = bot.hand[pick:]
+            self.emit(bot, "submit_card", {"game_id": game_id, "player_name": bot.name, "white_cards": played})
+        self.drain(bots)
+
+        czar_bot = next(bot for bot in bots if bot.name == czar)
+        winner = players[0]
+        self.emit(czar_bot, "judge_round", {"game_id": game_id, "winner": winner.name})
+        self.emit(winner, "chat_message", {"game_id": game_id, "player": winner.name, "message": "gg"})
+        self.drain(bots)
+        self.drain_spectators(audience)
+
+    # Traced separately: tracemalloc slows everything down while it runs
+    def measure_memory(self, sample=10):
+        self.recording = False
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        rooms = [self.create_room() for _ in range(sample)]
+        for game_id, bots, audience in rooms:
+            self.play_round(game_id, bots, audience)
+        room_bytes = (tracemalloc.get_traced_memory()[0] - baseline) / sample
+        tracemalloc.stop()
+        for _, bots, audience in rooms:
+            for bot in bots:
+                bot.client.disconnect()
+            for client in audience:
+                client.disconnect()
+        self.recording = True
+        return room_bytes
+
+    def run(self):
+        start = time.perf_counter()
+        rooms = [self.create_room() for _ in range(self.rooms)]
+        setup_time = time.perf_counter() - start
+
+        persisted = cah.persistence.metrics()
+        start = time.perf_counter()
+        for _ in range(self.rounds):
+            for game_id, bots, audience in rooms:
+                self.play_round(game_id, bots, audience)
+                self.maybe_flush()
+        flush_start = time.perf_counter()
+        cah.persistence.flush()
+        self.flush_time += time.perf_counter() - flush_start
+        elapsed = time.perf_counter() - start
+
+        for _, bots, audience in rooms:
+            for bot in bots:
+                bot.client.disconnect()
+            for client in audience:
+                client.disconnect()
+        after = cah.persistence.metrics()
+        self.report(setup_time, elapsed, self.measure_memory(), persisted, after)
+
+    def report(self, setup_time, elapsed, room_bytes, before, after):
+        total_events = sum(len(times) for times in self.latencies.values())
+        print(f"{self.rooms} rooms x {self.bots} bots and {self.spectators} spectators, {self.rounds} rounds "
+              f"(persistence mode {after['mode']}, data in {os.environ['CAH_DATA_DIR']})")
+        print(f"setup: {setup_time:.2f}s, ~{room_bytes / 1024:.1f} KB per room "
+              f"(room, decks and {self.bots + self.spectators} sockets after one round), "
+              f"~{cah.reaper.metrics()['approx_bytes_per_room'] / 1024:.1f} KB of room state")
+        print(f"{'event':>18} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for event, times in self.latencies.items():
+            if not times:
+                continue
+            times.sort()
+            pct = lambda p: times[min(len(times) - 1, int(len(times) * p))] * 1e3
+            print(f"{event:>18} {len(times):>8} {pct(0.5):>8.3f} {pct(0.95):>8.3f} {pct(0.99):>8.3f} {times[-1] * 1e3:>8.3f}")
+
+        played = sum(len(self.latencies[event]) for event in EVENTS) - self.rooms * self.bots * 3
+        print(f"throughput: {played / elapsed:,.0f} events/s over {elapsed:.2f}s "
+              f"({self.rooms * self.rounds / elapsed:,.1f} rounds/s, {total_events} events in total)")
+        print(f"outbound: {self.received_messages} messages, {self.received_bytes / 1024:.1f} KB, "
+              f"{self.received_bytes / max(1, self.rooms * self.rounds):.0f} bytes per room-round")
+        if self.spectators:
+            print(f"spectators: {self.spectator_messages} digests, {self.spectator_bytes / 1024:.1f} KB, "
+                  f"{self.spectator_messages / (self.rooms * self.spectators):.1f} per spectator")
+        games = after["games_written"] - before["games_written"]
+        events = after["events_written"] - before["events_written"]
+        flushes = after["flushes"] - before["flushes"]
+        print(f"db writes: {games} game rows ({games / elapsed:,.1f}/s), {events} events ({events / elapsed:,.1f}/s), "
+              f"{flushes} flushes taking {self.flush_time:.3f}s ({self.flush_time / elapsed * 100:.1f}% of run)")
+
+
+def main():
+    rooms = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    bots = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    spectators = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    LoadTest(rooms, bots, rounds, spectators).run()
+
+
+if __name__ == "__main__":
+    main()
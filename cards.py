@@ -0,0 +1,259 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+# Path to the card packs (list of {"name", "white", "black", "official"})
+CARDS_PATH = os.getenv('CAH_CARDS_PATH', os.path.join(os.path.dirname(__file__), 'cah-all-full.json'))
+# Compiled catalog written by `python cards.py build`; it is memory-mapped at
+# startup instead of parsing the JSON, unless it is older than the JSON
+CATALOG_PATH = os.getenv('CAH_CATALOG_PATH', os.path.join(os.path.dirname(__file__), 'cah-cards.bin'))
+
+# Header: magic, format version, pack/white/black counts, then the byte
+# length of each section in file order (see write_binary)
+MAGIC = b'CAHC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sI3I9I')
+
+log = logging.getLogger(__name__)
+
+
+class TextTable:
+    # Card texts packed in one UTF-8 blob with an offsets table; a text is
+    # only decoded when it is looked up
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class CardRanges:
+    # The card IDs of a set of packs as (start, end) ranges. Iterating yields
+    # every ID in order, so building a deck from 20 packs never touches the
+    # cards of the other packs.
+
+    __slots__ = ("ranges", "length")
+
+    def __init__(self, ranges):
+        self.ranges = [(start, end) for start, end in ranges if end > start]
+        self.length = sum(end - start for start, end in self.ranges)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            yield from range(start, end)
+
+
+class CardCatalog:
+    # Flat, array-backed card tables. A card ID is simply its index in the
+    # white or black table, so game state only ever stores small integers.
+
+    def __init__(self, packs):
+        self.pack_names = []
+        self.pack_official = array('b')
+        self.white_text = []
+        self.white_pack = array('H')
+        self.black_text = []
+        self.black_pack = array('H')
+        self.black_pick = array('B')
+
+        for pack_index, pack in enumerate(packs):
+            self.pack_names.append(pack.get("name", ""))
+            self.pack_official.append(1 if pack.get("official") else 0)
+            for card in pack.get("white", []):
+                if "text" in card:
+                    self.white_text.append(card["text"])
+                    self.white_pack.append(pack_index)
+            for card in pack.get("black", []):
+                if "text" in card:
+                    self.black_text.append(card["text"])
+                    self.black_pack.append(pack_index)
+                    self.black_pick.append(card.get("pick", 1))
+
+    @property
+    def white_count(self):
+        return len(self.white_text)
+
+    @property
+    def black_count(self):
+        return len(self.black_text)
+
+    def white(self, card_id):
+        return self.white_text[card_id]
+
+    def black(self, card_id):
+        return self.black_text[card_id]
+
+    def pick(self, card_id):
+        return self.black_pick[card_id]
+
+    def random_black(self, rng=random):
+        return rng.randrange(len(self.black_text))
+
+    def random_white(self, rng=random):
+        return rng.randrange(len(self.white_text))
+
+    # (start, end) card IDs of every pack. Cards are stored pack by pack, so
+    # each range is found by bisecting the pack column.
+    def _pack_ranges(self, pack_column):
+        return [
+            (bisect.bisect_left(pack_column, pack), bisect.bisect_left(pack_column, pack + 1))
+            for pack in range(len(self.pack_names))
+        ]
+
+    @property
+    def white_ranges(self):
+        if self.__dict__.get("_white_ranges") is None:
+            self._white_ranges = self._pack_ranges(self.white_pack)
+        return self._white_ranges
+
+    @property
+    def black_ranges(self):
+        if self.__dict__.get("_black_ranges") is None:
+            self._black_ranges = self._pack_ranges(self.black_pack)
+        return self._black_ranges
+
+    def official_packs(self):
+        return [pack for pack, official in enumerate(self.pack_official) if official]
+
+    # Deck sources for a selection of pack indexes (None means every pack)
+    def white_source(self, packs=None):
+        if packs is None:
+            return range(self.white_count)
+        return CardRanges(self.white_ranges[pack] for pack in sorted(set(packs)))
+
+    def black_source(self, packs=None):
+        if packs is None:
+            return range(self.black_count)
+        return CardRanges(self.black_ranges[pack] for pack in sorted(set(packs)))
+
+    # Catalog backed by a compiled buffer (usually an mmap); nothing is
+    # copied or decoded up front
+    @classmethod
+    def from_binary(cls, buffer):
+        view = memoryview(buffer)
+        fields = HEADER.unpack_from(view)
+        magic, version, pack_count, white_count, black_count = fields[:5]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a compiled card catalog")
+
+        sections = []
+        position = HEADER.size
+        for length in fields[5:]:
+            sections.append(view[position:position + length])
+            position += length
+        (pack_offsets, white_offsets, black_offsets, white_pack, black_pack,
+         pack_official, black_pick, pack_blob, text_blob) = sections
+
+        catalog = cls.__new__(cls)
+        catalog.pack_names = list(TextTable(pack_offsets.cast('I'), pack_blob))
+        catalog.pack_official = array('b', pack_official.tobytes())
+        catalog.white_text = TextTable(white_offsets.cast('I'), text_blob)
+        catalog.white_pack = white_pack.cast('H')
+        catalog.black_text = TextTable(black_offsets.cast('I'), text_blob)
+        catalog.black_pack = black_pack.cast('H')
+        catalog.black_pick = black_pick.cast('B')
+        if (len(catalog.pack_names), len(catalog.white_text), len(catalog.black_text)) != (pack_count, white_count, black_count):
+            raise ValueError("Corrupt card catalog")
+        return catalog
+
+
+def _pack_texts(texts, blob):
+    offsets = array('I', [len(blob)])
+    for text in texts:
+        blob += text.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets
+
+
+# Compile a catalog to the binary format read by CardCatalog.from_binary.
+# Arrays are written in native byte order, which is checked on load.
+def write_binary(catalog, path=CATALOG_PATH):
+    if sys.byteorder != 'little':
+        raise ValueError("The compiled catalog format is little-endian")
+    pack_blob = bytearray()
+    text_blob = bytearray()
+    pack_offsets = _pack_texts(catalog.pack_names, pack_blob)
+    white_offsets = _pack_texts(catalog.white_text, text_blob)
+    black_offsets = _pack_texts(catalog.black_text, text_blob)
+    # 4-byte arrays first, then 2-byte, then bytes, so casts stay aligned
+    sections = [
+        pack_offsets.tobytes(), white_offsets.tobytes(), black_offsets.tobytes(),
+        array('H', catalog.white_pack).tobytes(), array('H', catalog.black_pack).tobytes(),
+        array('b', catalog.pack_official).tobytes(), array('B', catalog.black_pick).tobytes(),
+        bytes(pack_blob), bytes(text_blob),
+    ]
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(catalog.pack_names), catalog.white_count,
+                         catalog.black_count, *[len(section) for section in sections])
+    # Written to a temporary file first so running workers never map a partial file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(header)
+        for section in sections:
+            file.write(section)
+    os.replace(temp_path, path)
+    return path
+
+
+def load_binary(path=CATALOG_PATH):
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return CardCatalog.from_binary(buffer)
+
+
+def load_json(path=CARDS_PATH):
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if not isinstance(data, list):
+        raise ValueError("Invalid JSON format")
+    return CardCatalog(data)
+
+
+def load_catalog(path=CARDS_PATH, compiled_path=CATALOG_PATH):
+    # Use the compiled catalog when it is at least as new as the JSON
+    try:
+        if sys.byteorder == 'little' and os.path.getmtime(compiled_path) >= os.path.getmtime(path):
+            return load_binary(compiled_path)
+    except (OSError, ValueError) as e:
+        log.info("Compiled card catalog not used: %s", e)
+    return load_json(path)
+
+
+_catalog = None
+
+# Load the catalog once per process and share it between all games
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = load_catalog()
+    return _catalog
+
+
+if __name__ == "__main__":
+    # python cards.py build [cards.json] [output.bin]
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        sys.exit("usage: python cards.py build [cards.json] [output.bin]")
+    source = sys.argv[2] if len(sys.argv) > 2 else CARDS_PATH
+    output = sys.argv[3] if len(sys.argv) > 3 else CATALOG_PATH
+    catalog = load_json(source)
+    write_binary(catalog, output)
+    print(f"Wrote {catalog.white_count} white and {catalog.black_count} black cards "
+          f"from {len(catalog.pack_names)} packs to {output} ({os.path.getsize(output)} bytes)")
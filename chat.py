@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database import save_chat_messages, load_chat_messages
+
+# Seconds chat messages are held so a room gets them in one emit
+CHAT_INTERVAL = float(os.getenv('CAH_CHAT_INTERVAL', '0.25'))
+# Seconds between writes of new messages to the chat table
+CHAT_SAVE_INTERVAL = float(os.getenv('CAH_CHAT_SAVE_INTERVAL', '2.0'))
+# Messages replayed to players who join or reconnect
+CHAT_HISTORY = int(os.getenv('CAH_CHAT_HISTORY', '50'))
+# Rooms whose history is kept in memory; others are read back on join
+CHAT_HISTORY_ROOMS = int(os.getenv('CAH_CHAT_HISTORY_ROOMS', '1024'))
+# Longest message accepted, in characters
+MAX_MESSAGE_LENGTH = 500
+# Messages kept per room between flushes; older ones are dropped first
+MAX_BATCH = 50
+# Messages held for the chat table while the database is failing
+MAX_UNSAVED = 10000
+
+log = logging.getLogger(__name__)
+
+
+class ChatHistory:
+    # Fixed-size ring of the latest messages; `next` counts every message
+    # ever added, so the next slot is next % size
+
+    __slots__ = ("messages", "next")
+
+    def __init__(self, size=CHAT_HISTORY, messages=()):
+        self.messages = [None] * size
+        self.next = 0
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        self.messages[self.next % len(self.messages)] = message
+        self.next += 1
+
+    # Oldest first
+    def items(self):
+        size = len(self.messages)
+        if self.next <= size:
+            return self.messages[:self.next]
+        start = self.next % size
+        return self.messages[start:] + self.messages[:start]
+
+    def __len__(self):
+        return min(self.next, len(self.messages))
+
+
+class ChatBatcher:
+    # Chat messages are queued per room and sent as one "chat_messages"
+    # emit every CHAT_INTERVAL seconds, so a burst of messages costs each
+    # socket in the room one packet instead of one per message. The last
+    # CHAT_HISTORY messages of recently active rooms are kept for replay,
+    # and new messages are written to the chat table every
+    # CHAT_SAVE_INTERVAL seconds in one insert.
+
+    def __init__(self, interval=CHAT_INTERVAL, max_batch=MAX_BATCH, save_interval=CHAT_SAVE_INTERVAL,
+                 history_size=CHAT_HISTORY, history_rooms=CHAT_HISTORY_ROOMS,
+                 writer=save_chat_messages, loader=load_chat_messages):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.save_interval = save_interval
+        self.history_size = history_size
+        self.history_rooms = history_rooms
+        self.writer = writer
+        self.loader = loader
+        self.pending = {}  # game_id -> [message, ...]
+        self.histories = OrderedDict()  # game_id -> ChatHistory, least recently used first
+        self.unsaved = []  # (game_id, player, message, created_at)
+        self.last_save = time.monotonic()
+        self.running = False
+        self.sent = 0
+        self.dropped = 0
+        self.saved = 0
+        self.save_errors = 0
+
+    def add(self, game_id, player, message):
+        message = {"player": player, "message": message[:MAX_MESSAGE_LENGTH]}
+        batch = self.pending.setdefault(game_id, [])
+        batch.append(message)
+        if len(batch) > self.max_batch:
+            del batch[0]
+            self.dropped += 1
+        self.history(game_id).append(message)
+        self.unsaved.append((game_id, player, message["message"], datetime.now().isoformat()))
+
+    # A room's history, read back from the database (plus anything not yet
+    # written) when it is not in memory
+    def history(self, game_id):
+        history = self.histories.get(game_id)
+        if history is not None:
+            self.histories.move_to_end(game_id)
+            return history
+        messages = self.loader(game_id, self.history_size)
+        messages += [
+            {"player": player, "message": message}
+            for room_id, player, message, created_at in self.unsaved if room_id == game_id
+        ]
+        history = self.histories[game_id] = ChatHistory(self.history_size, messages)
+        if len(self.histories) > self.history_rooms:
+            self.histories.popitem(last=False)
+        return history
+
+    def discard(self, game_id):
+        self.histories.pop(game_id, None)
+
+    def flush(self, socketio):
+        pending, self.pending = self.pending, {}
+        for game_id, batch in pending.items():
+            socketio.emit("chat_messages", batch, room=game_id)
+            self.sent += len(batch)
+        return len(pending)
+
+    def save(self):
+        if not self.unsaved:
+            return 0
+        rows, self.unsaved = self.unsaved, []
+        try:
+            self.writer(rows)
+        except Exception as e:
+            # Put the rows back in front of anything added meanwhile
+            self.unsaved = (rows + self.unsaved)[-MAX_UNSAVED:]
+            self.save_errors += 1
+            log.error("Chat save failed for %d messages: %s", len(rows), e)
+            return 0
+        self.saved += len(rows)
+        self.last_save = time.monotonic()
+        return len(rows)
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.interval)
+            if self.pending:
+                self.flush(socketio)
+            if self.unsaved and time.monotonic() - self.last_save >= self.save_interval:
+                self.save()
+
+    def stop(self):
+        self.running = False
+        self.save()
+
+    def metrics(self):
+        return {
+            "rooms_pending": len(self.pending),
+            "histories": len(self.histories),
+            "unsaved": len(self.unsaved),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "saved": self.saved,
+            "save_errors": self.save_errors,
+        }
@@ -0,0 +1,94 @@
+import ipaddress
+import json
+import logging
+import os
+import time
+
+import requests
+
+from database import DATA_DIR
+
+CLOUDFLARE_IPS_URL = 'https://api.cloudflare.com/client/v4/ips'
+# Ranges shipped with the app, used until a refreshed copy has been saved
+BUNDLED_PATH = os.path.join(os.path.dirname(__file__), 'cloudflare-ips.json')
+CACHE_PATH = os.path.join(DATA_DIR, 'cloudflare-ips.json')
+# Refresh the cached ranges when they are older than this many seconds
+REFRESH_AFTER = float(os.getenv('CAH_CLOUDFLARE_REFRESH', '86400'))
+# Seconds before trying again after a failed refresh
+RETRY_AFTER = float(os.getenv('CAH_CLOUDFLARE_RETRY', '3600'))
+FETCH_TIMEOUT = float(os.getenv('CAH_CLOUDFLARE_TIMEOUT', '5'))
+
+log = logging.getLogger(__name__)
+
+
+def _read(path):
+    with open(path, 'r') as file:
+        data = json.load(file)
+    return data['ipv4_cidrs'] + data['ipv6_cidrs']
+
+
+# Cloudflare IP ranges from the local cache (or the bundled copy); no network
+def load_cloudflare_ips():
+    for path in (CACHE_PATH, BUNDLED_PATH):
+        try:
+            return _read(path)
+        except (OSError, ValueError, KeyError):
+            continue
+    return []
+
+
+def fetch_cloudflare_ips(timeout=FETCH_TIMEOUT):
+    response = requests.get(CLOUDFLARE_IPS_URL, timeout=timeout)
+    response.raise_for_status()
+    result = response.json()['result']
+    data = {'ipv4_cidrs': result['ipv4_cidrs'], 'ipv6_cidrs': result['ipv6_cidrs']}
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_path = CACHE_PATH + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, CACHE_PATH)
+    return data['ipv4_cidrs'] + data['ipv6_cidrs']
+
+
+def cache_age():
+    try:
+        return time.time() - os.path.getmtime(CACHE_PATH)
+    except OSError:
+        return None
+
+
+# Update app.config['CLOUDFLARE_IPS'] from the API in the background every
+# REFRESH_AFTER seconds; the first pass waits until the cache is stale. A
+# failed fetch keeps the ranges already loaded and is retried later.
+def refresh_cloudflare_ips(app, socketio):
+    def refresh():
+        while True:
+            age = cache_age()
+            if age is not None and age < REFRESH_AFTER:
+                socketio.sleep(REFRESH_AFTER - age)
+                continue
+            try:
+                app.config['CLOUDFLARE_IPS'] = fetch_cloudflare_ips()
+            except Exception as e:
+                log.warning("Could not refresh Cloudflare IP ranges: %s", e)
+                socketio.sleep(RETRY_AFTER)
+                continue
+            socketio.sleep(REFRESH_AFTER)
+
+    socketio.start_background_task(refresh)
+
+
+# Parsed networks for the range list last checked against; the list object
+# only changes when the ranges are refreshed
+_parsed = (None, ())
+
+
+def is_cloudflare(address, cidrs):
+    global _parsed
+    if _parsed[0] is not cidrs:
+        _parsed = (cidrs, tuple(ipaddress.ip_network(cidr) for cidr in cidrs))
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _parsed[1])
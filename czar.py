@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+
+# Who judges rooms created with the AI czar: "local" (a deterministic
+# stand-in that needs no network) or "openai" (needs OPENAI_API_KEY)
+CZAR_PROVIDER = os.getenv('CAH_CZAR_PROVIDER', 'local')
+CZAR_MODEL = os.getenv('CAH_CZAR_MODEL', 'gpt-4o-mini')
+# Provider calls running at once; each call judges up to CZAR_BATCH_SIZE rounds
+CZAR_WORKERS = int(os.getenv('CAH_CZAR_WORKERS', '4'))
+CZAR_BATCH_SIZE = int(os.getenv('CAH_CZAR_BATCH_SIZE', '8'))
+# Seconds requests wait to be batched with others
+CZAR_BATCH_WINDOW = float(os.getenv('CAH_CZAR_BATCH_WINDOW', '0.05'))
+# Seconds before a round is given a random winner instead
+CZAR_TIMEOUT = float(os.getenv('CAH_CZAR_TIMEOUT', '8'))
+# Judgements remembered per (black card, set of submissions)
+CZAR_CACHE_SIZE = int(os.getenv('CAH_CZAR_CACHE_SIZE', '4096'))
+
+log = logging.getLogger(__name__)
+
+
+class LocalCzar:
+    # Scores every answer by a hash of the black card and the answer, so
+    # the same cards always win. For tests and offline play.
+
+    def judge(self, judgements):
+        return [
+            max(range(len(options)), key=lambda i: hashlib.sha1(f"{black}\n{' / '.join(options[i])}".encode()).digest())
+            for black, options in judgements
+        ]
+
+
+class OpenAICzar:
+    # Judges a whole batch of rounds in one chat completion
+
+    PROMPT = ("You are the Card Czar in Cards Against Humanity. For each game below, pick the "
+              "funniest answer to its black card. Reply with a JSON object {\"winners\": [...]} "
+              "holding the number of the winning answer for each game, in order.")
+
+    def __init__(self, model=CZAR_MODEL, timeout=CZAR_TIMEOUT, client=None):
+        if client is None:
+            from openai import OpenAI
+            # No retries: a late answer is no better than the fallback
+            client = OpenAI(timeout=timeout, max_retries=0)
+        self.client = client
+        self.model = model
+
+    def judge(self, judgements):
+        games = []
+        for number, (black, options) in enumerate(judgements, 1):
+            answers = "\n".join(f"  {i}. {' / '.join(cards)}" for i, cards in enumerate(options, 1))
+            games.append(f"Game {number}: {black}\n{answers}")
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.PROMPT},
+                {"role": "user", "content": "\n\n".join(games)},
+            ],
+            response_format={"type": "json_object"},
+            temperature=0,
+        )
+        winners = json.loads(response.choices[0].message.content)["winners"]
+        if len(winners) != len(judgements):
+            raise ValueError(f"Got {len(winners)} winners for {len(judgements)} games")
+        return [int(winner) - 1 for winner in winners]
+
+
+def create_provider(name=CZAR_PROVIDER):
+    if name == 'openai':
+        return OpenAICzar()
+    return LocalCzar()
+
+
+class Judgement:
+    # One round waiting for a winner. Rooms asking about the same cards
+    # share it.
+
+    __slots__ = ("key", "black", "options", "texts", "callbacks", "deadline", "done")
+
+    def __init__(self, key, black, options, texts, deadline):
+        self.key = key
+        self.black = black
+        self.options = options
+        self.texts = texts
+        self.callbacks = []
+        self.deadline = deadline
+        self.done = False
+
+
+class CzarService:
+    # Judges rounds off the request path. Requests are queued, batched and
+    # handed to at most `workers` provider calls running as background
+    # tasks; a round still waiting after `timeout` seconds gets a random
+    # winner. Winners are cached by black card and submitted cards, and
+    # every answer goes to the caller's callback from a background task,
+    # never from inside judge().
+
+    def __init__(self, provider, catalog, workers=CZAR_WORKERS, batch_size=CZAR_BATCH_SIZE,
+                 batch_window=CZAR_BATCH_WINDOW, timeout=CZAR_TIMEOUT, cache_size=CZAR_CACHE_SIZE, rng=random):
+        self.provider = provider
+        self.catalog = catalog
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.rng = rng
+        self.cache = OrderedDict()  # (black_card_id, options) -> winning cards
+        self.queue = []
+        self.pending = {}  # key -> Judgement, queued or being judged
+        self.active = 0
+        self.socketio = None
+        self.running = False
+        self.requests = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.provider_errors = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+
+    # submissions: the card ID tuples played this round. callback(cards,
+    # source) gets the winning tuple; source is "cache", "provider" or
+    # "fallback".
+    def judge(self, black_card_id, submissions, callback):
+        self.requests += 1
+        options = tuple(sorted(submissions))
+        key = (black_card_id, options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            self.socketio.start_background_task(self._call, callback, cached, "cache")
+            return
+        judgement = self.pending.get(key)
+        if judgement is None:
+            texts = [[self.catalog.white(card_id) for card_id in cards] for cards in options]
+            judgement = self.pending[key] = Judgement(key, self.catalog.black(black_card_id), options, texts,
+                                                      time.monotonic() + self.timeout)
+            self.queue.append(judgement)
+        judgement.callbacks.append(callback)
+
+    def _call(self, callback, cards, source):
+        try:
+            callback(cards, source)
+        except Exception as e:
+            log.error("Error handling czar judgement: %s", e)
+
+    def _finish(self, judgement, cards, source):
+        if judgement.done:
+            return
+        judgement.done = True
+        self.pending.pop(judgement.key, None)
+        for callback in judgement.callbacks:
+            self._call(callback, cards, source)
+
+    def _remember(self, key, cards):
+        self.cache[key] = cards
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _judge_batch(self, batch):
+        try:
+            winners = self.provider.judge([(judgement.black, judgement.texts) for judgement in batch])
+        except Exception as e:
+            self.provider_errors += 1
+            log.error("Czar provider failed for %d rounds: %s", len(batch), e)
+            winners = [None] * len(batch)
+        finally:
+            self.active -= 1
+        for judgement, winner in zip(batch, winners):
+            if winner is None or not 0 <= winner < len(judgement.options):
+                self._fallback(judgement)
+                continue
+            # Late answers are still worth keeping for the next time
+            cards = judgement.options[winner]
+            self._remember(judgement.key, cards)
+            self._finish(judgement, cards, "provider")
+
+    def _fallback(self, judgement):
+        if judgement.done:
+            return
+        self.fallbacks += 1
+        self._finish(judgement, self.rng.choice(judgement.options), "fallback")
+
+    def dispatch(self):
+        while self.queue and self.active < self.workers:
+            batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+            self.active += 1
+            self.batches += 1
+            self.socketio.start_background_task(self._judge_batch, batch)
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        for judgement in list(self.pending.values()):
+            if judgement.deadline <= now:
+                self.timeouts += 1
+                if judgement in self.queue:
+                    self.queue.remove(judgement)
+                self._fallback(judgement)
+
+    def start(self, socketio):
+        self.socketio = socketio
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.batch_window)
+            try:
+                self.expire()
+                self.dispatch()
+            except Exception as e:
+                log.error("Error in czar dispatch: %s", e)
+
+    def stop(self):
+        self.running = False
+
+    def metrics(self):
+        return {
+            "provider": type(self.provider).__name__,
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "cached": len(self.cache),
+            "queued": len(self.queue),
+            "pending": len(self.pending),
+            "active": self.active,
+            "batches": self.batches,
+            "provider_errors": self.provider_errors,
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+        }
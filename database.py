@@ -1,8 +1,10 @@
 import sqlite3
 import json
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from metrics import timed
 
 # Load environment variables
 load_dotenv()
@@ -14,121 +16,491 @@ DB_PATH = os.path.join(DATA_DIR, os.getenv('CAH_DB_NAME', 'cah_games.db'))
 # Add database encryption key
 DB_KEY = os.getenv('CAH_DB_KEY', 'your-default-key-here')
 
+# "sqlite" keeps games in a file under DATA_DIR; "postgres" uses DATABASE_URL,
+# which survives redeploys and can be shared by several nodes
+STORAGE_BACKEND = os.getenv('CAH_STORAGE', 'sqlite')
+
+# ORDER BY clauses for the stats queries, by the name the API takes
+LEADERBOARD_ORDER = {
+    "wins": "games_won DESC, rounds_won DESC",
+    "rounds": "rounds_won DESC, games_won DESC",
+}
+CARD_ORDER = {
+    "played": "times_played DESC",
+    "wins": "times_won DESC",
+    "win_rate": "times_won * 1.0 / times_played DESC, times_played DESC",
+}
+
+# Rows for the players table from a room encoded with GameRoom.to_storage
+def _player_rows(game_id, stored, now):
+    ready = stored['ready_players']
+    return [
+        (game_id, name, score, name in ready, now)
+        for name, score in stored['players'].items()
+    ]
+
+
+# Leaderboards and card rankings read these instead of sorting whole tables
+STATS_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_player_stats_wins ON player_stats (games_won DESC, rounds_won DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_player_stats_rounds ON player_stats (rounds_won DESC, games_won DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_card_stats_played ON card_stats (pack, times_played DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_card_stats_won ON card_stats (pack, times_won DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_card_stats_all_played ON card_stats (times_played DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_card_stats_all_won ON card_stats (times_won DESC)',
+)
+
+# Stats readers shared by both backends; `placeholder` is the driver's
+# parameter marker
+def _leaderboard_sql(order, placeholder):
+    return f'''
+        SELECT player_name, games_played, games_won, rounds_won FROM player_stats
+        ORDER BY {LEADERBOARD_ORDER[order]} LIMIT {placeholder} OFFSET {placeholder}
+    '''
+
+def _card_stats_sql(order, pack, placeholder):
+    where = [f'times_played >= {placeholder}']
+    if pack is not None:
+        where.append(f'pack = {placeholder}')
+    return f'''
+        SELECT card_id, pack, times_played, times_won FROM card_stats
+        WHERE {' AND '.join(where)}
+        ORDER BY {CARD_ORDER[order]} LIMIT {placeholder}
+    '''
+
+PACK_STATS_SQL = '''
+    SELECT pack, COUNT(*), SUM(times_played), SUM(times_won) FROM card_stats
+    GROUP BY pack ORDER BY pack
+'''
+
+def _player_stat(row):
+    return {"player": row[0], "games_played": row[1], "games_won": row[2], "rounds_won": row[3]}
+
+def _card_stat(row):
+    return {
+        "card_id": row[0], "pack": row[1], "times_played": row[2], "times_won": row[3],
+        "win_rate": round(row[3] / row[2], 4) if row[2] else 0.0,
+    }
+
+def _pack_stat(row):
+    return {
+        "pack": row[0], "cards": row[1], "times_played": row[2], "times_won": row[3],
+        "win_rate": round(row[3] / row[2], 4) if row[2] else 0.0,
+    }
+
+
+class SQLiteStorage:
+    # One long-lived connection per process, shared by every save/load
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.connection = None
+        self.lock = threading.RLock()
+
+    def get_connection(self):
+        with self.lock:
+            if self.connection is None:
+                os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                # WAL lets readers proceed while a batch is being committed
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                self.connection = conn
+            return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def init_db(self):
+        # Ensure data directory permissions are restricted
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.name != 'nt':  # Not Windows
+            os.chmod(directory, 0o700)
+
+        conn = self.get_connection()
+        # Set secure file permissions for the database
+        if os.name != 'nt':  # Not Windows
+            os.chmod(self.path, 0o600)
+
+        c = conn.cursor()
+
+        # Create games table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS games (
+                game_id TEXT PRIMARY KEY,
+                state TEXT,
+                round INTEGER,
+                black_card TEXT,
+                card_czar TEXT,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                game_data TEXT
+            )
+        ''')
+
+        # Create players table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS players (
+                game_id TEXT,
+                player_name TEXT,
+                score INTEGER,
+                is_ready BOOLEAN,
+                created_at TIMESTAMP,
+                FOREIGN KEY (game_id) REFERENCES games (game_id),
+                PRIMARY KEY (game_id, player_name)
+            )
+        ''')
+
+        # Append-only event log and compacted snapshots (CAH_PERSISTENCE_MODE=events)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS game_events (
+                game_id TEXT,
+                seq INTEGER,
+                event_type TEXT,
+                payload TEXT,
+                created_at TIMESTAMP,
+                PRIMARY KEY (game_id, seq)
+            )
+        ''')
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS game_snapshots (
+                game_id TEXT,
+                seq INTEGER,
+                game_data TEXT,
+                created_at TIMESTAMP,
+                PRIMARY KEY (game_id, seq)
+            )
+        ''')
+
+        # Chat history, written in batches and read back for replay on join
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                game_id TEXT,
+                player TEXT,
+                message TEXT,
+                created_at TIMESTAMP
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_game ON chat_messages (game_id, id)')
+
+        # Cross-game aggregates, added to as rounds and games finish
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS player_stats (
+                player_name TEXT PRIMARY KEY,
+                games_played INTEGER NOT NULL DEFAULT 0,
+                games_won INTEGER NOT NULL DEFAULT 0,
+                rounds_won INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS card_stats (
+                card_id INTEGER PRIMARY KEY,
+                pack INTEGER,
+                times_played INTEGER NOT NULL DEFAULT 0,
+                times_won INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for index in STATS_INDEXES:
+            c.execute(index)
+
+        # Used by delete_old_games to find expired games without a table scan
+        c.execute('CREATE INDEX IF NOT EXISTS idx_games_updated_at ON games (updated_at)')
+
+        conn.commit()
+
+    def _write_game(self, c, game_id, game_data, now):
+        game_data_copy = game_data.to_storage()
+        game_json = json.dumps(game_data_copy)
+
+        # Save game state. With the Redis room store several workers may
+        # flush the same room; an older copy never replaces a newer one.
+        c.execute('''
+            INSERT INTO games
+            (game_id, state, round, black_card, card_czar, game_data, updated_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (game_id) DO UPDATE SET
+                state = excluded.state, round = excluded.round, black_card = excluded.black_card,
+                card_czar = excluded.card_czar, game_data = excluded.game_data, updated_at = excluded.updated_at
+            WHERE coalesce(json_extract(excluded.game_data, '$.event_seq'), 0)
+                >= coalesce(json_extract(games.game_data, '$.event_seq'), 0)
+        ''', (
+            game_id,
+            game_data_copy['state'],
+            game_data_copy['round'],
+            game_data_copy['black_card'],
+            game_data_copy['card_czar'],
+            game_json,
+            now,
+            now
+        ))
+        if c.rowcount == 0:
+            return game_json
+
+        # Save players
+        c.executemany('''
+            INSERT OR REPLACE INTO players
+            (game_id, player_name, score, is_ready, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', _player_rows(game_id, game_data_copy, now))
+        return game_json
+
+    def save_games(self, games):
+        now = datetime.now().isoformat()
+        with self.lock:
+            conn = self.get_connection()
+            c = conn.cursor()
+            try:
+                for game_id, game_data in games:
+                    self._write_game(c, game_id, game_data, now)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def save_event_batch(self, events, snapshots=(), touched=()):
+        now = datetime.now().isoformat()
+        with self.lock:
+            conn = self.get_connection()
+            c = conn.cursor()
+            try:
+                c.executemany('''
+                    INSERT OR REPLACE INTO game_events
+                    (game_id, seq, event_type, payload, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', events)
+
+                for game_id, game_data in snapshots:
+                    seq = game_data.event_seq
+                    game_json = self._write_game(c, game_id, game_data, now)
+                    c.execute('''
+                        INSERT OR REPLACE INTO game_snapshots (game_id, seq, game_data, created_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', (game_id, seq, game_json, now))
+                    # Keep the first snapshot (for replays) and the latest one
+                    c.execute('''
+                        DELETE FROM game_snapshots
+                        WHERE game_id = ? AND seq < ?
+                        AND seq > (SELECT MIN(seq) FROM game_snapshots WHERE game_id = ?)
+                    ''', (game_id, seq, game_id))
+
+                c.executemany('''
+                    UPDATE games SET state = ?, round = ?, updated_at = ? WHERE game_id = ?
+                ''', [
+                    (game_data.state, game_data.round, now, game_id)
+                    for game_id, game_data in touched
+                ])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def save_chat_messages(self, rows):
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                conn.executemany('''
+                    INSERT INTO chat_messages (game_id, player, message, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def load_chat_messages(self, game_id, limit):
+        with self.lock:
+            c = self.get_connection().cursor()
+            c.execute('''
+                SELECT player, message FROM chat_messages
+                WHERE game_id = ? ORDER BY id DESC LIMIT ?
+            ''', (game_id, limit))
+            rows = c.fetchall()
+        return [{"player": player, "message": message} for player, message in reversed(rows)]
+
+    # player_rows: (name, games_played, games_won, rounds_won) deltas
+    # card_rows: (card_id, pack, times_played, times_won) deltas
+    def save_stats(self, player_rows, card_rows):
+        now = datetime.now().isoformat()
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                conn.executemany('''
+                    INSERT INTO player_stats (player_name, games_played, games_won, rounds_won, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (player_name) DO UPDATE SET
+                        games_played = games_played + excluded.games_played,
+                        games_won = games_won + excluded.games_won,
+                        rounds_won = rounds_won + excluded.rounds_won,
+                        updated_at = excluded.updated_at
+                ''', [row + (now,) for row in player_rows])
+                conn.executemany('''
+                    INSERT INTO card_stats (card_id, pack, times_played, times_won)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (card_id) DO UPDATE SET
+                        times_played = times_played + excluded.times_played,
+                        times_won = times_won + excluded.times_won
+                ''', card_rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _query(self, sql, params):
+        with self.lock:
+            c = self.get_connection().cursor()
+            c.execute(sql, params)
+            return c.fetchall()
+
+    def load_leaderboard(self, order, limit, offset=0):
+        return [_player_stat(row) for row in self._query(_leaderboard_sql(order, '?'), (limit, offset))]
+
+    def load_player_stats(self, name):
+        rows = self._query('SELECT player_name, games_played, games_won, rounds_won FROM player_stats WHERE player_name = ?', (name,))
+        return _player_stat(rows[0]) if rows else None
+
+    def load_card_stats(self, order, limit, pack=None, min_played=1):
+        params = (min_played,) + ((pack,) if pack is not None else ()) + (limit,)
+        return [_card_stat(row) for row in self._query(_card_stats_sql(order, pack, '?'), params)]
+
+    def load_pack_stats(self):
+        return [_pack_stat(row) for row in self._query(PACK_STATS_SQL, ())]
+
+    def load_snapshot(self, game_id, latest=True):
+        order = 'DESC' if latest else 'ASC'
+        with self.lock:
+            c = self.get_connection().cursor()
+            c.execute(f'SELECT seq, game_data FROM game_snapshots WHERE game_id = ? ORDER BY seq {order} LIMIT 1', (game_id,))
+            result = c.fetchone()
+
+        if result:
+            return result[0], json.loads(result[1])
+        return None
+
+    def load_events(self, game_id, after_seq=0):
+        with self.lock:
+            c = self.get_connection().cursor()
+            c.execute('''
+                SELECT seq, event_type, payload FROM game_events
+                WHERE game_id = ? AND seq > ? ORDER BY seq
+            ''', (game_id, after_seq))
+            rows = c.fetchall()
+        return [(seq, event_type, json.loads(payload)) for seq, event_type, payload in rows]
+
+    def load_game(self, game_id):
+        with self.lock:
+            c = self.get_connection().cursor()
+            c.execute('SELECT game_data FROM games WHERE game_id = ?', (game_id,))
+            result = c.fetchone()
+
+        if result:
+            return json.loads(result[0])
+        return None
+
+    # updated_at is an ISO timestamp, so a plain comparison can use
+    # idx_games_updated_at instead of scanning every row through datetime()
+    def delete_old_games(self, days=7):
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        with self.lock:
+            conn = self.get_connection()
+            c = conn.cursor()
+
+            for table in ('players', 'game_events', 'game_snapshots', 'chat_messages'):
+                c.execute(f'''
+                    DELETE FROM {table} WHERE game_id IN (
+                        SELECT game_id FROM games WHERE updated_at < ?
+                    )
+                ''', (cutoff,))
+
+            c.execute('DELETE FROM games WHERE updated_at < ?', (cutoff,))
+            deleted = c.rowcount
+
+            conn.commit()
+        return deleted
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == 'postgres':
+        from postgres_storage import PostgresStorage
+        return PostgresStorage(os.environ['DATABASE_URL'])
+    return SQLiteStorage()
+
+
+# The backend every save and load below goes through
+storage = create_storage()
+
+def close_db():
+    storage.close()
+
 def init_db():
-    # Ensure data directory permissions are restricted
-    os.makedirs(DATA_DIR, mode=0o700, exist_ok=True)
-    if os.name != 'nt':  # Not Windows
-        os.chmod(DATA_DIR, 0o700)
-    
-    conn = sqlite3.connect(DB_PATH)
-    # Set secure file permissions for the database
-    if os.name != 'nt':  # Not Windows
-        os.chmod(DB_PATH, 0o600)
-    
-    c = conn.cursor()
-    
-    # Create games table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS games (
-            game_id TEXT PRIMARY KEY,
-            state TEXT,
-            round INTEGER,
-            black_card TEXT,
-            card_czar TEXT,
-            created_at TIMESTAMP,
-            updated_at TIMESTAMP,
-            game_data TEXT
-        )
-    ''')
-    
-    # Create players table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS players (
-            game_id TEXT,
-            player_name TEXT,
-            score INTEGER,
-            is_ready BOOLEAN,
-            created_at TIMESTAMP,
-            FOREIGN KEY (game_id) REFERENCES games (game_id),
-            PRIMARY KEY (game_id, player_name)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    storage.init_db()
 
 def save_game(game_id, game_data):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    now = datetime.now().isoformat()
-    
-    # Convert sets to lists for JSON serialization
-    game_data_copy = game_data.copy()
-    for key, value in game_data_copy.items():
-        if isinstance(value, set):
-            game_data_copy[key] = list(value)
-    
-    # Save game state
-    c.execute('''
-        INSERT OR REPLACE INTO games 
-        (game_id, state, round, black_card, card_czar, game_data, updated_at, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, coalesce((SELECT created_at FROM games WHERE game_id = ?), ?))
-    ''', (
-        game_id,
-        game_data_copy['state'],
-        game_data_copy['round'],
-        game_data_copy['black_card'],
-        game_data_copy['card_czar'],
-        json.dumps(game_data_copy),
-        now,
-        game_id,
-        now
-    ))
-    
-    # Save players
-    c.executemany('''
-        INSERT OR REPLACE INTO players 
-        (game_id, player_name, score, is_ready, created_at)
-        VALUES (?, ?, ?, ?, ?)
-    ''', [
-        (game_id, name, data, name in (game_data_copy['ready_players'] if isinstance(game_data_copy['ready_players'], list) else []), now)
-        for name, data in game_data_copy['players'].items()
-    ])
-    
-    conn.commit()
-    conn.close()
+    save_games([(game_id, game_data)])
+
+# Write several games in a single transaction
+@timed("save_games")
+def save_games(games):
+    storage.save_games(games)
+
+# Write a batch of events, snapshots and game metadata in a single transaction.
+# events: (game_id, seq, event_type, payload_json, created_at)
+# snapshots: (game_id, game_data) - written in full, older snapshots compacted
+# touched: (game_id, game_data) - only state/round/updated_at are refreshed
+@timed("save_event_batch")
+def save_event_batch(events, snapshots=(), touched=()):
+    storage.save_event_batch(events, snapshots, touched)
+
+# rows: (game_id, player, message, created_at)
+@timed("save_chat_messages")
+def save_chat_messages(rows):
+    storage.save_chat_messages(rows)
+
+# The latest `limit` messages of a game, oldest first
+@timed("load_chat_messages")
+def load_chat_messages(game_id, limit):
+    return storage.load_chat_messages(game_id, limit)
+
+@timed("save_stats")
+def save_stats(player_rows, card_rows):
+    storage.save_stats(player_rows, card_rows)
+
+@timed("load_leaderboard")
+def load_leaderboard(order="wins", limit=20, offset=0):
+    return storage.load_leaderboard(order, limit, offset)
+
+@timed("load_player_stats")
+def load_player_stats(name):
+    return storage.load_player_stats(name)
+
+@timed("load_card_stats")
+def load_card_stats(order="played", limit=20, pack=None, min_played=1):
+    return storage.load_card_stats(order, limit, pack, min_played)
+
+@timed("load_pack_stats")
+def load_pack_stats():
+    return storage.load_pack_stats()
+
+@timed("load_snapshot")
+def load_snapshot(game_id, latest=True):
+    return storage.load_snapshot(game_id, latest)
+
+@timed("load_events")
+def load_events(game_id, after_seq=0):
+    return storage.load_events(game_id, after_seq)
 
+@timed("load_game")
 def load_game(game_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT game_data FROM games WHERE game_id = ?', (game_id,))
-    result = c.fetchone()
-    
-    if result:
-        game_data = json.loads(result[0])
-        conn.close()
-        return game_data
-    
-    conn.close()
-    return None
+    return storage.load_game(game_id)
 
+# Delete games (and their players, events, snapshots and chat) not updated
+# for `days` days
+@timed("delete_old_games")
 def delete_old_games(days=7):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''
-        DELETE FROM players WHERE game_id IN (
-            SELECT game_id FROM games 
-            WHERE datetime(updated_at) < datetime('now', '-' || ? || ' days')
-        )
-    ''', (days,))
-    
-    c.execute('''
-        DELETE FROM games 
-        WHERE datetime(updated_at) < datetime('now', '-' || ? || ' days')
-    ''', (days,))
-    
-    conn.commit()
-    conn.close()
+    return storage.delete_old_games(days)
@@ -0,0 +1,99 @@
+import random
+from array import array
+
+# Reshuffle policies for when the draw pile runs out:
+#   "discard" - shuffle the discard pile back in (cards in hands stay out)
+#   "full"    - start a fresh permutation of the whole source
+RESHUFFLE_DISCARD = "discard"
+RESHUFFLE_FULL = "full"
+
+
+class Deck:
+    # A shuffled permutation of card IDs with a draw cursor and a discard
+    # pile. Draws and discards are O(1) per card. The permutation is derived
+    # from (seed, generation), so only the cursor, the discard pile and - for
+    # recycled piles - the reshuffled order need to be stored.
+
+    __slots__ = ("source", "seed", "generation", "cursor", "order", "discard", "policy", "_recycled")
+
+    def __init__(self, source, seed=None, policy=RESHUFFLE_DISCARD):
+        self.source = source
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.generation = 0
+        self.cursor = 0
+        self.order = None
+        self.discard = array('I')
+        self.policy = policy
+        self._recycled = False
+
+    def _rng(self):
+        return random.Random((self.seed << 16) + self.generation)
+
+    def _materialize(self):
+        order = array('I', self.source)
+        self._rng().shuffle(order)
+        self.order = order
+
+    def _reshuffle(self):
+        self.generation += 1
+        self.cursor = 0
+        if self.policy == RESHUFFLE_DISCARD:
+            order = self.discard
+            self._rng().shuffle(order)
+            self.order = order
+            self.discard = array('I')
+            self._recycled = True
+        else:
+            self.discard = array('I')
+            self._recycled = False
+            self._materialize()
+
+    @property
+    def remaining(self):
+        if self.order is None:
+            return len(self.source) - self.cursor
+        return len(self.order) - self.cursor
+
+    def draw(self, count=1):
+        if self.order is None:
+            self._materialize()
+        cards = []
+        while len(cards) < count:
+            if self.cursor >= len(self.order):
+                self._reshuffle()
+                if not self.order:
+                    break
+            take = min(count - len(cards), len(self.order) - self.cursor)
+            cards.extend(self.order[self.cursor:self.cursor + take])
+            self.cursor += take
+        return cards
+
+    def draw_one(self):
+        cards = self.draw(1)
+        return cards[0] if cards else None
+
+    def discard_cards(self, card_ids):
+        self.discard.extend(card_ids)
+
+    def to_dict(self):
+        data = {
+            "seed": self.seed,
+            "generation": self.generation,
+            "cursor": self.cursor,
+            "discard": self.discard.tolist(),
+            "policy": self.policy,
+        }
+        if self._recycled:
+            data["order"] = self.order.tolist()
+        return data
+
+    @classmethod
+    def from_dict(cls, data, source):
+        deck = cls(source, seed=data["seed"], policy=data.get("policy", RESHUFFLE_DISCARD))
+        deck.generation = data.get("generation", 0)
+        deck.cursor = data.get("cursor", 0)
+        deck.discard = array('I', data.get("discard", []))
+        if "order" in data:
+            deck.order = array('I', data["order"])
+            deck._recycled = True
+        return deck
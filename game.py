@@ -0,0 +1,213 @@
+from array import array
+
+from cards import get_catalog
+from deck import Deck
+from model import GameRoom
+
+# Game state changes. Every change to a room is described by an event
+# (a type and a small JSON payload) and applied by one of the reducers below,
+# so the same code path serves live play and rebuilding a room from the
+# event log. Anything random is decided by the caller and put in the payload,
+# except deck draws, which are deterministic for a given deck state.
+
+HAND_SIZE = 5
+MIN_HAND_SIZE = 3  # enough for the largest pick
+MAX_HAND_SIZE = 15
+
+
+# packs: indexes of the card packs to play with, or None for all of them.
+# ai_czar: every player plays and the AI czar picks the winner.
+def new_game(packs=None, hand_size=HAND_SIZE, ai_czar=False):
+    catalog = get_catalog()
+    packs = sorted(set(packs)) if packs is not None else None
+    room = GameRoom(Deck(catalog.white_source(packs)), Deck(catalog.black_source(packs)), packs, hand_size)
+    room.ai_czar = ai_czar
+    return room
+
+
+# White card IDs of a submission; rooms saved before multi-pick stored text
+def submitted_cards(submission):
+    return [] if isinstance(submission, str) else submission
+
+
+# Why a round cannot be started, or None if it can
+def start_error(room):
+    if room.game_winner is not None:
+        return "The game is over"
+    if room.phase is not None:
+        return "A round is already in progress"
+    if len(room.players) < room.min_players:
+        return f"Need at least {room.min_players} players to start"
+    if not all(player in room.ready_players for player in room.players):
+        return "All players must be ready to start"
+    return None
+
+
+# Why a submission cannot be accepted, or None if it can
+def submission_error(room, player_name, cards):
+    if room.state != "in_progress" or room.phase != "submitting":
+        return "Cards can only be played while the round is open"
+    if player_name not in room.players:
+        return "You are not in this game"
+    if player_name == room.card_czar:
+        return "The card czar does not play cards"
+    if player_name in room.submissions:
+        return "You have already played this round"
+    pick = get_catalog().pick(room.black_card_id)
+    if not isinstance(cards, list) or len(cards) != pick:
+        return f"This black card needs {pick} card{'s' if pick > 1 else ''}"
+    # 5.0 and True compare equal to card IDs in the hand but cannot be stored
+    if not all(type(card_id) is int for card_id in cards):
+        return "Those cards are not in your hand"
+    hand = room.player_hands.get(player_name, ())
+    if len(set(cards)) != len(cards) or not all(card_id in hand for card_id in cards):
+        return "Those cards are not in your hand"
+    return None
+
+
+# Why a winner cannot be picked by judge_name, or None if it can
+def judge_error(room, judge_name, winner):
+    if room.state != "in_progress" or room.phase != "judging":
+        return "A winner can only be picked once every card is in"
+    if room.ai_czar:
+        return "The AI czar picks the winner"
+    if judge_name is None or judge_name != room.card_czar:
+        return "Only the card czar picks the winner"
+    if winner not in room.players or winner not in room.submissions:
+        return "Unknown winner"
+    return None
+
+
+# Played cards go to the discard pile when the round is over
+def _discard_submissions(room):
+    for submission in room.submissions.values():
+        room.white_deck.discard_cards(submitted_cards(submission))
+    room.submissions = {}
+
+
+def _player_joined(room, payload):
+    player_name = payload["player"]
+    # Check if player was previously disconnected
+    if player_name in room.disconnected_players:
+        room.players[player_name] = room.disconnected_players.pop(player_name)
+    elif player_name not in room.players:
+        room.players[player_name] = 0
+
+
+def _player_left(room, payload):
+    player_name = payload["player"]
+    # Keep the player's score so they can rejoin
+    if player_name in room.players:
+        room.disconnected_players[player_name] = room.players.pop(player_name)
+    # A ready player who is gone would keep everyone else waiting
+    if player_name in room.ready_players:
+        room.ready_players.remove(player_name)
+
+
+def _spectator_joined(room, payload):
+    if payload["spectator"] not in room.spectators:
+        room.spectators.append(payload["spectator"])
+
+
+def _player_ready(room, payload):
+    player_name = payload["player"]
+    if payload["is_ready"] and player_name not in room.ready_players:
+        room.ready_players.append(player_name)
+    elif not payload["is_ready"] and player_name in room.ready_players:
+        room.ready_players.remove(player_name)
+
+
+def _round_started(room, payload):
+    if room.black_card_id is not None:
+        room.black_deck.discard_cards([room.black_card_id])
+    black_card_id = room.black_deck.draw_one()
+    _discard_submissions(room)
+
+    room.state = "in_progress"
+    room.black_card_id = black_card_id
+    room.phase = "submitting"
+    room.round_timer = payload.get("deadline")
+    if payload.get("card_czar"):
+        room.card_czar = payload["card_czar"]
+    payload["black_card_id"] = black_card_id
+
+
+def _judging_started(room, payload):
+    room.phase = "judging"
+    room.round_timer = payload.get("deadline")
+
+
+# A round that ran out of time without anything to judge
+def _round_skipped(room, payload):
+    _discard_submissions(room)
+    room.phase = None
+    room.round_timer = None
+    if payload.get("waiting"):
+        # Not enough players left to go on; back to the lobby
+        room.state = "waiting"
+        room.ready_players = []
+
+
+# Top the player's hand back up to the room's hand size
+def _cards_drawn(room, payload):
+    hands = room.player_hands
+    if not payload.get("refill"):
+        # Logged before hands were kept: the whole hand was dealt again
+        if hands.get(payload["player"]):
+            room.white_deck.discard_cards(hands[payload["player"]])
+        hands[payload["player"]] = array('I')
+    hand = hands.get(payload["player"])
+    if hand is None:
+        hand = hands[payload["player"]] = array('I')
+    new_cards = room.white_deck.draw(max(0, room.hand_size - len(hand)))
+    hand.extend(new_cards)
+    payload["cards"] = new_cards
+
+
+# The cards have been checked against the hand and the black card's pick
+def _card_submitted(room, payload):
+    if "cards" not in payload:
+        # Logged before multi-pick: a single card text
+        room.submissions[payload["player"]] = payload["card"]
+        return
+    hand = room.player_hands[payload["player"]]
+    for card_id in payload["cards"]:
+        hand.remove(card_id)
+    room.submissions[payload["player"]] = array('I', payload["cards"])
+
+
+def _round_judged(room, payload):
+    room.players[payload["winner"]] += 1
+    room.round += 1
+    _discard_submissions(room)
+    room.phase = None
+    room.round_timer = None
+
+    # Check if we've reached max rounds
+    if room.round > room.max_rounds:
+        room.game_winner = max(room.players.items(), key=lambda x: x[1])[0]
+
+
+def _game_over(room, payload):
+    room.game_winner = payload["winner"]
+
+
+REDUCERS = {
+    "player_joined": _player_joined,
+    "player_left": _player_left,
+    "spectator_joined": _spectator_joined,
+    "player_ready": _player_ready,
+    "round_started": _round_started,
+    "judging_started": _judging_started,
+    "round_skipped": _round_skipped,
+    "cards_drawn": _cards_drawn,
+    "card_submitted": _card_submitted,
+    "round_judged": _round_judged,
+    "game_over": _game_over,
+}
+
+
+def apply_event(room, event_type, payload):
+    REDUCERS[event_type](room, payload)
+    room.event_seq += 1
+    return room.event_seq
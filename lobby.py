@@ -0,0 +1,157 @@
+import os
+
+from cards import get_catalog
+
+# Seconds between lobby delta broadcasts; changes in between are coalesced
+LOBBY_INTERVAL = float(os.getenv('CAH_LOBBY_INTERVAL', '1.0'))
+LOBBY_PAGE_SIZE = 20
+LOBBY_MAX_PAGE_SIZE = 100
+# Events that can change how a room looks in the lobby
+LOBBY_EVENTS = {"player_joined", "player_left", "round_started", "round_skipped", "round_judged", "game_over"}
+
+
+def pack_set(room):
+    packs = room.packs
+    if packs is None:
+        return "all"
+    if packs == get_catalog().official_packs():
+        return "official"
+    return "custom"
+
+
+class LobbyIndex:
+    # Open rooms this worker serves, indexed by state, pack set and player
+    # count and updated from the game events as they happen. Listing a
+    # page only looks at the smallest matching index. Subscribers get the
+    # changes batched every LOBBY_INTERVAL seconds as one emit to the
+    # "lobby" socket room, however many of them there are.
+
+    def __init__(self, interval=LOBBY_INTERVAL):
+        self.interval = interval
+        self.rooms = {}  # game_id -> summary
+        self.by_state = {}
+        self.by_packs = {}
+        self.by_players = {}
+        self.listed = 0  # listing order, for stable pagination
+        self.version = 0
+        self.pending = {}  # game_id -> summary, or None once removed
+        self.running = False
+
+    @staticmethod
+    def _add(index, key, game_id):
+        index.setdefault(key, set()).add(game_id)
+
+    @staticmethod
+    def _discard(index, key, game_id):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.discard(game_id)
+            if not bucket:
+                del index[key]
+
+    def _unindex(self, game_id, summary):
+        self._discard(self.by_state, summary["state"], game_id)
+        self._discard(self.by_packs, summary["packs"], game_id)
+        self._discard(self.by_players, summary["players"], game_id)
+
+    def summary(self, game_id, room, listed):
+        return {
+            "id": game_id,
+            "state": room.state,
+            "players": len(room.players),
+            "min_players": room.min_players,
+            "round": room.round,
+            "max_rounds": room.max_rounds,
+            "packs": pack_set(room),
+            "pack_count": len(room.packs) if room.packs is not None else len(get_catalog().pack_names),
+            "hand_size": room.hand_size,
+            "listed": listed,
+        }
+
+    # Rooms are listed while someone is in them and the game is not over
+    def update(self, game_id, room):
+        if not room.players or room.game_winner is not None:
+            return self.remove(game_id)
+        current = self.rooms.get(game_id)
+        if current is None:
+            self.listed += 1
+            listed = self.listed
+        else:
+            listed = current["listed"]
+        summary = self.summary(game_id, room, listed)
+        if summary == current:
+            return False
+        if current is not None:
+            self._unindex(game_id, current)
+        self.rooms[game_id] = summary
+        self._add(self.by_state, summary["state"], game_id)
+        self._add(self.by_packs, summary["packs"], game_id)
+        self._add(self.by_players, summary["players"], game_id)
+        self.pending[game_id] = summary
+        return True
+
+    def remove(self, game_id):
+        current = self.rooms.pop(game_id, None)
+        if current is None:
+            return False
+        self._unindex(game_id, current)
+        self.pending[game_id] = None
+        return True
+
+    def query(self, state=None, packs=None, min_players=None, max_players=None, offset=0, limit=LOBBY_PAGE_SIZE):
+        candidates = []
+        if state is not None:
+            candidates.append(self.by_state.get(state, set()))
+        if packs is not None:
+            candidates.append(self.by_packs.get(packs, set()))
+        if min_players is not None or max_players is not None:
+            low = min_players or 0
+            high = max_players if max_players is not None else float('inf')
+            candidates.append(set().union(*(ids for count, ids in self.by_players.items() if low <= count <= high)))
+        if candidates:
+            candidates.sort(key=len)
+            matches = candidates[0].intersection(*candidates[1:])
+        else:
+            matches = self.rooms.keys()
+        summaries = sorted((self.rooms[game_id] for game_id in matches), key=lambda summary: summary["listed"])
+        limit = max(1, min(limit, LOBBY_MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        return {
+            "rooms": summaries[offset:offset + limit],
+            "total": len(summaries),
+            "offset": offset,
+            "limit": limit,
+            "version": self.version,
+        }
+
+    # Changes since the last flush, as one delta with the new version
+    def flush(self):
+        if not self.pending:
+            return None
+        self.version += 1
+        changes = [
+            {"op": "remove", "id": game_id} if summary is None else {"op": "upsert", "room": summary}
+            for game_id, summary in self.pending.items()
+        ]
+        self.pending = {}
+        return {"version": self.version, "changes": changes}
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.interval)
+            delta = self.flush()
+            if delta is not None:
+                socketio.emit("lobby_delta", delta, room="lobby")
+
+    def metrics(self):
+        return {
+            "listed": len(self.rooms),
+            "version": self.version,
+            "pending": len(self.pending),
+        }
@@ -0,0 +1,51 @@
+import json
+import logging
+import os
+import sys
+
+# Log level for the app (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv('CAH_LOG_LEVEL', 'INFO').upper()
+# "text" for people, "json" for one object per line
+LOG_FORMAT = os.getenv('CAH_LOG_FORMAT', 'text')
+# Socket.IO / Engine.IO packet logging; very verbose, off unless asked for
+SOCKETIO_LOG = os.getenv('CAH_SOCKETIO_LOG', '0') == '1'
+
+# Structured fields go in extra={"fields": {...}}. Messages use %-style
+# arguments so nothing is formatted when the level is disabled; build
+# field dicts on hot paths only under log.isEnabledFor(...).
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
@@ -0,0 +1,115 @@
+import logging
+import os
+import sys
+import time
+
+from database import delete_old_games
+
+# Rooms with no connected sockets are written to the database and dropped
+# from memory after this many seconds; they are reloaded on next use
+HIBERNATE_AFTER = float(os.getenv('CAH_HIBERNATE_AFTER', '600'))
+# Seconds between maintenance passes
+MAINTENANCE_INTERVAL = float(os.getenv('CAH_MAINTENANCE_INTERVAL', '60'))
+# Games not updated for this many days are deleted from the database
+RETENTION_DAYS = float(os.getenv('CAH_RETENTION_DAYS', '7'))
+# Seconds between retention purges
+PURGE_INTERVAL = float(os.getenv('CAH_PURGE_INTERVAL', '3600'))
+# Seconds after startup before the first maintenance pass
+STARTUP_DELAY = float(os.getenv('CAH_MAINTENANCE_DELAY', '30'))
+# How many rooms to walk when estimating memory per room
+MEMORY_SAMPLE = 20
+
+log = logging.getLogger(__name__)
+
+
+def deep_sizeof(obj, seen=None):
+    # Rough recursive size of a room: dicts, lists, sets, decks and arrays
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+class RoomReaper:
+    # One background task that hibernates idle rooms and periodically
+    # purges expired games from the database.
+
+    def __init__(self, rooms, sessions, persistence, hibernate_after=HIBERNATE_AFTER,
+                 interval=MAINTENANCE_INTERVAL, retention_days=RETENTION_DAYS, purge_interval=PURGE_INTERVAL,
+                 startup_delay=STARTUP_DELAY):
+        self.rooms = rooms
+        self.sessions = sessions
+        self.persistence = persistence
+        self.hibernate_after = hibernate_after
+        self.interval = interval
+        self.retention_days = retention_days
+        self.purge_interval = purge_interval
+        self.startup_delay = startup_delay
+        self.running = False
+        self.last_purge = None
+        self.hibernated = 0
+        self.purged = 0
+
+    def hibernate_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        hibernated = 0
+        for game_id in self.rooms.resident_ids():
+            if self.sessions.connected_count(game_id) or self.sessions.has_pending(game_id):
+                continue
+            if now - self.rooms.last_access.get(game_id, now) < self.hibernate_after:
+                continue
+            # Only drop the room once its latest state is safely written
+            self.persistence.flush([game_id])
+            if game_id in self.persistence.dirty:
+                continue
+            self.rooms.evict(game_id)
+            hibernated += 1
+        self.hibernated += hibernated
+        return hibernated
+
+    def purge_expired(self):
+        deleted = delete_old_games(self.retention_days)
+        self.purged += deleted
+        self.last_purge = time.monotonic()
+        return deleted
+
+    def run_once(self):
+        self.hibernate_idle()
+        if self.last_purge is None or time.monotonic() - self.last_purge >= self.purge_interval:
+            self.purge_expired()
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        socketio.sleep(self.startup_delay)
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error("Error in room maintenance: %s", e)
+            socketio.sleep(self.interval)
+
+    def metrics(self):
+        rooms = list(self.rooms.resident_rooms())
+        sample = rooms[:MEMORY_SAMPLE]
+        per_room = sum(deep_sizeof(room) for room in sample) // len(sample) if sample else 0
+        return {
+            "resident": len(rooms),
+            "approx_bytes_per_room": per_room,
+            "approx_bytes": per_room * len(rooms),
+            "hibernated": self.hibernated,
+            "purged": self.purged,
+        }
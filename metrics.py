@@ -0,0 +1,208 @@
+import bisect
+import functools
+import json
+import os
+import signal
+import time
+from collections import Counter
+
+# Collect handler and database timings (on unless CAH_METRICS=0)
+METRICS_ENABLED = os.getenv('CAH_METRICS', '1') != '0'
+# Allow the sampling profiler to be switched on through /metrics/profile
+PROFILER_ENABLED = os.getenv('CAH_PROFILER', '0') == '1'
+PROFILE_INTERVAL = float(os.getenv('CAH_PROFILE_INTERVAL', '0.005'))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+HELP = {
+    "cah_socket_events_total": ("counter", "Socket.IO events handled"),
+    "cah_socket_errors_total": ("counter", "Socket.IO handlers that raised"),
+    "cah_socket_event_seconds": ("histogram", "Socket.IO handler latency"),
+    "cah_socket_payload_bytes": ("histogram", "Size of incoming Socket.IO payloads"),
+    "cah_socket_outbound_bytes": ("histogram", "Size of encoded outgoing Socket.IO packets"),
+    "cah_socket_rate_limited_total": ("counter", "Socket.IO events rejected by the rate limiter"),
+    "cah_socket_dropped_total": ("counter", "Outgoing packets dropped for slow consumers"),
+    "cah_db_calls_total": ("counter", "Database calls"),
+    "cah_db_errors_total": ("counter", "Database calls that raised"),
+    "cah_db_seconds": ("histogram", "Database call latency"),
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    # Counters and histograms keyed by (name, label value); gauges are
+    # callbacks read at scrape time so nothing is tracked between scrapes
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, label, value=1):
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, label, value, buckets=LATENCY_BUCKETS):
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def gauge(self, name, description, callback):
+        self.gauges[name] = (description, callback)
+
+    # Prometheus text exposition format
+    def render(self):
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described and name in HELP:
+                kind, text = HELP[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, label), value in sorted(self.counters.items()):
+            describe(name)
+            lines.append(f'{name}{{{label}}} {value}')
+        for (name, label), histogram in sorted(self.histograms.items()):
+            describe(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        for name, (description, callback) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {callback()}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _payload_size(data):
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    try:
+        return len(json.dumps(data, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return 0
+
+
+# Decorator for Socket.IO handlers: call count, latency, payload size, errors
+def instrumented(event):
+    label = f'event="{event}"'
+
+    def decorator(handler):
+        if not METRICS_ENABLED:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                registry.inc("cah_socket_errors_total", label)
+                raise
+            finally:
+                registry.observe("cah_socket_event_seconds", label, time.perf_counter() - start)
+                registry.inc("cah_socket_events_total", label)
+                if args:
+                    registry.observe("cah_socket_payload_bytes", label, _payload_size(args[0]), SIZE_BUCKETS)
+        return wrapper
+    return decorator
+
+
+# Decorator for database calls: call count, latency, errors
+def timed(operation):
+    label = f'op="{operation}"'
+
+    def decorator(function):
+        if not METRICS_ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                registry.inc("cah_db_errors_total", label)
+                raise
+            finally:
+                registry.observe("cah_db_seconds", label, time.perf_counter() - start)
+                registry.inc("cah_db_calls_total", label)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    # Statistical profiler driven by SIGPROF, which fires every `interval`
+    # seconds of CPU time. The handler runs on the main thread and sees the
+    # frame that was executing, whichever green thread it belongs to, so an
+    # idle worker takes no samples. Output is folded stacks (one
+    # "frame;frame;frame count" line each), ready for flamegraph tools.
+
+    MAX_DEPTH = 64
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.running = False
+        self.started_at = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None and len(stack) < self.MAX_DEPTH:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        if self.running:
+            return
+        self.samples.clear()
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+        self.started_at = time.time()
+
+    def stop(self):
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        self.running = False
+
+    def report(self, limit=200):
+        total = sum(self.samples.values())
+        lines = [f"# {total} samples every {self.interval}s of CPU, running={self.running}"]
+        for stack, count in self.samples.most_common(limit):
+            lines.append(f"{stack} {count}")
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,193 @@
+from array import array
+
+from cards import get_catalog
+from deck import Deck
+
+# Layout version of stored rooms (database rows, snapshots and Redis).
+# Rows without a "schema" key are version 1: the free-form dicts written
+# before GameRoom. Older rows are brought up to date by UPGRADES when read.
+SCHEMA_VERSION = 3
+
+# Hand size of rooms stored before it could be chosen
+LEGACY_HAND_SIZE = 5
+
+
+class GameRoom:
+    # Everything about one game. Per-player state is kept in maps keyed by
+    # player name, the same key every event payload and delta uses: scores
+    # of seated players (players) and of players who left
+    # (disconnected_players), hands and submissions as arrays of white card
+    # IDs. The black card text is looked up from the catalog, not stored.
+
+    __slots__ = (
+        "state",                 # "waiting" or "in_progress"
+        "phase",                 # "submitting" or "judging" while a round runs
+        "round",
+        "max_rounds",
+        "score_limit",
+        "round_time_limit",
+        "round_timer",           # wall-clock deadline of the current phase
+        "min_players",
+        "hand_size",
+        "ai_czar",               # judged by the AI czar instead of a player
+        "packs",                 # sorted pack indexes, or None for every pack
+        "black_card_id",
+        "card_czar",
+        "game_winner",
+        "players",               # name -> score
+        "disconnected_players",  # name -> score
+        "ready_players",         # [name]
+        "spectators",            # [name]
+        "player_hands",          # name -> array('I') of white card IDs
+        "submissions",           # name -> array('I'), or a card text in old rooms
+        "white_deck",
+        "black_deck",
+        "event_seq",             # room version: events applied so far
+        "snapshot_seq",          # event_seq of the last stored snapshot
+    )
+
+    def __init__(self, white_deck, black_deck, packs=None, hand_size=LEGACY_HAND_SIZE):
+        self.state = "waiting"
+        self.phase = None
+        self.round = 1
+        self.max_rounds = 10
+        self.score_limit = 8
+        self.round_time_limit = 120
+        self.round_timer = None
+        self.min_players = 3
+        self.hand_size = hand_size
+        self.ai_czar = False
+        self.packs = packs
+        self.black_card_id = None
+        self.card_czar = None
+        self.game_winner = None
+        self.players = {}
+        self.disconnected_players = {}
+        self.ready_players = []
+        self.spectators = []
+        self.player_hands = {}
+        self.submissions = {}
+        self.white_deck = white_deck
+        self.black_deck = black_deck
+        self.event_seq = 0
+        self.snapshot_seq = None
+
+    @property
+    def black_card(self):
+        if self.black_card_id is None:
+            return None
+        return get_catalog().black(self.black_card_id)
+
+    def to_storage(self):
+        return {
+            "schema": SCHEMA_VERSION,
+            "state": self.state,
+            "phase": self.phase,
+            "round": self.round,
+            "max_rounds": self.max_rounds,
+            "score_limit": self.score_limit,
+            "round_time_limit": self.round_time_limit,
+            "round_timer": self.round_timer,
+            "min_players": self.min_players,
+            "hand_size": self.hand_size,
+            "ai_czar": self.ai_czar,
+            "packs": self.packs,
+            "black_card_id": self.black_card_id,
+            # Not read back; kept for the games.black_card column
+            "black_card": self.black_card,
+            "card_czar": self.card_czar,
+            "game_winner": self.game_winner,
+            "players": self.players,
+            "disconnected_players": self.disconnected_players,
+            "ready_players": self.ready_players,
+            "spectators": self.spectators,
+            "player_hands": {name: hand.tolist() for name, hand in self.player_hands.items()},
+            "submissions": {
+                name: cards if isinstance(cards, str) else cards.tolist()
+                for name, cards in self.submissions.items()
+            },
+            "white_deck": self.white_deck.to_dict(),
+            "black_deck": self.black_deck.to_dict(),
+            "event_seq": self.event_seq,
+            "snapshot_seq": self.snapshot_seq,
+        }
+
+    @classmethod
+    def from_storage(cls, data):
+        schema = data.get("schema", 1)
+        if schema > SCHEMA_VERSION:
+            raise ValueError(f"Room schema {schema} is newer than this server ({SCHEMA_VERSION})")
+        for upgrade in UPGRADES[schema - 1:]:
+            data = upgrade(data)
+
+        catalog = get_catalog()
+        packs = data["packs"]
+        room = cls(
+            Deck.from_dict(data["white_deck"], catalog.white_source(packs)),
+            Deck.from_dict(data["black_deck"], catalog.black_source(packs)),
+            packs,
+            data["hand_size"],
+        )
+        for field in ("state", "phase", "round", "max_rounds", "score_limit", "round_time_limit",
+                      "round_timer", "min_players", "ai_czar", "black_card_id", "card_czar", "game_winner",
+                      "players", "disconnected_players", "ready_players", "spectators",
+                      "event_seq", "snapshot_seq"):
+            setattr(room, field, data[field])
+        room.player_hands = {name: array('I', hand) for name, hand in data["player_hands"].items()}
+        room.submissions = {
+            name: cards if isinstance(cards, str) else array('I', cards)
+            for name, cards in data["submissions"].items()
+        }
+        return room
+
+
+def _fresh_deck(source):
+    return Deck(source).to_dict()
+
+
+# Version 1 rooms: optional keys added over time, sets stored as lists,
+# and - before decks - a used_cards list of dealt card texts
+def _upgrade_v1(data):
+    catalog = get_catalog()
+    packs = data.get("packs")
+    upgraded = {
+        "state": data.get("state", "waiting"),
+        "phase": data.get("phase"),
+        "round": data.get("round", 1),
+        "max_rounds": data.get("max_rounds", 10),
+        "score_limit": data.get("score_limit", 8),
+        "round_time_limit": data.get("round_time_limit", 120),
+        # Old rooms could hold a timer object here rather than a deadline
+        "round_timer": data["round_timer"] if isinstance(data.get("round_timer"), (int, float)) else None,
+        "min_players": data.get("min_players", 3),
+        "hand_size": data.get("hand_size", LEGACY_HAND_SIZE),
+        "packs": packs,
+        # Rooms from before card IDs only have the text; the next round
+        # draws a new black card
+        "black_card_id": data.get("black_card_id"),
+        "card_czar": data.get("card_czar"),
+        "game_winner": data.get("game_winner"),
+        "players": dict(data.get("players", {})),
+        "disconnected_players": dict(data.get("disconnected_players", {})),
+        "ready_players": list(data.get("ready_players", [])),
+        "spectators": list(data.get("spectators", [])),
+        "player_hands": dict(data.get("player_hands", {})),
+        "submissions": dict(data.get("submissions", {})),
+        "white_deck": data.get("white_deck") or _fresh_deck(catalog.white_source(packs)),
+        "black_deck": data.get("black_deck") or _fresh_deck(catalog.black_source(packs)),
+        "event_seq": data.get("event_seq", 0),
+        "snapshot_seq": data.get("snapshot_seq"),
+    }
+    # Hands dealt from used_cards were card texts; deal new ones
+    if "used_cards" in data:
+        upgraded["player_hands"] = {}
+    return upgraded
+
+
+# Version 2 rooms were all judged by players
+def _upgrade_v2(data):
+    return dict(data, ai_czar=False)
+
+
+# UPGRADES[n - 1] turns a version n row into version n + 1
+UPGRADES = (_upgrade_v1, _upgrade_v2)
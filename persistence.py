@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import database
+from database import save_games, save_event_batch
+from game import apply_event
+from model import GameRoom
+
+# Seconds between background flushes of dirty rooms
+FLUSH_INTERVAL = float(os.getenv('CAH_FLUSH_INTERVAL', '2.0'))
+
+# "snapshot" rewrites the full game row on every flush; "events" appends
+# each change to game_events and only writes a full snapshot every
+# CAH_SNAPSHOT_EVERY events
+PERSISTENCE_MODE = os.getenv('CAH_PERSISTENCE_MODE', 'snapshot')
+SNAPSHOT_EVERY = int(os.getenv('CAH_SNAPSHOT_EVERY', '50'))
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindStore:
+    # Rooms are marked dirty from the socket handlers and written out in a
+    # single transaction by a background task. Marking the same room dirty
+    # several times between flushes costs one write.
+
+    def __init__(self, interval=FLUSH_INTERVAL, writer=save_games, mode=PERSISTENCE_MODE,
+                 snapshot_every=SNAPSHOT_EVERY, event_writer=save_event_batch):
+        self.interval = interval
+        self.writer = writer
+        self.mode = mode
+        self.snapshot_every = snapshot_every
+        self.event_writer = event_writer
+        self.dirty = {}  # game_id -> [game_data, first marked dirty at]
+        self.pending_events = []
+        self.snapshot_due = set()
+        self.events_written = 0
+        self.snapshots_written = 0
+        self.running = False
+        self.flushes = 0
+        self.flush_errors = 0
+        self.games_written = 0
+        self.marks = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_duration = 0.0
+        self.last_flush_at = None
+
+    def mark_dirty(self, game_id, game_data):
+        self.marks += 1
+        entry = self.dirty.get(game_id)
+        if entry is None:
+            self.dirty[game_id] = [game_data, time.monotonic()]
+        else:
+            entry[0] = game_data
+
+    # A new room is always written out in full
+    def created(self, game_id, game_data):
+        if self.mode == 'events':
+            self.snapshot_due.add(game_id)
+        self.mark_dirty(game_id, game_data)
+
+    # Record an event that has already been applied to game_data
+    def record(self, game_id, game_data, event_type, payload):
+        if self.mode == 'events':
+            seq = game_data.event_seq
+            self.pending_events.append(
+                (game_id, seq, event_type, json.dumps(payload), datetime.now().isoformat())
+            )
+            last_snapshot = game_data.snapshot_seq
+            if last_snapshot is None or seq - last_snapshot >= self.snapshot_every or event_type == "game_over":
+                self.snapshot_due.add(game_id)
+        self.mark_dirty(game_id, game_data)
+
+    def discard(self, game_id):
+        self.dirty.pop(game_id, None)
+
+    def flush(self, game_ids=None):
+        if game_ids is None:
+            batch, self.dirty = self.dirty, {}
+        else:
+            batch = {game_id: self.dirty.pop(game_id) for game_id in game_ids if game_id in self.dirty}
+        if not batch:
+            return 0
+
+        started = time.monotonic()
+        try:
+            if self.mode == 'events':
+                self._write_events(batch)
+            else:
+                self.writer([(game_id, entry[0]) for game_id, entry in batch.items()])
+        except Exception as e:
+            # Put the batch back so the next flush retries it, keeping
+            # anything that was marked dirty again in the meantime
+            self.flush_errors += 1
+            for game_id, entry in batch.items():
+                newer = self.dirty.get(game_id)
+                if newer is not None:
+                    entry[0] = newer[0]
+                self.dirty[game_id] = entry
+            log.error("Error flushing %d games: %s", len(batch), e)
+            return 0
+
+        finished = time.monotonic()
+        self.flushes += 1
+        self.games_written += len(batch)
+        self.last_flush_lag = finished - min(entry[1] for entry in batch.values())
+        self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+        self.last_flush_duration = finished - started
+        self.last_flush_at = time.time()
+        return len(batch)
+
+    def _write_events(self, batch):
+        events = [event for event in self.pending_events if event[0] in batch]
+        snapshots = []
+        touched = []
+        for game_id, entry in batch.items():
+            if game_id in self.snapshot_due:
+                entry[0].snapshot_seq = entry[0].event_seq
+                snapshots.append((game_id, entry[0]))
+            else:
+                touched.append((game_id, entry[0]))
+
+        self.event_writer(events, snapshots, touched)
+
+        self.pending_events = [event for event in self.pending_events if event[0] not in batch]
+        self.snapshot_due.difference_update(game_id for game_id, _ in snapshots)
+        self.events_written += len(events)
+        self.snapshots_written += len(snapshots)
+
+    # Rebuild a room from its latest snapshot plus the events after it
+    def load_game(self, game_id):
+        snapshot = database.load_snapshot(game_id)
+        if snapshot is None:
+            game_data = database.load_game(game_id)
+            return None if game_data is None else GameRoom.from_storage(game_data)
+        seq, game_data = snapshot
+        game_data = GameRoom.from_storage(game_data)
+        for seq, event_type, payload in database.load_events(game_id, seq):
+            apply_event(game_data, event_type, payload)
+        return game_data
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.interval)
+            self.flush()
+
+    def stop(self):
+        self.running = False
+        self.flush()
+
+    def metrics(self):
+        return {
+            "pending": len(self.dirty),
+            "marks": self.marks,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "games_written": self.games_written,
+            "mode": self.mode,
+            "pending_events": len(self.pending_events),
+            "events_written": self.events_written,
+            "snapshots_written": self.snapshots_written,
+            "last_flush_lag": round(self.last_flush_lag, 4),
+            "max_flush_lag": round(self.max_flush_lag, 4),
+            "last_flush_duration": round(self.last_flush_duration, 4),
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+# Replay a game from its first snapshot, yielding the state after each event
+def replay_game(game_id):
+    snapshot = database.load_snapshot(game_id, latest=False)
+    if snapshot is None:
+        return
+    seq, game_data = snapshot
+    game_data = GameRoom.from_storage(game_data)
+    for seq, event_type, payload in database.load_events(game_id, seq):
+        apply_event(game_data, event_type, payload)
+        yield seq, event_type, payload, game_data
+
+
+if __name__ == "__main__":
+    # python persistence.py replay <game_id>
+    if len(sys.argv) != 3 or sys.argv[1] != "replay":
+        sys.exit("usage: python persistence.py replay <game_id>")
+    for seq, event_type, payload, game_data in replay_game(sys.argv[2]):
+        print(seq, event_type, json.dumps(payload), "round", game_data.round, "scores", game_data.players)
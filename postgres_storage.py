@@ -0,0 +1,323 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2 import extensions, pool
+from psycopg2.extras import Json, execute_values
+
+from database import (_player_rows, _leaderboard_sql, _card_stats_sql, _player_stat,
+                      _card_stat, _pack_stat, PACK_STATS_SQL, STATS_INDEXES)
+
+# Connections kept open per process
+POOL_MIN = int(os.getenv('CAH_DB_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('CAH_DB_POOL_MAX', '10'))
+
+
+def _eventlet_wait(conn, timeout=None):
+    # Yield to other green threads while a query runs instead of blocking
+    # the whole worker on the socket
+    from eventlet.hubs import trampoline
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+
+def _use_green_wait():
+    try:
+        import eventlet.patcher
+    except ImportError:
+        return
+    if eventlet.patcher.is_monkey_patched('socket'):
+        extensions.set_wait_callback(_eventlet_wait)
+
+
+class PostgresStorage:
+    # Same interface as database.SQLiteStorage. Game state and events are
+    # JSONB, writes are ON CONFLICT upserts, and connections come from a
+    # pool so the flush task and request handlers do not queue behind one
+    # connection. The pool raises instead of waiting when it is empty, so a
+    # semaphore holds back callers beyond maxconn until a connection is free.
+
+    def __init__(self, dsn, minconn=POOL_MIN, maxconn=POOL_MAX):
+        _use_green_wait()
+        self.pool = pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self.slots = threading.BoundedSemaphore(maxconn)
+
+    @contextmanager
+    def cursor(self):
+        with self.slots:
+            conn = self.pool.getconn()
+            try:
+                with conn.cursor() as c:
+                    yield c
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self.pool.putconn(conn)
+
+    def close(self):
+        self.pool.closeall()
+
+    def init_db(self):
+        with self.cursor() as c:
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS games (
+                    game_id TEXT PRIMARY KEY,
+                    state TEXT,
+                    round INTEGER,
+                    black_card TEXT,
+                    card_czar TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    game_data JSONB
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS players (
+                    game_id TEXT,
+                    player_name TEXT,
+                    score INTEGER,
+                    is_ready BOOLEAN,
+                    created_at TIMESTAMPTZ,
+                    PRIMARY KEY (game_id, player_name)
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS game_events (
+                    game_id TEXT,
+                    seq INTEGER,
+                    event_type TEXT,
+                    payload JSONB,
+                    created_at TIMESTAMPTZ,
+                    PRIMARY KEY (game_id, seq)
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS game_snapshots (
+                    game_id TEXT,
+                    seq INTEGER,
+                    game_data JSONB,
+                    created_at TIMESTAMPTZ,
+                    PRIMARY KEY (game_id, seq)
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    id BIGSERIAL PRIMARY KEY,
+                    game_id TEXT,
+                    player TEXT,
+                    message TEXT,
+                    created_at TIMESTAMPTZ
+                )
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_game ON chat_messages (game_id, id)')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS player_stats (
+                    player_name TEXT PRIMARY KEY,
+                    games_played INTEGER NOT NULL DEFAULT 0,
+                    games_won INTEGER NOT NULL DEFAULT 0,
+                    rounds_won INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS card_stats (
+                    card_id INTEGER PRIMARY KEY,
+                    pack INTEGER,
+                    times_played INTEGER NOT NULL DEFAULT 0,
+                    times_won INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            for index in STATS_INDEXES:
+                c.execute(index)
+            c.execute('CREATE INDEX IF NOT EXISTS idx_games_updated_at ON games (updated_at)')
+
+    def _write_games(self, c, games, now):
+        rows = []
+        players = []
+        for game_id, game_data in games:
+            game_data_copy = game_data.to_storage()
+            black_card = game_data_copy['black_card']
+            rows.append((
+                game_id,
+                game_data_copy['state'],
+                game_data_copy['round'],
+                None if black_card is None else str(black_card),
+                game_data_copy['card_czar'],
+                Json(game_data_copy),
+                now,
+                now,
+            ))
+            players.extend(_player_rows(game_id, game_data_copy, now))
+        # Several workers may flush the same room through the Redis room
+        # store; an older copy never replaces a newer one
+        written = {game_id for game_id, in execute_values(c, '''
+            INSERT INTO games (game_id, state, round, black_card, card_czar, game_data, updated_at, created_at)
+            VALUES %s
+            ON CONFLICT (game_id) DO UPDATE SET
+                state = EXCLUDED.state, round = EXCLUDED.round, black_card = EXCLUDED.black_card,
+                card_czar = EXCLUDED.card_czar, game_data = EXCLUDED.game_data, updated_at = EXCLUDED.updated_at
+            WHERE coalesce((EXCLUDED.game_data->>'event_seq')::integer, 0)
+                >= coalesce((games.game_data->>'event_seq')::integer, 0)
+            RETURNING game_id
+        ''', rows, fetch=True)}
+        players = [row for row in players if row[0] in written]
+        if players:
+            execute_values(c, '''
+                INSERT INTO players (game_id, player_name, score, is_ready, created_at)
+                VALUES %s
+                ON CONFLICT (game_id, player_name) DO UPDATE SET
+                    score = EXCLUDED.score, is_ready = EXCLUDED.is_ready
+            ''', players)
+        return rows
+
+    def save_games(self, games):
+        if not games:
+            return
+        with self.cursor() as c:
+            self._write_games(c, games, datetime.now())
+
+    def save_event_batch(self, events, snapshots=(), touched=()):
+        now = datetime.now()
+        with self.cursor() as c:
+            if events:
+                execute_values(c, '''
+                    INSERT INTO game_events (game_id, seq, event_type, payload, created_at)
+                    VALUES %s
+                    ON CONFLICT (game_id, seq) DO UPDATE SET
+                        event_type = EXCLUDED.event_type, payload = EXCLUDED.payload
+                ''', events, template='(%s, %s, %s, %s::jsonb, %s)')
+
+            if snapshots:
+                rows = self._write_games(c, snapshots, now)
+                execute_values(c, '''
+                    INSERT INTO game_snapshots (game_id, seq, game_data, created_at)
+                    VALUES %s
+                    ON CONFLICT (game_id, seq) DO UPDATE SET game_data = EXCLUDED.game_data
+                ''', [
+                    (game_id, game_data.event_seq, row[5], now)
+                    for (game_id, game_data), row in zip(snapshots, rows)
+                ])
+                # Keep the first snapshot (for replays) and the latest one
+                execute_values(c, '''
+                    DELETE FROM game_snapshots s USING (VALUES %s) AS latest (game_id, seq)
+                    WHERE s.game_id = latest.game_id AND s.seq < latest.seq
+                    AND s.seq > (SELECT MIN(seq) FROM game_snapshots WHERE game_id = s.game_id)
+                ''', [(game_id, game_data.event_seq) for game_id, game_data in snapshots])
+
+            if touched:
+                execute_values(c, '''
+                    UPDATE games SET state = t.state, round = t.round, updated_at = t.updated_at
+                    FROM (VALUES %s) AS t (game_id, state, round, updated_at)
+                    WHERE games.game_id = t.game_id
+                ''', [
+                    (game_id, game_data.state, game_data.round, now)
+                    for game_id, game_data in touched
+                ], template='(%s, %s, %s::integer, %s::timestamptz)')
+
+    def save_chat_messages(self, rows):
+        if not rows:
+            return
+        with self.cursor() as c:
+            execute_values(c, '''
+                INSERT INTO chat_messages (game_id, player, message, created_at) VALUES %s
+            ''', rows)
+
+    def load_chat_messages(self, game_id, limit):
+        with self.cursor() as c:
+            c.execute('''
+                SELECT player, message FROM chat_messages
+                WHERE game_id = %s ORDER BY id DESC LIMIT %s
+            ''', (game_id, limit))
+            rows = c.fetchall()
+        return [{"player": player, "message": message} for player, message in reversed(rows)]
+
+    def save_stats(self, player_rows, card_rows):
+        now = datetime.now()
+        with self.cursor() as c:
+            if player_rows:
+                execute_values(c, '''
+                    INSERT INTO player_stats AS p (player_name, games_played, games_won, rounds_won, updated_at)
+                    VALUES %s
+                    ON CONFLICT (player_name) DO UPDATE SET
+                        games_played = p.games_played + EXCLUDED.games_played,
+                        games_won = p.games_won + EXCLUDED.games_won,
+                        rounds_won = p.rounds_won + EXCLUDED.rounds_won,
+                        updated_at = EXCLUDED.updated_at
+                ''', [row + (now,) for row in player_rows])
+            if card_rows:
+                execute_values(c, '''
+                    INSERT INTO card_stats AS s (card_id, pack, times_played, times_won)
+                    VALUES %s
+                    ON CONFLICT (card_id) DO UPDATE SET
+                        times_played = s.times_played + EXCLUDED.times_played,
+                        times_won = s.times_won + EXCLUDED.times_won
+                ''', card_rows)
+
+    def _query(self, sql, params):
+        with self.cursor() as c:
+            c.execute(sql, params)
+            return c.fetchall()
+
+    def load_leaderboard(self, order, limit, offset=0):
+        return [_player_stat(row) for row in self._query(_leaderboard_sql(order, '%s'), (limit, offset))]
+
+    def load_player_stats(self, name):
+        rows = self._query('SELECT player_name, games_played, games_won, rounds_won FROM player_stats WHERE player_name = %s', (name,))
+        return _player_stat(rows[0]) if rows else None
+
+    def load_card_stats(self, order, limit, pack=None, min_played=1):
+        params = (min_played,) + ((pack,) if pack is not None else ()) + (limit,)
+        return [_card_stat(row) for row in self._query(_card_stats_sql(order, pack, '%s'), params)]
+
+    def load_pack_stats(self):
+        return [_pack_stat(row) for row in self._query(PACK_STATS_SQL, ())]
+
+    # JSONB columns come back already decoded
+    def load_snapshot(self, game_id, latest=True):
+        order = 'DESC' if latest else 'ASC'
+        with self.cursor() as c:
+            c.execute(f'SELECT seq, game_data FROM game_snapshots WHERE game_id = %s ORDER BY seq {order} LIMIT 1', (game_id,))
+            result = c.fetchone()
+        if result:
+            return result[0], result[1]
+        return None
+
+    def load_events(self, game_id, after_seq=0):
+        with self.cursor() as c:
+            c.execute('''
+                SELECT seq, event_type, payload FROM game_events
+                WHERE game_id = %s AND seq > %s ORDER BY seq
+            ''', (game_id, after_seq))
+            return c.fetchall()
+
+    def load_game(self, game_id):
+        with self.cursor() as c:
+            c.execute('SELECT game_data FROM games WHERE game_id = %s', (game_id,))
+            result = c.fetchone()
+        if result:
+            return result[0]
+        return None
+
+    def delete_old_games(self, days=7):
+        cutoff = datetime.now() - timedelta(days=days)
+        with self.cursor() as c:
+            c.execute('SELECT game_id FROM games WHERE updated_at < %s', (cutoff,))
+            expired = [row[0] for row in c.fetchall()]
+            if not expired:
+                return 0
+            for table in ('players', 'game_events', 'game_snapshots', 'chat_messages'):
+                c.execute(f'DELETE FROM {table} WHERE game_id = ANY(%s)', (expired,))
+            c.execute('DELETE FROM games WHERE game_id = ANY(%s)', (expired,))
+            return c.rowcount
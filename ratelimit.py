@@ -0,0 +1,184 @@
+import functools
+import os
+import time
+
+from flask import request
+from flask_socketio import emit
+
+from metrics import registry
+
+# Default (tokens per second, burst) for each Socket.IO event. Events not
+# listed are not limited.
+RATE_LIMITS = {
+    "chat_message": (1.0, 5),
+    "status_message": (1.0, 5),
+    "submit_card": (2.0, 5),
+    "judge_round": (2.0, 5),
+    "player_ready": (2.0, 5),
+    "start_round": (1.0, 3),
+    "join_game": (1.0, 5),
+    "join_as_spectator": (1.0, 5),
+    "draw_white_cards": (2.0, 5),
+    "request_resync": (1.0, 5),
+    "subscribe_lobby": (1.0, 5),
+}
+# Address buckets allow this many times the per-socket rate, since players
+# behind one NAT share an address
+IP_FACTOR = float(os.getenv('CAH_RATE_LIMIT_IP_FACTOR', '5'))
+# Packets queued for one socket before chat and status messages to it are dropped
+OUTBOUND_QUEUE_LIMIT = int(os.getenv('CAH_OUTBOUND_QUEUE_LIMIT', '100'))
+DROPPABLE_EVENTS = ("chat_messages", "status_message")
+
+
+# Overrides as "event=rate:burst,event=rate:burst" (rate 0 disables a limit)
+def parse_limits(spec, defaults=RATE_LIMITS):
+    limits = dict(defaults)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        event, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        if float(rate) <= 0:
+            limits.pop(event, None)
+        else:
+            limits[event] = (float(rate), int(float(burst or rate)))
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def full_at(self, rate, burst):
+        return self.updated + (burst - self.tokens) / rate
+
+
+class RateLimiter:
+    # One token bucket per (event, socket) and per (event, address). The
+    # address is resolved once when the socket connects. Buckets that would
+    # have refilled are dropped whenever the table doubles in size.
+
+    def __init__(self, limits=None, ip_factor=IP_FACTOR):
+        self.limits = limits if limits is not None else parse_limits(os.getenv('CAH_RATE_LIMITS', ''))
+        self.ip_factor = ip_factor
+        self.buckets = {}
+        self.addresses = {}  # sid -> address
+        self.prune_at = 1024
+        self.rejected = 0
+
+    def bind(self, sid, address):
+        self.addresses[sid] = address
+
+    def forget(self, sid):
+        self.addresses.pop(sid, None)
+        for event in self.limits:
+            self.buckets.pop((event, sid), None)
+
+    def _take(self, key, rate, burst, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(burst, now)
+        return bucket.take(rate, burst, now)
+
+    def allow(self, event, sid, now=None):
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+        now = time.monotonic() if now is None else now
+        rate, burst = limit
+        if not self._take((event, sid), rate, burst, now):
+            return False
+        address = self.addresses.get(sid)
+        if address is not None and not self._take((event, "ip", address), rate * self.ip_factor,
+                                                  burst * self.ip_factor, now):
+            return False
+        if len(self.buckets) > self.prune_at:
+            self.prune(now)
+        return True
+
+    def prune(self, now):
+        for key, bucket in list(self.buckets.items()):
+            rate, burst = self.limits[key[0]]
+            if len(key) == 3:
+                rate, burst = rate * self.ip_factor, burst * self.ip_factor
+            if bucket.full_at(rate, burst) <= now:
+                del self.buckets[key]
+        self.prune_at = max(1024, len(self.buckets) * 2)
+
+    # Decorator for Socket.IO handlers: over the limit, the event is dropped
+    # and the sender gets an error instead
+    def limit(self, event):
+        def decorator(handler):
+            if event not in self.limits:
+                return handler
+
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                if not self.allow(event, request.sid):
+                    self.rejected += 1
+                    registry.inc("cah_socket_rate_limited_total", f'event="{event}"')
+                    emit("error", {"message": "Slow down"})
+                    return None
+                return handler(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def metrics(self):
+        return {
+            "buckets": len(self.buckets),
+            "sockets": len(self.addresses),
+            "rejected": self.rejected,
+        }
+
+
+class OutboundLimiter:
+    # Engine.IO queues packets per socket without bound; a client that reads
+    # slowly lets its queue grow for as long as the room keeps talking. Past
+    # `limit` queued packets, chat and status messages to that socket are
+    # dropped. Game deltas are always queued: a client that misses one has
+    # to resync anyway.
+
+    def __init__(self, limit=OUTBOUND_QUEUE_LIMIT, events=DROPPABLE_EVENTS, serializer='json'):
+        self.limit = limit
+        self.dropped = 0
+        if serializer == 'msgpack':
+            import msgpack
+            self.markers = tuple(msgpack.packb(event) for event in events)
+        else:
+            # Encoded event packets start with the packet type and event name
+            self.markers = tuple(f'2["{event}"' for event in events)
+
+    def droppable(self, data):
+        if isinstance(data, str):
+            return data.startswith(self.markers)
+        if isinstance(data, bytes):
+            head = data[:64]
+            return any(marker in head for marker in self.markers)
+        return False
+
+    # Wraps the Engine.IO server's send_packet, the single path every
+    # outgoing packet takes
+    def install(self, eio):
+        send_packet = eio.send_packet
+
+        def limited_send_packet(sid, pkt):
+            socket = eio.sockets.get(sid)
+            if socket is not None and socket.queue.qsize() >= self.limit and self.droppable(pkt.data):
+                self.dropped += 1
+                registry.inc("cah_socket_dropped_total", 'reason="slow_consumer"')
+                return
+            send_packet(sid, pkt)
+
+        eio.send_packet = limited_send_packet
+
+    def metrics(self):
+        return {"limit": self.limit, "dropped": self.dropped}
@@ -0,0 +1,196 @@
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from model import GameRoom
+
+# "local" keeps rooms in this process; "redis" shares them between nodes
+ROOM_STORE = os.getenv('CAH_ROOM_STORE', 'local')
+ROOM_LOCK_TIMEOUT = float(os.getenv('CAH_ROOM_LOCK_TIMEOUT', '5'))
+
+
+class RoomLockTimeout(Exception):
+    pass
+
+
+class LocalRoomStore:
+    # Rooms live in a plain dict owned by this process.
+
+    def __init__(self, loader=None):
+        self.rooms = {}
+        self.loader = loader
+        self.last_access = {}  # game_id -> time.monotonic() of last use
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    def get(self, game_id):
+        room = self.rooms.get(game_id)
+        if room is None and self.loader is not None:
+            room = self.loader(game_id)
+            if room is not None:
+                self.rooms[game_id] = room
+        if room is not None:
+            self.last_access[game_id] = time.monotonic()
+        return room
+
+    def put(self, game_id, game_data):
+        self.rooms[game_id] = game_data
+        self.last_access[game_id] = time.monotonic()
+
+    def delete(self, game_id):
+        self.rooms.pop(game_id, None)
+        self.last_access.pop(game_id, None)
+
+    # Drop a room from memory; it is reloaded through the loader on next use
+    def evict(self, game_id):
+        self.delete(game_id)
+
+    def ids(self):
+        return list(self.rooms)
+
+    def resident_ids(self):
+        return list(self.rooms)
+
+    def resident_rooms(self):
+        return self.rooms.values()
+
+    def resident(self):
+        return len(self.rooms)
+
+    # Handlers mutate the yielded room in place; nothing to write back
+    @contextmanager
+    def transaction(self, game_id):
+        yield self.get(game_id)
+
+
+class RedisRoomStore:
+    # Rooms are stored as JSON in Redis and guarded by a per-room lock, so
+    # several nodes can serve the same room. Each node keeps the last
+    # version it saw; when nobody else has written since, the cached
+    # GameRoom is reused instead of decoded again.
+
+    def __init__(self, client, loader=None, prefix='cah:room:', lock_timeout=ROOM_LOCK_TIMEOUT, sleep=time.sleep):
+        self.client = client
+        self.loader = loader
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.sleep = sleep
+        self.cache = {}  # game_id -> (version, game_data)
+        self.last_access = {}
+
+    def _key(self, game_id, suffix):
+        return f"{self.prefix}{game_id}:{suffix}"
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    def _read(self, game_id):
+        version, data = self.client.mget(self._key(game_id, 'version'), self._key(game_id, 'data'))
+        if data is None:
+            return None
+        version = int(version or 0)
+        cached = self.cache.get(game_id)
+        if cached is not None and cached[0] == version:
+            self.last_access[game_id] = time.monotonic()
+            return cached[1]
+        game_data = GameRoom.from_storage(json.loads(data))
+        self.cache[game_id] = (version, game_data)
+        self.last_access[game_id] = time.monotonic()
+        return game_data
+
+    def _write(self, game_id, game_data):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(game_id, 'data'), json.dumps(game_data.to_storage()))
+        pipe.incr(self._key(game_id, 'version'))
+        version = pipe.execute()[1]
+        self.cache[game_id] = (version, game_data)
+        self.last_access[game_id] = time.monotonic()
+
+    def get(self, game_id):
+        room = self._read(game_id)
+        if room is None and self.loader is not None:
+            room = self.loader(game_id)
+            if room is not None:
+                self.put(game_id, room)
+        return room
+
+    def put(self, game_id, game_data):
+        self._write(game_id, game_data)
+
+    def delete(self, game_id):
+        self.client.delete(self._key(game_id, 'data'), self._key(game_id, 'version'))
+        self.evict(game_id)
+
+    # Only the local cached copy is dropped; the room stays in Redis
+    def evict(self, game_id):
+        self.cache.pop(game_id, None)
+        self.last_access.pop(game_id, None)
+
+    def ids(self):
+        ids = []
+        for key in self.client.scan_iter(match=f"{self.prefix}*:data"):
+            key = key.decode() if isinstance(key, bytes) else key
+            ids.append(key[len(self.prefix):-len(':data')])
+        return ids
+
+    def resident(self):
+        return len(self.cache)
+
+    def resident_ids(self):
+        return list(self.cache)
+
+    def resident_rooms(self):
+        return [game_data for version, game_data in self.cache.values()]
+
+    def _acquire(self, game_id):
+        lock_key = self._key(game_id, 'lock')
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)):
+            if time.monotonic() >= deadline:
+                raise RoomLockTimeout(f"Timed out waiting for room {game_id}")
+            self.sleep(0.005)
+        return lock_key, token
+
+    def _release(self, lock_key, token):
+        # Only delete the lock if it is still ours (it may have expired)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key)
+                current = pipe.get(lock_key)
+                if current is not None and (current.decode() if isinstance(current, bytes) else current) == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+            except Exception:
+                pass
+
+    # Lock the room, hand out the current state and write it back on success
+    @contextmanager
+    def transaction(self, game_id):
+        lock_key, token = self._acquire(game_id)
+        try:
+            room = self.get(game_id)
+            try:
+                yield room
+            except Exception:
+                # The cached copy may be half-updated; re-read it next time
+                self.cache.pop(game_id, None)
+                raise
+            if room is not None:
+                self._write(game_id, room)
+        finally:
+            self._release(lock_key, token)
+
+
+def create_room_store(loader=None):
+    if ROOM_STORE == 'redis':
+        import redis
+        client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+        return RedisRoomStore(client, loader=loader)
+    return LocalRoomStore(loader=loader)
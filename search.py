@@ -0,0 +1,195 @@
+import bisect
+import os
+import re
+from array import array
+from collections import OrderedDict
+
+from cards import get_catalog
+
+# Searches whose full result lists are kept (pages are sliced from them)
+SEARCH_CACHE_SIZE = int(os.getenv('CAH_SEARCH_CACHE_SIZE', '512'))
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# Shortest prefix matched as a prefix; shorter last words must match exactly
+MIN_PREFIX = 2
+
+WORD = re.compile(r"\w+")
+APOSTROPHES = re.compile(r"['’]")
+
+
+# Lower-cased words of a card text or query; "Don't" and "dont" are the same word
+def tokenize(text):
+    return WORD.findall(APOSTROPHES.sub("", text.casefold()))
+
+
+class CardIndex:
+    # Inverted index over every white and black card. Terms are sorted so a
+    # prefix is a bisect away, and the postings of term i are
+    # postings[offsets[i]:offsets[i + 1]]: sorted document numbers in one
+    # flat array. Document d is white card d, or black card d - white_count.
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.white_count = catalog.white_count
+        words = {}
+        for doc, text in enumerate(catalog.white_text):
+            for word in set(tokenize(text)):
+                words.setdefault(word, []).append(doc)
+        for card_id, text in enumerate(catalog.black_text):
+            doc = self.white_count + card_id
+            for word in set(tokenize(text)):
+                words.setdefault(word, []).append(doc)
+
+        self.terms = sorted(words)
+        self.offsets = array('I', [0])
+        self.postings = array('I')
+        for term in self.terms:
+            self.postings.extend(words[term])
+            self.offsets.append(len(self.postings))
+
+    def _postings(self, index):
+        return self.postings[self.offsets[index]:self.offsets[index + 1]]
+
+    def _exact(self, word):
+        index = bisect.bisect_left(self.terms, word)
+        if index < len(self.terms) and self.terms[index] == word:
+            return set(self._postings(index))
+        return set()
+
+    def _prefix(self, prefix):
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\U0010ffff", start)
+        if end - start == 1:
+            return set(self._postings(start))
+        return set(self.postings[self.offsets[start]:self.offsets[end]])
+
+    # Document numbers of the cards holding every word of the query, the
+    # last word as a prefix (so results follow typing), in catalog order
+    def match(self, query):
+        words = tokenize(query)
+        if not words:
+            return []
+        last = words.pop()
+        sets = [self._exact(word) for word in words]
+        sets.append(self._prefix(last) if len(last) >= MIN_PREFIX else self._exact(last))
+        sets.sort(key=len)
+        matches = sets[0]
+        for other in sets[1:]:
+            if not matches:
+                break
+            matches = matches.intersection(other)
+        return sorted(matches)
+
+    # Every card of the packs (all packs when None), in catalog order; what
+    # an empty query matches
+    def browse(self, color=None, packs=None):
+        docs = []
+        if color != "black":
+            docs.extend(self.catalog.white_source(packs))
+        if color != "white":
+            docs.extend(self.white_count + card_id for card_id in self.catalog.black_source(packs))
+        return docs
+
+    # Filters: color ("white" or "black"), packs (pack indexes) and pick
+    # (black cards asking for that many white cards). Without any words the
+    # query browses the cards the filters select.
+    def search(self, query, color=None, packs=None, pick=None):
+        catalog = self.catalog
+        white_count = self.white_count
+        if pick is not None:
+            color = "black"
+        if not tokenize(query):
+            docs = self.browse(color, packs)
+            packs = None
+        elif color == "white":
+            docs = [doc for doc in self.match(query) if doc < white_count]
+        elif color == "black":
+            docs = [doc for doc in self.match(query) if doc >= white_count]
+        else:
+            docs = self.match(query)
+        if packs is not None:
+            packs = set(packs)
+            docs = [
+                doc for doc in docs
+                if (catalog.white_pack[doc] if doc < white_count else catalog.black_pack[doc - white_count]) in packs
+            ]
+        if pick is not None:
+            docs = [doc for doc in docs if catalog.black_pick[doc - white_count] == pick]
+        return docs
+
+    def card(self, doc):
+        catalog = self.catalog
+        if doc < self.white_count:
+            return {"id": doc, "color": "white", "text": catalog.white(doc), "pack": catalog.white_pack[doc]}
+        card_id = doc - self.white_count
+        return {"id": card_id, "color": "black", "text": catalog.black(card_id),
+                "pack": catalog.black_pack[card_id], "pick": catalog.black_pick[card_id]}
+
+    def metrics(self):
+        return {
+            "terms": len(self.terms),
+            "postings": len(self.postings),
+            "postings_bytes": self.postings.itemsize * len(self.postings) + self.offsets.itemsize * len(self.offsets),
+        }
+
+
+class CardSearch:
+    # Paged search over a CardIndex. The full, filtered result list of a
+    # search is kept in an LRU, so paging through it or repeating a popular
+    # search costs a slice. Browsing (no words) is read from the pack ranges
+    # every time instead: its lists can hold the whole catalog.
+
+    def __init__(self, index, size=SEARCH_CACHE_SIZE):
+        self.index = index
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.browses = 0
+
+    def search(self, query, color=None, packs=None, pick=None, offset=0, limit=SEARCH_PAGE_SIZE):
+        key = (" ".join(tokenize(query)), color, tuple(sorted(set(packs))) if packs is not None else None, pick)
+        if not key[0]:
+            docs = self.index.search(query, color, packs, pick)
+            self.browses += 1
+        else:
+            docs = self._cached(key, query, color, packs, pick)
+        limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        return {
+            "total": len(docs),
+            "offset": offset,
+            "limit": limit,
+            "cards": [self.index.card(doc) for doc in docs[offset:offset + limit]],
+        }
+
+    def _cached(self, key, query, color, packs, pick):
+        docs = self.results.get(key)
+        if docs is None:
+            self.misses += 1
+            docs = self.results[key] = array('I', self.index.search(query, color, packs, pick))
+            if len(self.results) > self.size:
+                self.results.popitem(last=False)
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return docs
+
+    def metrics(self):
+        metrics = self.index.metrics()
+        metrics.update({"cached": len(self.results), "hits": self.hits, "misses": self.misses, "browses": self.browses})
+        return metrics
+
+
+_search = None
+
+# Built once per process from the shared catalog
+def get_card_search():
+    global _search
+    if _search is None:
+        _search = CardSearch(CardIndex(get_catalog()))
+    return _search
+
+
+def search_metrics():
+    return get_card_search().metrics() if _search is not None else {"built": False}
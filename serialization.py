@@ -0,0 +1,141 @@
+import json
+import os
+from collections import OrderedDict
+
+from socketio import packet
+
+from metrics import registry, SIZE_BUCKETS, METRICS_ENABLED
+
+# Socket.IO wire format: "json" (the default) or "msgpack", which needs the
+# msgpack package on the server and the msgpack build of the client
+SERIALIZER = os.getenv('CAH_SOCKETIO_SERIALIZER', 'json')
+# Rooms whose encoded full state is kept
+PAYLOAD_CACHE_SIZE = int(os.getenv('CAH_PAYLOAD_CACHE_SIZE', '1024'))
+
+
+class EncodedPayload:
+    # An emit argument that is encoded at most once per wire format and then
+    # spliced into every packet that carries it
+
+    __slots__ = ("data", "json", "msgpack")
+
+    def __init__(self, data):
+        self.data = data
+        self.json = None
+        self.msgpack = None
+
+    def as_json(self):
+        if self.json is None:
+            self.json = json.dumps(self.data, separators=(',', ':'))
+        return self.json
+
+    def as_msgpack(self):
+        if self.msgpack is None:
+            import msgpack
+            self.msgpack = msgpack.packb(self.data)
+        return self.msgpack
+
+    # Message queues between workers pickle emits; send the plain data
+    def __reduce__(self):
+        return (EncodedPayload, (self.data,))
+
+
+def _encoded_args(data):
+    # [event, EncodedPayload, *plain args] or None
+    if isinstance(data, list) and len(data) >= 2 and isinstance(data[1], EncodedPayload):
+        return data
+    return None
+
+
+def _observe(data, size):
+    if METRICS_ENABLED and data:
+        registry.observe("cah_socket_outbound_bytes", f'event="{data[0]}"', size, SIZE_BUCKETS)
+
+
+class CachingPacket(packet.Packet):
+    def encode(self):
+        data = _encoded_args(self.data)
+        if data is None or self.packet_type != packet.EVENT:
+            encoded = super().encode()
+        else:
+            encoded = str(self.packet_type)
+            if self.namespace is not None and self.namespace != '/':
+                encoded += self.namespace + ','
+            if self.id is not None:
+                encoded += str(self.id)
+            parts = [self.json.dumps(data[0]), data[1].as_json()]
+            parts.extend(self.json.dumps(arg, separators=(',', ':')) for arg in data[2:])
+            encoded += '[' + ','.join(parts) + ']'
+        if isinstance(self.data, list) and not isinstance(encoded, list):
+            _observe(self.data, len(encoded))
+        return encoded
+
+
+def _msgpack_packet_class():
+    import msgpack
+    from socketio.msgpack_packet import MsgPackPacket
+
+    class CachingMsgPackPacket(MsgPackPacket):
+        # msgpack is concatenative: the packet map is written key by key
+        # with the cached payload bytes dropped in as the second array item
+        def encode(self):
+            data = _encoded_args(self.data)
+            if data is None:
+                encoded = super().encode()
+            else:
+                fields = self._to_dict()
+                out = bytearray()
+                out += bytes([0x80 | len(fields)])
+                for key, value in fields.items():
+                    out += msgpack.packb(key)
+                    if key != 'data':
+                        out += msgpack.packb(value)
+                        continue
+                    out += bytes([0x90 | len(data)])
+                    out += msgpack.packb(data[0])
+                    out += data[1].as_msgpack()
+                    for arg in data[2:]:
+                        out += msgpack.packb(arg)
+                encoded = bytes(out)
+            if isinstance(self.data, list):
+                _observe(self.data, len(encoded))
+            return encoded
+
+    return CachingMsgPackPacket
+
+
+def create_packet_class(serializer=SERIALIZER):
+    if serializer == 'msgpack':
+        return _msgpack_packet_class()
+    return CachingPacket
+
+
+class PayloadCache:
+    # Encoded full room state per room, valid for one room version; joins
+    # and resync requests at the same version share one encoding
+
+    def __init__(self, size=PAYLOAD_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, game_id, version, build):
+        entry = self.entries.get(game_id)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(game_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        payload = EncodedPayload(build())
+        self.entries[game_id] = (version, payload)
+        self.entries.move_to_end(game_id)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return payload
+
+    def discard(self, game_id):
+        self.entries.pop(game_id, None)
+
+    def metrics(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
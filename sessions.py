@@ -0,0 +1,104 @@
+import os
+import time
+
+# Seconds a disconnected player keeps their seat before being moved to
+# disconnected_players
+RECONNECT_GRACE = float(os.getenv('CAH_RECONNECT_GRACE', '30'))
+
+
+class SessionRegistry:
+    # Maps socket SIDs to (game_id, name) and back, so that disconnects and
+    # "which socket is this player on" are dictionary lookups instead of scans
+    # over every room.
+
+    def __init__(self, grace=RECONNECT_GRACE):
+        self.grace = grace
+        self.by_sid = {}  # sid -> (game_id, name, is_spectator)
+        self.by_player = {}  # (game_id, player_name) -> sid
+        self.room_sids = {}  # game_id -> set of sids
+        self.pending = {}  # (game_id, player_name) -> grace deadline
+        self.pending_rooms = {}  # game_id -> number of players in grace
+
+    def bind(self, sid, game_id, name, spectator=False):
+        # A socket only belongs to one game at a time
+        if sid in self.by_sid:
+            self._forget(sid)
+
+        self.by_sid[sid] = (game_id, name, spectator)
+        self.room_sids.setdefault(game_id, set()).add(sid)
+        if spectator:
+            return False
+
+        key = (game_id, name)
+        old_sid = self.by_player.get(key)
+        if old_sid is not None and old_sid != sid:
+            # Same player on a new socket (e.g. another tab); drop the old one
+            self._forget(old_sid)
+        self.by_player[key] = sid
+        # True when the player came back before their grace window expired
+        if self.pending.pop(key, None) is None:
+            return False
+        self._release_pending(game_id)
+        return True
+
+    def _release_pending(self, game_id):
+        count = self.pending_rooms.get(game_id, 0) - 1
+        if count > 0:
+            self.pending_rooms[game_id] = count
+        else:
+            self.pending_rooms.pop(game_id, None)
+
+    def _forget(self, sid):
+        entry = self.by_sid.pop(sid, None)
+        if entry is None:
+            return None
+        game_id, name, spectator = entry
+        sids = self.room_sids.get(game_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self.room_sids[game_id]
+        if not spectator and self.by_player.get((game_id, name)) == sid:
+            del self.by_player[(game_id, name)]
+        return entry
+
+    # Remove a socket; players get a grace window to reconnect
+    def unbind(self, sid, now=None):
+        entry = self._forget(sid)
+        if entry is not None and not entry[2] and self.grace > 0:
+            now = time.monotonic() if now is None else now
+            key = (entry[0], entry[1])
+            if key not in self.pending:
+                self.pending_rooms[entry[0]] = self.pending_rooms.get(entry[0], 0) + 1
+            self.pending[key] = now + self.grace
+        return entry
+
+    def lookup(self, sid):
+        return self.by_sid.get(sid)
+
+    def sid_for(self, game_id, player_name):
+        return self.by_player.get((game_id, player_name))
+
+    def connected_count(self, game_id):
+        return len(self.room_sids.get(game_id, ()))
+
+    def in_grace(self, game_id, player_name):
+        return (game_id, player_name) in self.pending
+
+    def has_pending(self, game_id):
+        return game_id in self.pending_rooms
+
+    # Called when a grace window runs out; True if the player had not come back
+    def end_grace(self, game_id, player_name):
+        if self.pending.pop((game_id, player_name), None) is None:
+            return False
+        self._release_pending(game_id)
+        return True
+
+    def metrics(self):
+        return {
+            "sockets": len(self.by_sid),
+            "players": len(self.by_player),
+            "rooms": len(self.room_sids),
+            "in_grace": len(self.pending),
+        }
@@ -0,0 +1,121 @@
+import logging
+import os
+
+# Seconds between the state digests sent to a room's spectators
+SPECTATOR_TICK = float(os.getenv('CAH_SPECTATOR_TICK', '1.0'))
+# Spectator sockets per room (per worker); the rest poll the spectate endpoint
+SPECTATOR_LIMIT = int(os.getenv('CAH_SPECTATOR_LIMIT', '200'))
+# Seconds between polls for spectators over the limit
+SPECTATOR_POLL_INTERVAL = int(os.getenv('CAH_SPECTATOR_POLL_INTERVAL', '5'))
+# Latest chat messages carried in each digest
+SPECTATOR_CHAT = 10
+
+log = logging.getLogger(__name__)
+
+
+# Socket.IO room of a game's spectators, apart from its players
+def spectator_room(game_id):
+    return f"{game_id}:spectators"
+
+
+class SpectatorFanout:
+    # Spectators are kept out of the game's own Socket.IO room, so deltas,
+    # chat batches and status messages only go to players. Recording an
+    # event or a chat message marks the room dirty instead, and every
+    # `tick` seconds each dirty room with spectators gets one
+    # "spectator_state" digest, however many events it had. Rooms already
+    # holding `limit` spectators turn new ones away to the polling endpoint.
+    #
+    # build(game_id) returns the digest's emit arguments, or None when the
+    # room is gone.
+
+    def __init__(self, build, tick=SPECTATOR_TICK, limit=SPECTATOR_LIMIT):
+        self.build = build
+        self.tick = tick
+        self.limit = limit
+        self.watchers = {}  # game_id -> set of sids
+        self.by_sid = {}  # sid -> game_id
+        self.dirty = set()
+        self.running = False
+        self.digests = 0
+        self.overflows = 0
+        self.errors = 0
+
+    # True if the socket may watch; False when the room is full
+    def join(self, game_id, sid):
+        self.leave(sid)
+        sids = self.watchers.get(game_id)
+        if sids is not None and len(sids) >= self.limit:
+            self.overflows += 1
+            return False
+        self.watchers.setdefault(game_id, set()).add(sid)
+        self.by_sid[sid] = game_id
+        # The others see the new audience size on the next tick
+        self.dirty.add(game_id)
+        return True
+
+    def leave(self, sid):
+        game_id = self.by_sid.pop(sid, None)
+        if game_id is None:
+            return None
+        sids = self.watchers[game_id]
+        sids.discard(sid)
+        if sids:
+            self.dirty.add(game_id)
+        else:
+            del self.watchers[game_id]
+            self.dirty.discard(game_id)
+        return game_id
+
+    def count(self, game_id):
+        return len(self.watchers.get(game_id, ()))
+
+    # Called for every event and chat message; rooms nobody watches cost a
+    # dictionary lookup
+    def touch(self, game_id):
+        if game_id in self.watchers:
+            self.dirty.add(game_id)
+
+    def flush(self, socketio):
+        dirty, self.dirty = self.dirty, set()
+        sent = 0
+        for game_id in dirty:
+            if game_id not in self.watchers:
+                continue
+            try:
+                digest = self.build(game_id)
+            except Exception as e:
+                self.errors += 1
+                log.error("Error building spectator digest for %s: %s", game_id, e)
+                continue
+            if digest is None:
+                continue
+            socketio.emit("spectator_state", digest, room=spectator_room(game_id))
+            sent += 1
+        self.digests += sent
+        return sent
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.tick)
+            if self.dirty:
+                self.flush(socketio)
+
+    def stop(self):
+        self.running = False
+
+    def metrics(self):
+        return {
+            "rooms": len(self.watchers),
+            "spectators": len(self.by_sid),
+            "dirty": len(self.dirty),
+            "digests": self.digests,
+            "overflows": self.overflows,
+            "errors": self.errors,
+        }
@@ -0,0 +1,580 @@
+// Set on <body> by the game page
+const gameId = document.body.dataset.gameId;
+const socket = io({
+    // Lets the load balancer route every socket of a game to the same node
+    query: { game_id: gameId },
+    transports: ['websocket', 'polling'],
+    reconnection: true,
+    reconnectionDelay: 1000,
+    reconnectionAttempts: 5,
+    reconnectionDelayMax: 5000,
+    timeout: 60000,
+    autoConnect: true,
+    path: '/socket.io'
+});
+let playerName = "";
+let isCardCzar = false;
+let hand = [];            // [{id, text}] - kept between rounds
+let selectedCards = [];   // card IDs in the order they were picked
+let selectedWinner = null;
+let isReady = false;
+let roundTimer = null;
+let watching = false;     // spectating: digests instead of deltas, no controls
+let pollTimer = null;     // set when the room had no spectator slot left
+
+function joinGame() {
+    playerName = document.getElementById("player-name").value;
+    if (!playerName) {
+        alert("Please enter your name!");
+        return;
+    }
+    document.getElementById("setup-area").style.display = "none";
+    document.getElementById("game-area").style.display = "block";
+    socket.emit("join_game", { game_id: gameId, player_name: playerName });
+    socket.emit("draw_white_cards", { 
+        game_id: gameId,
+        player_name: playerName 
+    });
+}
+
+// Watch without playing. Spectators get a digest of the room about once
+// a second, or poll for it when the room has too many spectators.
+function watchGame() {
+    watching = true;
+    document.getElementById("setup-area").style.display = "none";
+    document.getElementById("game-area").style.display = "block";
+    document.getElementById("game-controls").style.display = "none";
+    document.getElementById("quick-chat").style.display = "none";
+    document.querySelector(".chat-input-area").style.display = "none";
+    joinAsSpectator();
+}
+
+function joinAsSpectator() {
+    socket.emit("join_as_spectator", {
+        game_id: gameId,
+        spectator_name: document.getElementById("player-name").value || "Spectator"
+    });
+}
+
+function startRound() {
+    socket.emit("start_round", { game_id: gameId });
+}
+
+function currentPick() {
+    return (room && room.pick) || 1;
+}
+
+// Judging in progress: the card area shows submissions instead of the hand
+function czarView() {
+    return isCardCzar && room && room.state === "in_progress" && room.phase;
+}
+
+function renderHand() {
+    if (czarView()) return;
+    const container = document.getElementById("white-cards");
+    container.innerHTML = hand
+        .map(card => {
+            const order = selectedCards.indexOf(card.id);
+            return `
+                <div class="card white-card ${order >= 0 ? 'selected' : ''}" 
+                     data-card-id="${card.id}"
+                     onclick="selectCard(this)">
+                    ${currentPick() > 1 && order >= 0 ? `<strong>${order + 1}.</strong> ` : ''}${escapeHtml(card.text)}
+                </div>
+            `;
+        }).join("");
+}
+
+function selectCard(cardElement) {
+    if (!cardElement) return;
+    
+    if (czarView()) {
+        selectedWinner = decodeURIComponent(cardElement.dataset.player || '');
+        document.querySelectorAll('.white-card').forEach(c => c.classList.remove('selected'));
+        cardElement.classList.add('selected');
+        document.getElementById("judge-button").style.display = "block";
+        return;
+    }
+
+    // Pick up to as many cards as the black card asks for, in order
+    const cardId = Number(cardElement.dataset.cardId);
+    if (selectedCards.includes(cardId)) {
+        selectedCards = selectedCards.filter(id => id !== cardId);
+    } else {
+        selectedCards.push(cardId);
+        if (selectedCards.length > currentPick()) {
+            selectedCards.shift();
+        }
+    }
+    renderHand();
+    const canSubmit = room && room.phase === "submitting" && !isCardCzar &&
+        !(playerName in room.submissions) && selectedCards.length === currentPick();
+    document.getElementById("submit-button").style.display = canSubmit ? "block" : "none";
+}
+
+function submitCard() {
+    if (selectedCards.length !== currentPick()) return;
+    socket.emit("submit_card", {
+        game_id: gameId,
+        player_name: playerName,
+        white_cards: selectedCards
+    });
+    // The server sends replacements for the played cards
+    hand = hand.filter(card => !selectedCards.includes(card.id));
+    selectedCards = [];
+    renderHand();
+    document.getElementById("submit-button").style.display = "none";
+}
+
+function judgeRound() {
+    if (!selectedWinner) {
+        alert("Please select a card to judge!");
+        return;
+    }
+    socket.emit("judge_round", {
+        game_id: gameId,
+        winner: selectedWinner
+    });
+}
+
+function copyGameId() {
+    navigator.clipboard.writeText(gameId).then(() => {
+        alert('Game ID copied to clipboard!');
+    });
+}
+
+function sendChat() {
+    const input = document.getElementById('chat-input');
+    const message = input.value.trim();
+    if (message && playerName) {
+        socket.emit('chat_message', {
+            game_id: gameId,
+            player: playerName,
+            message: message
+        });
+        input.value = '';
+    }
+}
+
+function toggleReady() {
+    isReady = !isReady;
+    const readyButton = document.getElementById("ready-button");
+    readyButton.textContent = isReady ? "Unready" : "Ready";
+    readyButton.className = `ready-button ${isReady ? 'ready' : ''}`;
+    
+    socket.emit("player_ready", {
+        game_id: gameId,
+        player_name: playerName,
+        is_ready: isReady
+    });
+}
+
+function startTimer(duration) {
+    let timeLeft = duration;
+    const timerBar = document.getElementById('timer-bar');
+    const timeLeftDisplay = document.getElementById('time-left');
+    
+    clearInterval(roundTimer);
+    roundTimer = setInterval(() => {
+        timeLeft--;
+        const percentage = (timeLeft / duration) * 100;
+        timerBar.style.width = percentage + '%';
+        timeLeftDisplay.textContent = timeLeft;
+        
+        if (timeLeft <= 0) {
+            clearInterval(roundTimer);
+            if (isCardCzar) {
+                autoSelectWinner();
+            } else {
+                autoSubmitCard();
+            }
+        }
+    }, 1000);
+}
+
+function autoSubmitCard() {
+    if (room && room.phase === "submitting" && !(playerName in room.submissions) &&
+            hand.length >= currentPick()) {
+        selectedCards = hand.slice(0, currentPick()).map(card => card.id);
+        submitCard();
+    }
+}
+
+function autoSelectWinner() {
+    if (isCardCzar && !selectedWinner) {
+        const submissions = document.querySelectorAll('.white-card');
+        if (submissions.length > 0) {
+            selectCard(submissions[0]);
+            judgeRound();
+        }
+    }
+}
+
+function sendQuickChat(message) {
+    socket.emit('chat_message', {
+        game_id: gameId,
+        player: playerName,
+        message: message
+    });
+}
+
+// Add connection handlers
+socket.on('connect', () => {
+    document.getElementById('connection-status').textContent = 'Connected';
+    document.getElementById('connection-status').className = 'connection-status connected';
+    if (playerName) {
+        socket.emit("join_game", { game_id: gameId, player_name: playerName });
+        socket.emit("draw_white_cards", { game_id: gameId, player_name: playerName });
+    } else if (watching && !pollTimer) {
+        joinAsSpectator();
+    }
+});
+
+socket.on('disconnect', () => {
+    document.getElementById('connection-status').textContent = 'Disconnected';
+    document.getElementById('connection-status').className = 'connection-status disconnected';
+    socket.emit('disconnect', { player_name: playerName });
+});
+
+socket.on('connect_error', (error) => {
+    console.error('Connection error:', error);
+    document.getElementById('connection-status').textContent = 'Connection Error';
+    document.getElementById('connection-status').className = 'connection-status error';
+});
+
+// Add error handling to existing socket events
+socket.on("error", function(error) {
+    console.error('Socket error:', error);
+    alert('An error occurred. Please try refreshing the page.');
+});
+
+// Local copy of the room, kept up to date by room_delta events.
+// room.version is the last event applied; a gap means one was missed
+// and the full state is requested again.
+let room = null;
+
+function showStatus(text) {
+    const status = document.getElementById("game-status");
+    status.textContent = text;
+    status.classList.add('is-active');
+    setTimeout(() => {
+        status.classList.remove('is-active');
+    }, 3000);
+}
+
+function renderPlayers() {
+    const { players, min_players, ready_players } = room;
+    const playersNeeded = min_players - Object.keys(players).length;
+    
+    const scoresList = Object.entries(players)
+        .map(([name, score]) => `
+            <div class="score-entry panel-block ${ready_players.includes(name) ? 'ready-player' : ''}" data-player="${name}">
+                <span class="panel-icon">
+                    <i class="fas fa-user"></i>
+                </span>
+                ${name}: ${score} points
+            </div>
+        `).join("");
+    
+    document.getElementById("scores").innerHTML = `
+        <p class="panel-heading">Scores</p>
+        ${scoresList}
+    `;
+    
+    // Show/hide start button based on player count
+    const canStart = Object.keys(players).length >= min_players;
+    document.getElementById("start-button").disabled = !canStart;
+    
+    if (playersNeeded > 0) {
+        document.getElementById("players-needed").textContent = 
+            `${playersNeeded} more player${playersNeeded > 1 ? 's' : ''} needed to start`;
+    } else {
+        document.getElementById("players-needed").textContent = 'Ready to start!';
+    }
+}
+
+function showRound(timeLeft) {
+    document.getElementById("black-card").innerText = room.black_card +
+        (room.pick > 1 ? ` (pick ${room.pick})` : '');
+    document.getElementById("round-number").textContent = room.round;
+    isCardCzar = room.card_czar === playerName;
+    document.getElementById("czar-info").innerText = 
+        isCardCzar ? "You are the Card Czar!" :
+        room.ai_czar ? "The AI Czar picks the winner" : `Card Czar: ${room.card_czar}`;
+    document.getElementById("start-button").style.display = "none";
+    document.getElementById("ready-button").style.display = "none";
+    startTimer(timeLeft || 120); // The server enforces the same deadline
+    
+    // Players see their hand; the czar waits for submissions
+    selectedCards = [];
+    selectedWinner = null;
+    if (!isCardCzar) {
+        renderHand();
+        document.getElementById("white-cards").style.display = "flex";
+    } else {
+        document.getElementById("white-cards").innerHTML = "";
+        document.getElementById("white-cards").style.display = "none";
+    }
+}
+
+// Round over: everyone gets their hand back on screen
+function endRound() {
+    clearInterval(roundTimer);
+    selectedCards = [];
+    selectedWinner = null;
+    document.getElementById("judge-button").style.display = "none";
+    document.getElementById("submit-button").style.display = "none";
+    document.getElementById("white-cards").style.display = "flex";
+    renderHand();
+}
+
+function submissionCard(player, cards) {
+    const encodedPlayer = encodeURIComponent(player);
+    return `
+        <div class="card white-card"
+             data-player="${encodedPlayer}"
+             onclick="selectCard(this)">
+            ${cards.map(escapeHtml).join(' / ')}
+        </div>
+    `;
+}
+
+function updateJudgeButton() {
+    document.getElementById("judge-button").style.display = 
+        Object.keys(room.submissions).length === Object.keys(room.players).length - 1 ? "block" : "none";
+}
+
+// Display submissions for card czar, in random order
+function renderSubmissions() {
+    const container = document.getElementById("white-cards");
+    const submissionEntries = Object.entries(room.submissions);
+    for (let i = submissionEntries.length - 1; i > 0; i--) {
+        const j = Math.floor(Math.random() * (i + 1));
+        [submissionEntries[i], submissionEntries[j]] = [submissionEntries[j], submissionEntries[i]];
+    }
+    container.style.display = "flex";
+    container.innerHTML = submissionEntries
+        .map(([player, cards]) => submissionCard(player, cards)).join("");
+    updateJudgeButton();
+}
+
+function showGameOver() {
+    const winner = room.game_winner;
+    const victoryScreen = document.getElementById('victory-screen');
+    victoryScreen.innerHTML = `
+        <h2>${winner} Wins!</h2>
+        <div class="final-scores">
+            ${Object.entries(room.players)
+                .sort(([,a], [,b]) => b - a)
+                .map(([name, score]) => `
+                    <div class="score-entry ${name === winner ? 'winner' : ''}">
+                        ${name}: ${score} points
+                    </div>
+                `).join('')}
+        </div>
+        <button onclick="location.reload()">Play Again</button>
+    `;
+    victoryScreen.style.display = 'flex';
+}
+
+function showRoom(timeLeft) {
+    renderPlayers();
+    document.getElementById("round-number").textContent = room.round;
+    if (room.state === "in_progress" && room.phase) {
+        showRound(timeLeft);
+        if (isCardCzar) {
+            renderSubmissions();
+        }
+    }
+    if (room.game_winner) {
+        showGameOver();
+    }
+}
+
+socket.on("room_state", function(state, timeLeft) {
+    room = state;
+    showRoom(timeLeft);
+});
+
+function showAudience(view) {
+    document.getElementById("audience").textContent =
+        `${view.spectators} watching`;
+    document.getElementById('chat-messages').innerHTML = '';
+    appendChat(view.chat);
+}
+
+socket.on("spectator_state", function(state, timeLeft, view) {
+    room = state;
+    showRoom(timeLeft);
+    showAudience(view);
+});
+
+// No spectator slot left: poll the read-only view instead
+socket.on("spectator_overflow", function(data) {
+    function poll() {
+        fetch(data.poll)
+            .then(response => response.json())
+            .then(view => {
+                // Unchanged rooms come back from the HTTP cache; only a new
+                // version is redrawn, so the countdown is not reset
+                if (!room || view.room.version !== room.version) {
+                    room = view.room;
+                    showRoom(view.time_left);
+                }
+                showAudience(view);
+            })
+            .catch(error => console.error('Spectate poll failed:', error));
+    }
+    clearInterval(pollTimer);
+    pollTimer = setInterval(poll, data.interval * 1000);
+    poll();
+});
+
+const deltaHandlers = {
+    player_joined(delta) {
+        room.players[delta.player] = delta.score;
+        room.disconnected = room.disconnected.filter(name => name !== delta.player);
+        renderPlayers();
+    },
+    player_left(delta) {
+        delete room.players[delta.player];
+        room.disconnected.push(delta.player);
+        renderPlayers();
+    },
+    player_ready(delta) {
+        room.ready_players = room.ready_players.filter(name => name !== delta.player);
+        if (delta.is_ready) {
+            room.ready_players.push(delta.player);
+        }
+        renderPlayers();
+        if (room.ready_players.length === Object.keys(room.players).length) {
+            showStatus("All players ready!");
+        }
+    },
+    round_started(delta) {
+        room.state = "in_progress";
+        room.phase = "submitting";
+        room.black_card = delta.black_card;
+        room.pick = delta.pick;
+        room.card_czar = delta.card_czar;
+        room.round = delta.round;
+        room.submissions = {};
+        showRound(delta.time_limit);
+    },
+    judging_started(delta) {
+        // All cards are in; restart the countdown for the czar's pick
+        room.phase = "judging";
+        startTimer(delta.time_limit);
+    },
+    round_skipped(delta) {
+        room.submissions = {};
+        room.phase = null;
+        endRound();
+        showStatus(delta.reason);
+        if (delta.waiting) {
+            room.state = "waiting";
+            room.ready_players = [];
+            renderPlayers();
+            isReady = false;
+            document.getElementById("ready-button").textContent = "Ready";
+            document.getElementById("ready-button").className = "ready-button";
+            document.getElementById("ready-button").style.display = "inline-block";
+            document.getElementById("start-button").style.display = "block";
+        }
+    },
+    card_submitted(delta) {
+        room.submissions[delta.player] = delta.cards;
+        if (isCardCzar) {
+            // Insert the new card at a random position
+            const container = document.getElementById("white-cards");
+            container.style.display = "flex";
+            const template = document.createElement('template');
+            template.innerHTML = submissionCard(delta.player, delta.cards).trim();
+            const cards = container.children;
+            container.insertBefore(template.content.firstChild,
+                cards[Math.floor(Math.random() * (cards.length + 1))] || null);
+            updateJudgeButton();
+        }
+    },
+    round_judged(delta) {
+        room.players[delta.winner] = delta.score;
+        room.round = delta.round;
+        room.submissions = {};
+        room.phase = null;
+        room.game_winner = delta.game_winner;
+
+        const winnerCard = document.querySelector(`.white-card[data-player="${encodeURIComponent(delta.winner)}"]`);
+        if (winnerCard) {
+            winnerCard.classList.add('winner-animation');
+            setTimeout(() => winnerCard.classList.remove('winner-animation'), 3000);
+        }
+        renderPlayers();
+        document.getElementById("round-number").textContent = delta.round;
+        clearInterval(roundTimer);
+
+        if (room.game_winner) {
+            showGameOver();
+            return;
+        }
+        
+        alert(`${delta.winner} wins this round with "${delta.winning_cards.join(' / ')}"! Score: ${delta.score}`);
+        document.getElementById("start-button").style.display = "block";
+        setTimeout(endRound, 3000);
+    },
+    game_over(delta) {
+        room.game_winner = delta.winner;
+        showGameOver();
+    }
+};
+
+socket.on("room_delta", function(delta) {
+    // Nothing to apply to until the full state has arrived
+    if (!room || delta.version <= room.version) return;
+    if (delta.version !== room.version + 1) {
+        room = null;
+        socket.emit("request_resync", { game_id: gameId });
+        return;
+    }
+    room.version = delta.version;
+    const handler = deltaHandlers[delta.op];
+    if (handler) handler(delta);
+});
+
+function appendChat(messages) {
+    const chatMessages = document.getElementById('chat-messages');
+    messages.forEach(data => {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'chat-message';
+        messageDiv.innerHTML = `<strong>${escapeHtml(data.player)}:</strong> ${escapeHtml(data.message)}`;
+        chatMessages.appendChild(messageDiv);
+    });
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Chat arrives in batches, a few times a second at most
+socket.on("chat_messages", appendChat);
+
+// The room's recent messages, sent on every join and reconnect
+socket.on("chat_history", function(messages) {
+    document.getElementById('chat-messages').innerHTML = '';
+    appendChat(messages);
+});
+
+// Add this helper function at the top of the script section
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// The whole hand (replace) or the cards drawn to refill it
+socket.on("white_card_choices", function(data) {
+    hand = data.replace ? data.white_cards : hand.concat(data.white_cards);
+    const inHand = new Set(hand.map(card => card.id));
+    selectedCards = selectedCards.filter(id => inHand.has(id));
+    renderHand();
+});
+
+socket.on("status_message", function(data) {
+    showStatus(data.message);
+});
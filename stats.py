@@ -0,0 +1,147 @@
+import logging
+import os
+import time
+from collections import Counter
+
+from database import save_stats
+
+# Seconds between writes of accumulated stats
+STATS_INTERVAL = float(os.getenv('CAH_STATS_INTERVAL', '10'))
+# Seconds leaderboard and card stats responses are reused
+STATS_CACHE_TTL = float(os.getenv('CAH_STATS_CACHE_TTL', '30'))
+
+log = logging.getLogger(__name__)
+
+
+class StatsRecorder:
+    # Cross-game stats kept as counters per player and per white card.
+    # Rounds and games add to in-memory deltas; a background task adds the
+    # deltas to the player_stats and card_stats tables in one upsert per
+    # table, so reads never scan game_data. Players are counted by name.
+
+    def __init__(self, interval=STATS_INTERVAL, writer=save_stats, pack_of=None):
+        self.interval = interval
+        self.writer = writer
+        self.pack_of = pack_of
+        # name -> Counter(games_played, games_won, rounds_won)
+        self.players = {}
+        # card_id -> Counter(times_played, times_won)
+        self.cards = {}
+        self.running = False
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def _player(self, name):
+        counts = self.players.get(name)
+        if counts is None:
+            counts = self.players[name] = Counter()
+        return counts
+
+    def _card(self, card_id):
+        counts = self.cards.get(card_id)
+        if counts is None:
+            counts = self.cards[card_id] = Counter()
+        return counts
+
+    # Called with the submissions still in the room, before round_judged
+    # is applied
+    def round_judged(self, room, winner):
+        self._player(winner)["rounds_won"] += 1
+        for player, cards in room.submissions.items():
+            if isinstance(cards, str):
+                continue  # logged before card IDs
+            for card_id in cards:
+                counts = self._card(card_id)
+                counts["times_played"] += 1
+                if player == winner:
+                    counts["times_won"] += 1
+
+    def game_over(self, room):
+        for player in room.players:
+            self._player(player)["games_played"] += 1
+        winner = room.game_winner
+        if winner is not None:
+            self._player(winner)["games_won"] += 1
+
+    def flush(self):
+        if not self.players and not self.cards:
+            return 0
+        players, self.players = self.players, {}
+        cards, self.cards = self.cards, {}
+        player_rows = [
+            (name, counts["games_played"], counts["games_won"], counts["rounds_won"])
+            for name, counts in players.items()
+        ]
+        card_rows = [
+            (card_id, self.pack_of(card_id), counts["times_played"], counts["times_won"])
+            for card_id, counts in cards.items()
+        ]
+        try:
+            self.writer(player_rows, card_rows)
+        except Exception as e:
+            # Fold the deltas back in with anything recorded meanwhile
+            self.flush_errors += 1
+            for name, counts in players.items():
+                self._player(name).update(counts)
+            for card_id, counts in cards.items():
+                self._card(card_id).update(counts)
+            log.error("Stats flush failed: %s", e)
+            return 0
+        self.flushes += 1
+        return len(player_rows) + len(card_rows)
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.interval)
+            self.flush()
+
+    def stop(self):
+        self.running = False
+        self.flush()
+
+    def metrics(self):
+        return {
+            "pending_players": len(self.players),
+            "pending_cards": len(self.cards),
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
+
+
+class ResultCache:
+    # Query results reused for `ttl` seconds, keyed by the query arguments.
+    # None (nothing found) is not kept, so a player's stats show up as soon
+    # as their first game is written.
+
+    def __init__(self, ttl=STATS_CACHE_TTL, size=256):
+        self.ttl = ttl
+        self.size = size
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = build()
+        if value is None:
+            return None
+        if len(self.entries) >= self.size:
+            self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+            if len(self.entries) >= self.size:
+                self.entries.clear()
+        self.entries[key] = (now + self.ttl, value)
+        return value
+
+    def metrics(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
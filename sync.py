@@ -0,0 +1,129 @@
+import time
+
+from cards import get_catalog
+
+# Client state sync. The room version is its event sequence number: every
+# event recorded for a room is broadcast as exactly one "room_delta", so a
+# client that sees a gap in versions knows it missed something and asks for
+# a full "room_state" again.
+
+
+# Card texts of a submission (card IDs, or a single text in older rooms)
+def submission_texts(submission):
+    if isinstance(submission, str):
+        return [submission]
+    catalog = get_catalog()
+    return [catalog.white(card_id) for card_id in submission]
+
+
+def current_pick(room):
+    if room.black_card_id is None:
+        return 1
+    return get_catalog().pick(room.black_card_id)
+
+
+# Everything a client needs to draw the room at this version. It only
+# changes with the version, so the encoded result is cached per version;
+# the seconds left on the round clock go alongside it (time_left).
+def full_state(room):
+    return {
+        "version": room.event_seq,
+        "players": room.players,
+        "disconnected": list(room.disconnected_players.keys()),
+        "min_players": room.min_players,
+        "state": room.state,
+        "phase": room.phase,
+        "round": room.round,
+        "black_card": room.black_card,
+        "pick": current_pick(room),
+        "card_czar": room.card_czar,
+        "ai_czar": room.ai_czar,
+        "submissions": {player: submission_texts(cards) for player, cards in room.submissions.items()},
+        "ready_players": list(room.ready_players),
+        "game_winner": room.game_winner,
+    }
+
+
+def time_left(room):
+    deadline = room.round_timer
+    return max(0, int(deadline - time.time())) if deadline else None
+
+
+def _player_joined(room, payload):
+    return {"player": payload["player"], "score": room.players[payload["player"]]}
+
+
+def _player_left(room, payload):
+    return {"player": payload["player"]}
+
+
+def _spectator_joined(room, payload):
+    return {"spectator": payload["spectator"]}
+
+
+def _player_ready(room, payload):
+    return {"player": payload["player"], "is_ready": payload["is_ready"]}
+
+
+def _round_started(room, payload):
+    return {
+        "black_card": room.black_card,
+        "pick": current_pick(room),
+        "card_czar": room.card_czar,
+        "round": room.round,
+        "time_limit": room.round_time_limit,
+    }
+
+
+def _judging_started(room, payload):
+    return {"time_limit": payload.get("time_limit")}
+
+
+def _round_skipped(room, payload):
+    return {"reason": payload.get("reason"), "waiting": payload.get("waiting", False)}
+
+
+# The drawn cards only go to the player who drew them
+def _cards_drawn(room, payload):
+    return {"player": payload["player"]}
+
+
+def _card_submitted(room, payload):
+    return {"player": payload["player"], "cards": submission_texts(room.submissions[payload["player"]])}
+
+
+def _round_judged(room, payload):
+    return {
+        "winner": payload["winner"],
+        "winning_cards": submission_texts(payload.get("winning_cards", payload.get("winning_card"))),
+        "score": room.players[payload["winner"]],
+        "round": room.round,
+        "game_winner": room.game_winner,
+    }
+
+
+def _game_over(room, payload):
+    return {"winner": payload["winner"]}
+
+
+DELTAS = {
+    "player_joined": _player_joined,
+    "player_left": _player_left,
+    "spectator_joined": _spectator_joined,
+    "player_ready": _player_ready,
+    "round_started": _round_started,
+    "judging_started": _judging_started,
+    "round_skipped": _round_skipped,
+    "cards_drawn": _cards_drawn,
+    "card_submitted": _card_submitted,
+    "round_judged": _round_judged,
+    "game_over": _game_over,
+}
+
+
+# The public part of an event that has just been applied to room
+def build_delta(room, event_type, payload):
+    delta = DELTAS[event_type](room, payload)
+    delta["version"] = room.event_seq
+    delta["op"] = event_type
+    return delta
@@ -0,0 +1,67 @@
+import pytest
+
+import cloudflare
+
+
+class Stop(Exception):
+    pass
+
+
+class FakeSocketIO:
+    # Runs the background task inline; sleeping past `passes` sleeps ends it
+    def __init__(self, passes):
+        self.passes = passes
+        self.sleeps = []
+
+    def start_background_task(self, target):
+        with pytest.raises(Stop):
+            target()
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if len(self.sleeps) >= self.passes:
+            raise Stop
+
+
+class FakeApp:
+    def __init__(self):
+        self.config = {"CLOUDFLARE_IPS": ["old"]}
+
+
+def test_refreshes_again_after_each_interval(monkeypatch):
+    fetched = []
+    ages = iter([None, cloudflare.REFRESH_AFTER + 1])
+    monkeypatch.setattr(cloudflare, "cache_age", lambda: next(ages))
+    monkeypatch.setattr(cloudflare, "fetch_cloudflare_ips", lambda: fetched.append(1) or [f"new{len(fetched)}"])
+    app, socketio = FakeApp(), FakeSocketIO(passes=2)
+
+    cloudflare.refresh_cloudflare_ips(app, socketio)
+
+    assert len(fetched) == 2
+    assert app.config["CLOUDFLARE_IPS"] == ["new2"]
+    assert socketio.sleeps == [cloudflare.REFRESH_AFTER, cloudflare.REFRESH_AFTER]
+
+
+def test_fresh_cache_waits_until_it_expires(monkeypatch):
+    ages = iter([cloudflare.REFRESH_AFTER - 60, cloudflare.REFRESH_AFTER])
+    monkeypatch.setattr(cloudflare, "cache_age", lambda: next(ages))
+    monkeypatch.setattr(cloudflare, "fetch_cloudflare_ips", lambda: ["new"])
+    app, socketio = FakeApp(), FakeSocketIO(passes=2)
+
+    cloudflare.refresh_cloudflare_ips(app, socketio)
+
+    assert socketio.sleeps == [60, cloudflare.REFRESH_AFTER]
+    assert app.config["CLOUDFLARE_IPS"] == ["new"]
+
+
+def test_failed_fetch_keeps_ranges_and_retries(monkeypatch):
+    def fail():
+        raise OSError("offline")
+    monkeypatch.setattr(cloudflare, "cache_age", lambda: None)
+    monkeypatch.setattr(cloudflare, "fetch_cloudflare_ips", fail)
+    app, socketio = FakeApp(), FakeSocketIO(passes=2)
+
+    cloudflare.refresh_cloudflare_ips(app, socketio)
+
+    assert socketio.sleeps == [cloudflare.RETRY_AFTER, cloudflare.RETRY_AFTER]
+    assert app.config["CLOUDFLARE_IPS"] == ["old"]
@@ -0,0 +1,79 @@
+import pytest
+
+from cards import get_catalog
+from game import new_game, apply_event, start_error, submission_error, judge_error
+
+
+@pytest.fixture
+def room():
+    room = new_game()
+    for name in ("ann", "bob", "cat"):
+        apply_event(room, "player_joined", {"player": name})
+        apply_event(room, "cards_drawn", {"player": name, "refill": True})
+    apply_event(room, "round_started", {"card_czar": "ann", "deadline": 0.0})
+    return room
+
+
+def hand_cards(room, name):
+    return room.player_hands[name][:get_catalog().pick(room.black_card_id)].tolist()
+
+
+def test_cards_from_the_hand_are_accepted(room):
+    assert submission_error(room, "bob", hand_cards(room, "bob")) is None
+
+
+@pytest.mark.parametrize("convert", [float, bool, str])
+def test_card_ids_must_be_ints(room, convert):
+    cards = [convert(card_id) for card_id in hand_cards(room, "bob")]
+    assert submission_error(room, "bob", cards) == "Those cards are not in your hand"
+    # The hand is untouched and nothing was submitted
+    assert len(room.player_hands["bob"]) == room.hand_size
+    assert "bob" not in room.submissions
+
+
+def test_czar_cannot_play(room):
+    assert submission_error(room, "ann", hand_cards(room, "ann")) == "The card czar does not play cards"
+
+
+def test_room_can_start_after_a_ready_player_leaves():
+    room = new_game()
+    for name in ("ann", "bob", "cat"):
+        apply_event(room, "player_joined", {"player": name})
+        apply_event(room, "player_ready", {"player": name, "is_ready": True})
+    assert start_error(room) is None
+
+    # cat drops and their grace window runs out
+    apply_event(room, "player_left", {"player": "cat"})
+    assert "cat" not in room.ready_players
+    assert start_error(room) == "Need at least 3 players to start"
+
+    apply_event(room, "player_joined", {"player": "dan"})
+    assert start_error(room) == "All players must be ready to start"
+    apply_event(room, "player_ready", {"player": "dan", "is_ready": True})
+    assert start_error(room) is None
+
+
+def test_only_the_czar_judges_and_only_while_judging(room):
+    apply_event(room, "card_submitted", {"player": "bob", "cards": hand_cards(room, "bob")})
+    # cat has not played yet
+    assert judge_error(room, "ann", "bob") == "A winner can only be picked once every card is in"
+
+    apply_event(room, "card_submitted", {"player": "cat", "cards": hand_cards(room, "cat")})
+    apply_event(room, "judging_started", {"deadline": 0.0})
+    assert judge_error(room, "cat", "bob") == "Only the card czar picks the winner"
+    assert judge_error(room, None, "bob") == "Only the card czar picks the winner"
+    assert judge_error(room, "ann", "ann") == "Unknown winner"
+    assert judge_error(room, "ann", "bob") is None
+
+
+def test_rounds_do_not_start_mid_round_or_after_the_game(room):
+    for name in ("ann", "bob", "cat"):
+        apply_event(room, "player_ready", {"player": name, "is_ready": True})
+    assert start_error(room) == "A round is already in progress"
+    apply_event(room, "judging_started", {"deadline": 0.0})
+    assert start_error(room) == "A round is already in progress"
+
+    apply_event(room, "round_skipped", {"reason": "test", "waiting": False})
+    assert start_error(room) is None
+    apply_event(room, "game_over", {"winner": "bob"})
+    assert start_error(room) == "The game is over"
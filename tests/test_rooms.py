@@ -0,0 +1,71 @@
+import threading
+
+import fakeredis
+import pytest
+
+from database import SQLiteStorage
+from game import new_game, apply_event
+from rooms import RedisRoomStore
+
+
+@pytest.fixture
+def workers():
+    # Two room stores on one Redis, as two nodes serving the same room
+    server = fakeredis.FakeServer()
+    return [RedisRoomStore(fakeredis.FakeRedis(server=server)) for _ in range(2)]
+
+
+def join_players(store, game_id, worker, count):
+    for i in range(count):
+        with store.transaction(game_id) as room:
+            apply_event(room, "player_joined", {"player": f"w{worker}-p{i}"})
+            apply_event(room, "player_ready", {"player": f"w{worker}-p{i}", "is_ready": True})
+
+
+def test_two_workers_serve_one_room_consistently(workers):
+    count = 100
+    workers[0].put("ROOM01", new_game())
+    threads = [
+        threading.Thread(target=join_players, args=(store, "ROOM01", worker, count))
+        for worker, store in enumerate(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    room_a = workers[0].get("ROOM01")
+    room_b = workers[1].get("ROOM01")
+    assert len(room_a.players) == len(room_b.players) == 2 * count
+    assert len(room_a.ready_players) == 2 * count
+    assert room_a.event_seq == room_b.event_seq == 4 * count
+    # One write for the new room and one per transaction
+    assert int(workers[0].client.get(workers[0]._key("ROOM01", "version"))) == 2 * count + 1
+
+
+def test_cached_room_is_refreshed_after_another_worker_writes(workers):
+    workers[0].put("ROOM01", new_game())
+    assert workers[1].get("ROOM01").players == {}
+    with workers[0].transaction("ROOM01") as room:
+        apply_event(room, "player_joined", {"player": "alice"})
+    assert workers[1].get("ROOM01").players == {"alice": 0}
+
+
+def test_stale_copy_does_not_overwrite_newer_game(workers, tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "games.db"))
+    storage.init_db()
+    workers[0].put("ROOM01", new_game())
+    stale = workers[0].get("ROOM01")
+    with workers[1].transaction("ROOM01") as room:
+        apply_event(room, "player_joined", {"player": "alice"})
+    newer = workers[1].get("ROOM01")
+
+    # Worker B flushes first; worker A's write-behind queue still holds the
+    # copy from before the join
+    storage.save_games([("ROOM01", newer)])
+    storage.save_games([("ROOM01", stale)])
+
+    saved = storage.load_game("ROOM01")
+    assert saved["event_seq"] == newer.event_seq
+    assert saved["players"] == {"alice": 0}
+    storage.close()
@@ -0,0 +1,40 @@
+import pytest
+
+from cards import get_catalog
+from search import CardIndex, CardSearch
+
+
+@pytest.fixture(scope="module")
+def index():
+    return CardIndex(get_catalog())
+
+
+def test_words_match_and_last_word_is_a_prefix(index):
+    catalog = index.catalog
+    for doc in index.search("the", color="white")[:50]:
+        assert "the" in catalog.white(doc).casefold()
+
+
+def test_empty_query_browses_a_pack(index):
+    catalog = index.catalog
+    start, end = catalog.white_ranges[0]
+    black_start, black_end = catalog.black_ranges[0]
+    docs = index.search("", packs=[0])
+    assert docs == list(range(start, end)) + [index.white_count + card_id for card_id in range(black_start, black_end)]
+
+
+def test_empty_query_browses_by_color_and_pick(index):
+    catalog = index.catalog
+    assert len(index.search("", color="white")) == catalog.white_count
+    docs = index.search("  ", pick=2)
+    assert docs
+    assert all(doc >= index.white_count and catalog.black_pick[doc - index.white_count] == 2 for doc in docs)
+    assert len(docs) == sum(1 for pick in catalog.black_pick if pick == 2)
+
+
+def test_browsing_pages_are_not_cached(index):
+    search = CardSearch(index, size=4)
+    page = search.search("", color="black", offset=5, limit=3)
+    assert page["total"] == index.catalog.black_count
+    assert [card["id"] for card in page["cards"]] == [5, 6, 7]
+    assert search.results == {} and search.browses == 1
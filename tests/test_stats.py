@@ -0,0 +1,24 @@
+from stats import ResultCache
+
+
+def test_results_are_reused_until_they_expire():
+    cache = ResultCache(ttl=60)
+    calls = []
+    build = lambda: calls.append(1) or {"players": []}
+    assert cache.get("leaderboard", build) == {"players": []}
+    assert cache.get("leaderboard", build) == {"players": []}
+    assert len(calls) == 1
+
+    cache.ttl = -1
+    cache.entries.clear()
+    cache.get("leaderboard", build)
+    cache.get("leaderboard", build)
+    assert len(calls) == 3
+
+
+def test_missing_results_are_not_cached():
+    cache = ResultCache(ttl=60)
+    stats = [None, {"player": "ann", "games_played": 1}]
+    assert cache.get(("player", "ann"), lambda: stats.pop(0)) is None
+    # The player's first game has been written since
+    assert cache.get(("player", "ann"), lambda: stats.pop(0)) == {"player": "ann", "games_played": 1}
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from database import SQLiteStorage
+from game import new_game, apply_event
+from model import GameRoom
+
+TABLES = ('games', 'players', 'game_events', 'game_snapshots', 'chat_messages', 'player_stats', 'card_stats')
+
+
+# PostgreSQL runs when CAH_TEST_DATABASE_URL points at a throwaway database;
+# its tables are dropped before each test
+@pytest.fixture(params=["sqlite", "postgres"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "games.db"))
+    else:
+        url = os.getenv('CAH_TEST_DATABASE_URL')
+        if not url:
+            pytest.skip("set CAH_TEST_DATABASE_URL to a throwaway database")
+        from postgres_storage import PostgresStorage
+        storage = PostgresStorage(url, maxconn=2)
+        with storage.cursor() as c:
+            c.execute(f"DROP TABLE IF EXISTS {', '.join(TABLES)}")
+    storage.init_db()
+    yield storage
+    storage.close()
+
+
+def make_game(i):
+    game_data = new_game()
+    for player in ("ann", "bob", "cat"):
+        apply_event(game_data, "player_joined", {"player": player})
+        apply_event(game_data, "player_ready", {"player": player, "is_ready": True})
+    return f"G{i:05d}", game_data
+
+
+def test_games_round_trip(storage):
+    games = [make_game(i) for i in range(20)]
+    storage.save_games(games)
+    for game_id, game_data in games:
+        loaded = storage.load_game(game_id)
+        assert loaded["players"] == game_data.players
+        assert loaded["event_seq"] == game_data.event_seq
+        assert GameRoom.from_storage(loaded).to_storage() == game_data.to_storage()
+    assert storage.load_game("NOPE00") is None
+
+
+def test_saving_again_updates_the_game(storage):
+    game_id, game_data = make_game(0)
+    storage.save_games([(game_id, game_data)])
+    apply_event(game_data, "player_joined", {"player": "dan"})
+    storage.save_games([(game_id, game_data)])
+    assert storage.load_game(game_id)["players"] == game_data.players
+
+
+def test_older_copy_is_not_saved_over_newer(storage):
+    game_id, game_data = make_game(0)
+    stale = GameRoom.from_storage(game_data.to_storage())
+    apply_event(game_data, "player_joined", {"player": "dan"})
+    storage.save_games([(game_id, game_data)])
+    storage.save_games([(game_id, stale)])
+    assert storage.load_game(game_id)["event_seq"] == game_data.event_seq
+
+
+def test_events_and_snapshots(storage):
+    (game_id, game_data), (other_id, other) = make_game(0), make_game(1)
+    storage.save_games([(game_id, game_data), (other_id, other)])
+    events = []
+    for player in ("dan", "eve"):
+        payload = {"player": player}
+        apply_event(game_data, "player_joined", payload)
+        events.append((game_id, game_data.event_seq, "player_joined", json.dumps(payload), datetime.now().isoformat()))
+    storage.save_event_batch(events, snapshots=[(game_id, game_data)], touched=[(other_id, other)])
+
+    seq, snapshot = storage.load_snapshot(game_id)
+    assert seq == game_data.event_seq
+    assert snapshot["players"] == game_data.players
+    assert [event[:2] for event in storage.load_events(game_id, seq - 2)] == [
+        (seq - 1, "player_joined"), (seq, "player_joined")
+    ]
+
+
+def test_chat_history(storage):
+    storage.save_chat_messages([("G00000", "ann", f"hello {i}", datetime.now().isoformat()) for i in range(5)])
+    assert [message["message"] for message in storage.load_chat_messages("G00000", 3)] == ["hello 2", "hello 3", "hello 4"]
+    assert storage.load_chat_messages("G00001", 3) == []
+
+
+def test_stats_are_added_up(storage):
+    storage.save_stats([("ann", 1, 1, 4), ("bob", 1, 0, 1)], [(10, 0, 2, 1), (20, 1, 1, 0)])
+    storage.save_stats([("bob", 1, 1, 2)], [(10, 0, 1, 1)])
+
+    assert storage.load_player_stats("bob") == {"player": "bob", "games_played": 2, "games_won": 1, "rounds_won": 3}
+    assert storage.load_player_stats("nobody") is None
+    assert [row["player"] for row in storage.load_leaderboard("rounds", 10)] == ["ann", "bob"]
+    assert [row["player"] for row in storage.load_leaderboard("wins", 1, offset=1)] == ["bob"]
+
+    cards = storage.load_card_stats("played", 10)
+    assert [(card["card_id"], card["times_played"], card["times_won"]) for card in cards] == [(10, 3, 2), (20, 1, 0)]
+    assert cards[0]["win_rate"] == round(2 / 3, 4)
+    assert [card["card_id"] for card in storage.load_card_stats("played", 10, pack=1)] == [20]
+    assert storage.load_card_stats("played", 10, min_played=2)[0]["card_id"] == 10
+    assert [(pack["pack"], pack["cards"], pack["times_played"]) for pack in storage.load_pack_stats()] == [(0, 1, 3), (1, 1, 1)]
+
+
+def test_old_games_expire(storage):
+    games = [make_game(i) for i in range(3)]
+    storage.save_games(games)
+    storage.save_chat_messages([(games[0][0], "ann", "hi", datetime.now().isoformat())])
+    assert storage.delete_old_games(days=1) == 0
+    assert storage.delete_old_games(days=-1) == 3
+    assert storage.load_game(games[0][0]) is None
+    assert storage.load_chat_messages(games[0][0], 10) == []
+
+
+def test_more_callers_than_connections(storage):
+    # The Postgres pool is 2 connections here; the rest must wait, not fail
+    errors = []
+
+    def load():
+        try:
+            for _ in range(5):
+                storage.load_chat_messages("G00000", 10)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,148 @@
+import logging
+import math
+import os
+import time
+
+# Seconds per wheel tick; deadlines are rounded up to a whole tick
+TIMER_TICK = float(os.getenv('CAH_TIMER_TICK', '0.5'))
+SLOTS = 64
+LEVELS = 4
+
+log = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("key", "expires", "callback", "args", "level", "slot")
+
+    def __init__(self, key, expires, callback, args):
+        self.key = key
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.level = 0
+        self.slot = 0
+
+
+class TimerWheel:
+    # Hierarchical timing wheel. Level 0 has one slot per tick, each higher
+    # level covers SLOTS times the span of the one below. Scheduling and
+    # cancelling are O(1); each tick only touches the current level-0 slot,
+    # plus one higher-level slot every SLOTS ticks when it cascades down.
+    # Timers are keyed, so scheduling an existing key replaces it.
+    #
+    # All deadlines (round phases, reconnect grace) share one background task
+    # instead of one sleeping greenlet per room.
+
+    def __init__(self, tick=TIMER_TICK, slots=SLOTS, levels=LEVELS, clock=time.monotonic):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.timers = {}
+        self.current_tick = 0
+        self.started_at = clock()
+        self.running = False
+        self.fired = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def _place(self, timer):
+        delta = timer.expires - self.current_tick
+        level = 0
+        span = self.slots
+        while delta >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+        slot = (timer.expires // self.slots ** level) % self.slots
+        timer.level = level
+        timer.slot = slot
+        self.wheels[level][slot][timer.key] = timer
+
+    def schedule(self, key, delay, callback, *args):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer(key, self.current_tick + ticks, callback, args)
+        self.timers[key] = timer
+        self._place(timer)
+        return timer
+
+    def cancel(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        self.wheels[timer.level][timer.slot].pop(key, None)
+        return True
+
+    # Seconds until the timer with this key fires, or None
+    def remaining(self, key):
+        timer = self.timers.get(key)
+        if timer is None:
+            return None
+        return max(0.0, (timer.expires - self.current_tick) * self.tick)
+
+    def _advance_one(self):
+        self.current_tick += 1
+        tick = self.current_tick
+
+        # Cascade higher levels whose span starts at this tick, top first
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if tick % span == 0:
+                slot = (tick // span) % self.slots
+                bucket = self.wheels[level][slot]
+                if bucket:
+                    self.wheels[level][slot] = {}
+                    for timer in bucket.values():
+                        self._place(timer)
+
+        slot = tick % self.slots
+        bucket = self.wheels[0][slot]
+        if not bucket:
+            return
+        self.wheels[0][slot] = {}
+        for key, timer in bucket.items():
+            # Skip timers cancelled or replaced by an earlier callback
+            if self.timers.get(key) is not timer:
+                continue
+            del self.timers[key]
+            self.fired += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                self.errors += 1
+                log.error("Error in timer %s: %s", key, e)
+
+    # Run every tick that is due by the clock (catching up after stalls)
+    def advance(self, now=None):
+        now = self.clock() if now is None else now
+        target = int((now - self.started_at) / self.tick)
+        ran = 0
+        while self.current_tick < target:
+            self._advance_one()
+            ran += 1
+        return ran
+
+    def start(self, socketio):
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while self.running:
+            socketio.sleep(self.tick)
+            self.advance()
+
+    def metrics(self):
+        return {
+            "timers": len(self.timers),
+            "fired": self.fired,
+            "errors": self.errors,
+            "tick": self.tick,
+        }